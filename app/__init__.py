@@ -5,11 +5,13 @@ from datetime import datetime
 from logging.handlers import TimedRotatingFileHandler
 from flask import Flask
 # Import custom modules from the local project
+from log_queue import queue_handler
 # Import API resources
 from . import resources
 
 LOG_FILE_BACKUP_COUNT = 1
 LOG_ROTATION = "midnight"
+QUEUE_HANDLER_NAME = "etd_int_tests_queue"
 
 container_id = socket.gethostname()
 timestamp = datetime.today().strftime('%Y-%m-%d')
@@ -35,23 +37,29 @@ def create_app():
 def configure_logger():
     log_level = os.getenv("APP_LOG_LEVEL", "INFO")
     log_file_path = os.getenv("LOG_DIR", "/home/etdadm/logs/etd_itest")
+    logger = logging.getLogger('etd_int_tests')
+    logger.setLevel(log_level)
+    # create_app() may run more than once; set the handlers up once
+    if any(handler.get_name() == QUEUE_HANDLER_NAME
+           for handler in logger.handlers):
+        return
+
     formatter = logging.Formatter(
                 '%(asctime)s - %(name)s - %(levelname)s - ' +
                 '[%(filename)s:%(funcName)s:%(lineno)d] - %(message)s')
 
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-
-    logger = logging.getLogger('etd_int_tests')
-    logger.addHandler(console_handler)
+    handlers = [logging.StreamHandler()]
     # Defaults to console logging
     if os.getenv("CONSOLE_LOGGING_ONLY", "true") == "false":
-        file_handler = TimedRotatingFileHandler(
+        handlers.append(TimedRotatingFileHandler(
             filename=f"{log_file_path}/{container_id}_console_{timestamp}.log",
             when=LOG_ROTATION,
             backupCount=LOG_FILE_BACKUP_COUNT
-        )
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        ))
 
-    logger.setLevel(log_level)
+    # Records are formatted where they are logged and written by one
+    # thread per process, so a slow log volume never blocks a request
+    handler = queue_handler(*handlers)
+    handler.set_name(QUEUE_HANDLER_NAME)
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
@@ -0,0 +1,193 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+from celery import Celery
+
+from app.metrics import observe_call
+
+_app = None
+_publisher = None
+_lock = threading.Lock()
+
+
+def get_celery_app():
+    """
+    Returns the process-wide Celery app used to publish tasks.
+
+    send_task() borrows a connection and producer from the app's pools,
+    so one app can publish from many threads without opening a broker
+    connection per message.
+
+    Returns:
+        Celery: An app configured from celeryconfig.
+    """
+    global _app
+    with _lock:
+        if _app is None:
+            _app = Celery('app')
+            _app.config_from_object('celeryconfig')
+            logging.getLogger('etd_int_tests').debug(
+                f"Created Celery app in process {os.getpid()}")
+        return _app
+
+
+class TaskPublisher():
+    """
+    Publishes tasks through the process-wide Celery app.
+
+    Every publish borrows a producer, and with it a broker connection and
+    channel, from the app's pool (broker_pool_limit,
+    CELERY_BROKER_POOL_LIMIT) instead of connecting per message. With
+    publisher confirms on (CELERY_CONFIRM_PUBLISH, the default) a publish
+    only returns once the broker has confirmed the message, so the time
+    it takes is the confirm latency.
+
+    publish_many() is for callers with several tasks ready at once: it
+    sends them down a single producer, one pool checkout and one channel
+    for all of them. py-amqp waits for each confirm before the next
+    publish, so a batch saves the connection and channel setup, not the
+    confirm round trips. The suites and the load generator publish each
+    task as it is ready, with publish().
+
+    Each publish is counted and timed as a "Celery" call in app.metrics;
+    snapshot() reports the publish rate and recent confirm latencies.
+    """
+
+    def __init__(self, app=None, latency_window=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if latency_window is None:
+            latency_window = int(os.getenv("PUBLISH_LATENCY_WINDOW", 1000))
+        self._app = app
+        self._lock = threading.Lock()
+        # the most recent publish latencies, for snapshot()
+        self._latencies = deque(maxlen=latency_window)
+        self.stats = {"published": 0, "batches": 0, "failed_batches": 0,
+                      "publish_secs": 0.0}
+
+    @property
+    def app(self):
+        return self._app if self._app is not None else get_celery_app()
+
+    def confirms(self):
+        """
+        Whether the broker confirms each publish: confirm_publish is set
+        and the broker is an AMQP one. Other transports, e.g. the
+        memory:// broker of the stand-ins, ignore confirm_publish.
+        """
+        options = self.app.conf.broker_transport_options or {}
+        if not options.get("confirm_publish", False):
+            return False
+        with self.app.connection_for_write() as connection:
+            return connection.transport.driver_type == "amqp"
+
+    def publish(self, name, message, queue):
+        """
+        Publishes one task with message as its only argument.
+
+        Returns:
+            dict: The report of publish_many().
+        """
+        return self.publish_many(name, [message], queue)
+
+    def publish_many(self, name, messages, queue):
+        """
+        Publishes one task per message, all down one pooled producer.
+
+        Args:
+            name (str): The task name, e.g.
+                "etd-dash-service.tasks.send_to_dash".
+            messages (list): The task's argument, one per task.
+            queue (str): The queue to publish to.
+
+        Returns:
+            dict: published, elapsed_secs, rate_per_sec and
+                confirm_latency_secs (p50/p95/max) of the batch.
+
+        Raises:
+            Exception: Whatever the broker connection raised; the tasks
+                before the failed one were published.
+        """
+        latencies = []
+        start = time.monotonic()
+        try:
+            with self.app.producer_or_acquire() as producer:
+                for message in messages:
+                    sent = time.monotonic()
+                    with observe_call("Celery"):
+                        self.app.send_task(name=name, args=[message],
+                                           kwargs={}, queue=queue,
+                                           producer=producer)
+                    latencies.append(time.monotonic() - sent)
+        except Exception as err:
+            self.logger.error(f"Publishing {name} to {queue} failed after "
+                              f"{len(latencies)} of {len(messages)}: {err}")
+            with self._lock:
+                self.stats["failed_batches"] += 1
+            raise
+        finally:
+            with self._lock:
+                self.stats["published"] += len(latencies)
+                self.stats["batches"] += 1
+                self.stats["publish_secs"] += sum(latencies)
+                self._latencies.extend(latencies)
+        elapsed = time.monotonic() - start
+        return {"published": len(latencies),
+                "elapsed_secs": round(elapsed, 4),
+                "rate_per_sec": round(len(latencies) / elapsed, 1)
+                if elapsed > 0 else None,
+                "confirm_latency_secs": _latency_summary(latencies)}
+
+    def snapshot(self):
+        """
+        Returns this process's publish counters, the publish rate (tasks
+        per second spent publishing) and the confirm latencies of the
+        last PUBLISH_LATENCY_WINDOW publishes.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = list(self._latencies)
+        publish_secs = stats.pop("publish_secs")
+        stats["confirm_publish"] = self.confirms()
+        stats["rate_per_sec"] = round(stats["published"] / publish_secs, 1) \
+            if publish_secs > 0 else None
+        stats["confirm_latency_secs"] = _latency_summary(latencies)
+        return stats
+
+
+def _latency_summary(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"p50": None, "p95": None, "max": None}
+
+    def nearest_rank(pct):
+        rank = max(1, math.ceil(pct / 100.0 * len(latencies)))
+        return round(latencies[rank - 1], 4)
+
+    return {"p50": nearest_rank(50), "p95": nearest_rank(95),
+            "max": round(latencies[-1], 4)}
+
+
+def get_publisher():
+    """
+    Returns the process-wide task publisher.
+    """
+    global _publisher
+    with _lock:
+        if _publisher is None:
+            _publisher = TaskPublisher()
+        return _publisher
+
+
+def _reset_after_fork():
+    # Broker connections are not shared across a fork
+    global _app, _publisher, _lock
+    _app = None
+    _publisher = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+
+from app.deadline import DeadlineExceeded
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of calling a dependency whose breaker is open.
+    """
+
+    def __init__(self, name, retry_in_secs):
+        super().__init__(f"{name} circuit is open after repeated failures; "
+                         f"next attempt in {retry_in_secs:.1f}s")
+        self.name = name
+        self.retry_in_secs = retry_in_secs
+
+
+class CircuitBreaker():
+    """
+    Fails calls to a dependency immediately once it has failed
+    failure_threshold times in a row.
+
+    closed: calls go through; consecutive failures are counted.
+    open: calls raise CircuitOpenError without touching the dependency,
+        for reset_secs.
+    half_open: after reset_secs one trial call goes through (the others
+        still fail fast); its success closes the breaker, its failure
+        opens it for another reset_secs.
+
+    Only failures that say the dependency is down count, e.g. connection
+    errors and 5xx responses; a 404 or a missing file is a working
+    service answering. A call given up for want of run budget
+    (DeadlineExceeded) counts as neither: it says nothing about the
+    dependency.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=None, reset_secs=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if failure_threshold is None:
+            failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD",
+                                              5))
+        if reset_secs is None:
+            reset_secs = float(os.getenv("BREAKER_RESET_SECS", 30))
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_secs = reset_secs
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def call(self, function, *args, failure_types=(Exception,),
+             is_failure=None, **kwargs):
+        """
+        Calls function through the breaker.
+
+        Args:
+            function (callable): The call to the dependency.
+            failure_types (tuple): Exceptions that count as the
+                dependency failing. Others, except DeadlineExceeded, are
+                the dependency answering and count as a success.
+            is_failure (callable, optional): Called with the return
+                value; a truthy answer counts as a failure, e.g. a 5xx
+                response. The value is returned either way.
+
+        Returns:
+            The return value of function.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        self.before_call()
+        try:
+            value = function(*args, **kwargs)
+        except DeadlineExceeded:
+            self.record_no_outcome()
+            raise
+        except failure_types:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        if is_failure is not None and is_failure(value):
+            self.record_failure()
+        else:
+            self.record_success()
+        return value
+
+    def before_call(self):
+        """
+        Lets a call through, or raises CircuitOpenError. A caller that
+        gets through must report the outcome with record_success(),
+        record_failure() or record_no_outcome().
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            if self._state == self.OPEN:
+                retry_in = self._opened_at + self.reset_secs - \
+                    time.monotonic()
+                if retry_in > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self._state = self.HALF_OPEN
+                self.logger.info(f"{self.name} circuit half-open, trying "
+                                 "one call")
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, 0)
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                self.logger.info(f"{self.name} circuit closed")
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_no_outcome(self):
+        """
+        Reports a call that ended without a verdict on the dependency.
+        A half-open breaker lets another trial call through.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or \
+                    self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.stats["opened"] += 1
+                    self.logger.warning(
+                        f"{self.name} circuit open after "
+                        f"{self._consecutive_failures} consecutive "
+                        "failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        """
+        Returns the breaker's state and counters.
+        """
+        with self._lock:
+            state = {"state": self._state,
+                     "consecutive_failures": self._consecutive_failures}
+            if self._state == self.OPEN:
+                state["retry_in_secs"] = round(max(
+                    0, self._opened_at + self.reset_secs -
+                    time.monotonic()), 3)
+            state.update(self.stats)
+            return state
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Returns the process's breaker for a dependency, e.g. "DASH", shared
+    by every run in the worker.
+    """
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states():
+    """
+    Returns the state of every breaker this process has used, by name.
+    """
+    with _lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot()
+            for name, breaker in sorted(breakers.items())}
+
+
+def _reset_after_fork():
+    # each worker judges its dependencies for itself
+    global _breakers, _lock
+    _breakers = {}
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
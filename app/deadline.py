@@ -0,0 +1,178 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised by a step that would start after the run's deadline.
+    """
+
+    def __init__(self, step, deadline):
+        super().__init__(f"Run deadline of {deadline.budget_secs}s ran out "
+                         f"in {deadline.exhausted_by or step}; not starting "
+                         f"{step}")
+        self.step = step
+
+
+class Deadline():
+    """
+    The time budget of one suite run.
+
+    A run's deadline is set in a context variable (see run_deadline()),
+    so every wait, HTTP call, SFTP session and Mongo query of the run
+    can cap its own timeout at what is left of the budget with
+    clamp_timeout() instead of each taking its full timeout. Threads
+    started for the run (the suite DAG, probes, the load generator) run
+    in a copy of the caller's context and share the deadline.
+
+    exhausted_by names the first step that ran out of time: a wait that
+    gave up, or a call that failed, with nothing left of the budget, or
+    else the first step refused for want of budget.
+    """
+
+    def __init__(self, budget_secs):
+        self.budget_secs = budget_secs
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget_secs
+        self.exhausted_by = None
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def exhausted(self, step):
+        """
+        Records step as having run out of time, unless another step
+        already has.
+        """
+        with self._lock:
+            if self.exhausted_by is None:
+                self.exhausted_by = step
+                logging.getLogger('etd_int_tests').warning(
+                    f"Run deadline of {self.budget_secs}s ran out in "
+                    f"{step}")
+
+    def check(self, step):
+        """
+        Raises DeadlineExceeded if there is no budget left to start step.
+        """
+        if self.expired():
+            self.exhausted(_within(step))
+            raise DeadlineExceeded(step, self)
+
+    def clamp(self, timeout, step):
+        """
+        Returns timeout capped at the remaining budget (the remaining
+        budget if timeout is None).
+
+        Raises:
+            DeadlineExceeded: If there is no budget left.
+        """
+        self.check(step)
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def as_dict(self):
+        return {"budget_secs": self.budget_secs,
+                "elapsed_secs": round(time.monotonic() - self.started, 3),
+                "remaining_secs": round(self.remaining(), 3),
+                "exhausted_by": self.exhausted_by}
+
+
+_current = contextvars.ContextVar("run_deadline", default=None)
+_step = contextvars.ContextVar("run_step", default=None)
+
+
+def current_deadline():
+    """
+    Returns the deadline of the run in progress, or None.
+    """
+    return _current.get()
+
+
+def default_budget():
+    """
+    RUN_DEADLINE_SECS as a float, or None if it is unset or 0.
+    """
+    budget = float(os.getenv("RUN_DEADLINE_SECS") or 0)
+    return budget if budget > 0 else None
+
+
+@contextmanager
+def run_deadline(budget_secs):
+    """
+    Makes a Deadline of budget_secs the current one for the duration of
+    a with block. With budget_secs None there is no deadline.
+
+    Yields:
+        Deadline: The deadline, or None.
+    """
+    if budget_secs is None:
+        yield None
+        return
+    deadline = Deadline(budget_secs)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def deadline_step(step):
+    """
+    Names the step a with block is part of, e.g. a wait, so that a call
+    inside it that runs out of time is reported as
+    "<step> (<call>)".
+    """
+    token = _step.set(_within(step))
+    try:
+        yield
+    finally:
+        _step.reset(token)
+
+
+def _within(step):
+    outer = _step.get()
+    return step if outer is None or outer == step else f"{outer} ({step})"
+
+
+def clamp_timeout(timeout, step):
+    """
+    Caps timeout at the current run's remaining budget; see
+    Deadline.clamp(). Without a deadline, timeout is returned unchanged.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return timeout
+    return deadline.clamp(timeout, step)
+
+
+def not_run_result(name, deadline):
+    """
+    The result of a suite that was not started for want of budget.
+    """
+    return {"num_failed": 1,
+            "tests_failed": [name],
+            "info": {f"{name} not run":
+                     {"status_code": 504,
+                      "text": "Not run because the run deadline of "
+                      f"{deadline.budget_secs}s ran out in "
+                      f"{deadline.exhausted_by}"}}}
+
+
+def note_failure(step):
+    """
+    Called when step failed or gave up: if the run's budget is gone,
+    step is what used it up.
+    """
+    deadline = _current.get()
+    if deadline is not None and deadline.expired():
+        deadline.exhausted(_within(step))
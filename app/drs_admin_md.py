@@ -0,0 +1,169 @@
+import os
+import json
+import fnmatch
+import logging
+import threading
+import zipfile
+from datetime import datetime
+
+DOCUMENTATION_NAME = "mets.xml"
+LICENSE_PATTERN = "setup_*.pdf"
+
+# object_role -> the role as it appears in OSNs
+OSN_ROLES = {"THESIS": "THESIS",
+             "LICENSE": "LICENSE",
+             "DOCUMENTATION": "DOCUMENTATION",
+             "THESIS_SUPPLEMENT": "SUPPLEMENT"}
+
+# (realpath, st_mtime_ns, st_size) -> layout
+_layouts = {}
+# realpath -> ((st_mtime_ns, st_size), manifest)
+_manifests = {}
+_lock = threading.Lock()
+
+
+class DrsAdminMdBuilder():
+    """
+    Builds the DIMS /ingest payload (DRS admin metadata) for a fixture
+    submission.
+
+    The files and their roles come from the zip's central directory, so
+    nothing is extracted or decompressed: mets.xml is DOCUMENTATION,
+    setup_*.pdf is the LICENSE, the thesis named in the manifest is the
+    THESIS and everything else is a THESIS_SUPPLEMENT, numbered in the
+    order it appears in the zip. The per-fixture values (OSN prefix,
+    ProQuest ID, MMS ID, thesis file) come from DRS_MANIFEST_FILE, keyed
+    by the fixture's file name; the manifest is parsed once per process
+    (see load_manifest()).
+    """
+
+    def __init__(self, manifest_path=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if manifest_path is None:
+            manifest_path = os.getenv("DRS_MANIFEST_FILE",
+                                      "drs_manifest.json")
+        self.manifest = load_manifest(manifest_path)
+
+    def build(self, fixture_path, fs_source_path, timestamp=None):
+        """
+        Builds the payload for a fixture.
+
+        Args:
+            fixture_path (str): The fixture zip. Its layout is cached
+                until the file's mtime or size changes, so pass the
+                original fixture rather than a fresh copy of it.
+            fs_source_path (str): The staged copy DIMS should ingest.
+            timestamp (str, optional): Makes the OSNs and package id
+                unique. Defaults to the current epoch seconds.
+
+        Returns:
+            dict: The payload for DIMS /ingest.
+        """
+        fixture = os.path.basename(fixture_path)
+        if fixture not in self.manifest:
+            raise KeyError(f"{fixture} is not in the DRS manifest")
+        entry = self.manifest[fixture]
+        if timestamp is None:
+            timestamp = str(int(datetime.now().timestamp()))
+        osn_base = f"{entry['osn_prefix']}_{timestamp}"
+
+        file_info = {}
+        for name, modified_name, role, number in \
+                fixture_layout(fixture_path, entry["thesis"]):
+            object_osn = f"ETD_{OSN_ROLES[role]}_{osn_base}{number}"
+            file_info[name] = {"modified_file_name": modified_name,
+                               "object_role": role,
+                               "object_osn": object_osn,
+                               "file_osn": object_osn + "_1"}
+
+        admin_metadata = {"depositingSystem": "ETD",
+                          "ownerCode": "HUL.TEST",
+                          "billingCode": "HUL.TEST.BILL_0001",
+                          "urnAuthorityPath": "HUL.TEST",
+                          "original_queue": "test",
+                          "task_name": "test",
+                          "retry_count": 0}
+        if "mmsid" in entry:
+            admin_metadata["mmsid"] = entry["mmsid"]
+        admin_metadata.update({"dash_id": "TEST1234",
+                               "pq_id": entry["pq_id"],
+                               "alma_id": "99156631569803941",
+                               "file_info": file_info})
+        return {"package_id": "ETD_TESTING_" + timestamp,
+                "fs_source_path": fs_source_path,
+                "s3_path": "",
+                "s3_bucket_name": "",
+                "depositing_application": "ETD",
+                "admin_metadata": admin_metadata}
+
+
+def load_manifest(manifest_path):
+    """
+    Returns the parsed DRS manifest. It is read once per process and
+    again only when the file's mtime or size changes; callers must not
+    modify it.
+    """
+    path = os.path.realpath(manifest_path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _manifests.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(path) as f:
+        manifest = json.load(f)
+    with _lock:
+        _manifests[path] = (version, manifest)
+    return manifest
+
+
+def fixture_layout(fixture_path, thesis_name):
+    """
+    Classifies the members of a submission zip.
+
+    Only the central directory is read. Results are cached per process,
+    keyed by the fixture's path, mtime and size.
+
+    Args:
+        fixture_path (str): The submission zip.
+        thesis_name (str): The member that is the thesis.
+
+    Returns:
+        tuple: (name, modified_file_name, object_role, osn_suffix) for
+            each file, in zip order; osn_suffix is "_<n>" for
+            supplements and "" otherwise.
+    """
+    path = os.path.realpath(fixture_path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, thesis_name)
+    with _lock:
+        layout = _layouts.get(key)
+    if layout is not None:
+        return layout
+
+    with zipfile.ZipFile(path) as archive:
+        names = [info.filename for info in archive.infolist()
+                 if not info.is_dir()]
+    if thesis_name not in names:
+        raise ValueError(f"{thesis_name} is not in {fixture_path}")
+    layout = []
+    supplements = 0
+    for name in names:
+        if name == DOCUMENTATION_NAME:
+            role, suffix = "DOCUMENTATION", ""
+        elif name == thesis_name:
+            role, suffix = "THESIS", ""
+        elif fnmatch.fnmatchcase(name, LICENSE_PATTERN):
+            role, suffix = "LICENSE", ""
+        else:
+            supplements += 1
+            role, suffix = "THESIS_SUPPLEMENT", f"_{supplements}"
+        layout.append((name, name.replace(" ", "_"), role, suffix))
+    layout = tuple(layout)
+
+    with _lock:
+        # drop layouts of earlier versions of the same fixture
+        for old in [k for k in _layouts if k[0] == path]:
+            del _layouts[old]
+        _layouts[key] = layout
+    return layout
@@ -0,0 +1,368 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import fnmatch
+import logging
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from app.deadline import clamp_timeout, note_failure
+from app.polling import WaitResult, wait_until, default_timeout
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | \
+    IN_MOVED_FROM | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+# Network filesystems do not report remote changes through inotify
+REMOTE_FS_TYPES = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs",
+                   "afs", "9p", "lustre", "gpfs")
+
+
+class FsWatcher():
+    """
+    Tracks entries in a few directories for the length of a run.
+
+    On local filesystems an inotify watch keeps an index of entries up
+    to date and resolves expectations ("an entry matching X appears in
+    directory Y") the moment the entry arrives, with its exact arrival
+    time. A file arrives when its writer closes it (or it is moved into
+    place), so a check that reads it, such as the mapfile contents,
+    never sees it half written; a directory arrives when it is created.
+    On filesystems where inotify does not see changes (NFS and other
+    network mounts), or where inotify is not available, the index is a
+    single scandir per directory that is only refreshed when the
+    directory's mtime changes.
+
+    Patterns are fnmatch patterns and may have a second component, e.g.
+    "proquest*-123-gsd/mapfile"; matching subdirectories are tracked on
+    demand.
+
+    Usage:
+        with FsWatcher([out_dir, dupe_dir]) as watcher:
+            mapfile = watcher.expect(out_dir, "proquest*-123-gsd/mapfile")
+            ... trigger the work ...
+            outcome = watcher.wait(mapfile)
+    """
+
+    INOTIFY = "inotify"
+    SCAN = "scan"
+
+    def __init__(self, directories, mode=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.directories = [os.path.abspath(d) for d in directories if d]
+        if mode is None:
+            mode = os.getenv("FS_WATCH_MODE", "auto")
+        self.requested_mode = mode
+        self.mode = None
+        self._lock = threading.RLock()
+        # directory -> {name: arrival time (monotonic) or None if the
+        # entry was already there when the directory was indexed}
+        self._entries = {}
+        # directory -> st_mtime_ns at the last scan (scan mode)
+        self._scanned_mtime = {}
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+        self._pending = []
+        self._fd = None
+        self._libc = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        self.mode = self.__choose_mode()
+        if self.mode == self.INOTIFY:
+            try:
+                self.__init_inotify()
+            except OSError as err:
+                self.logger.info(f"inotify unavailable, scanning: {err}")
+                self.mode = self.SCAN
+        for directory in self.directories:
+            self.__track(directory)
+        if self.mode == self.INOTIFY:
+            self._thread = threading.Thread(target=self.__read_events,
+                                            name="fs-watch", daemon=True)
+            self._thread.start()
+        self.logger.debug(f"Watching {self.directories} using {self.mode}")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        with self._lock:
+            for _, _, _, future in self._pending:
+                future.cancel()
+            self._pending = []
+
+    def matches(self, directory, pattern):
+        """
+        Returns the paths currently matching pattern in directory, from
+        the index (no directory scan in inotify mode).
+        """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            if self.mode == self.SCAN:
+                self.__refresh(directory)
+            return [path for path, _ in self.__match(directory, pattern)]
+
+    def count(self, directory, pattern):
+        return len(self.matches(directory, pattern))
+
+    def expect(self, directory, pattern, count=1):
+        """
+        Registers an expectation and returns a Future that resolves when
+        at least count entries match. Register before triggering the
+        work, so the arrival cannot be missed.
+
+        Returns:
+            Future: Resolves to {"paths": [...], "arrived_at": float},
+                arrived_at being the time.monotonic() the last needed
+                entry was seen.
+        """
+        directory = os.path.abspath(directory)
+        future = Future()
+        future.registered_at = time.monotonic()
+        future.description = f"{pattern} in {directory}"
+        with self._lock:
+            self._pending.append((directory, pattern, count, future))
+            self.__resolve_pending()
+        return future
+
+    def wait(self, future, timeout=None):
+        """
+        Waits for an expectation registered with expect().
+
+        Returns:
+            WaitResult: value is the list of matching paths; elapsed_secs
+                runs from expect() to the arrival of the entry.
+        """
+        if timeout is None:
+            timeout = default_timeout()
+        # capped at the run's remaining budget
+        waited = time.monotonic() - future.registered_at
+        timeout = waited + clamp_timeout(max(0, timeout - waited),
+                                         future.description)
+        if self.mode == self.SCAN:
+            # nothing pushes events, so re-check the (cheap) directory
+            # mtimes until the expectation resolves
+            def resolved():
+                with self._lock:
+                    for directory in list(self._entries):
+                        self.__refresh(directory)
+                    self.__resolve_pending()
+                return future.done()
+            remaining = timeout - (time.monotonic() - future.registered_at)
+            wait_until(resolved, timeout=max(0, remaining),
+                       description=future.description)
+        try:
+            remaining = timeout - (time.monotonic() - future.registered_at)
+            found = future.result(timeout=max(0, remaining))
+        except FutureTimeoutError:
+            note_failure(future.description)
+            return WaitResult(False, [], round(time.monotonic() -
+                                               future.registered_at, 3),
+                              1, None)
+        return WaitResult(True, found["paths"],
+                          round(max(0, found["arrived_at"] -
+                                    future.registered_at), 3), 1, None)
+
+    def wait_for(self, directory, pattern, count=1, timeout=None):
+        """
+        Shortcut for wait(expect(directory, pattern, count), timeout).
+        """
+        return self.wait(self.expect(directory, pattern, count), timeout)
+
+    def __choose_mode(self):
+        if self.requested_mode in (self.INOTIFY, self.SCAN):
+            return self.requested_mode
+        for directory in self.directories:
+            fs_type = _filesystem_type(directory)
+            if fs_type in REMOTE_FS_TYPES:
+                self.logger.info(f"{directory} is on {fs_type}, scanning")
+                return self.SCAN
+        return self.INOTIFY
+
+    def __init_inotify(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"),
+                                 use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+
+    def __track(self, directory, arrived_at=None):
+        with self._lock:
+            if directory in self._entries:
+                return
+            if self.mode == self.INOTIFY:
+                wd = self._libc.inotify_add_watch(
+                    self._fd, os.fsencode(directory), WATCH_MASK)
+                if wd >= 0:
+                    self._wd_to_dir[wd] = directory
+                    self._dir_to_wd[directory] = wd
+            # Watch first, then scan, so nothing created in between is
+            # lost. Entries found by the scan of a directory that was
+            # already there count as pre-existing.
+            self._entries[directory] = {}
+            self.__scan(directory, arrived_at=arrived_at)
+
+    def __scan(self, directory, arrived_at):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                names = {entry.name for entry in it}
+        except OSError:
+            mtime = None
+            names = set()
+        entries = self._entries.setdefault(directory, {})
+        for name in list(entries):
+            if name not in names:
+                del entries[name]
+        for name in names:
+            if name not in entries:
+                entries[name] = arrived_at
+        self._scanned_mtime[directory] = mtime
+
+    def __refresh(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        if directory not in self._entries or \
+                mtime != self._scanned_mtime.get(directory):
+            self.__scan(directory, arrived_at=time.monotonic())
+
+    def __match(self, directory, pattern):
+        first, _, rest = pattern.partition("/")
+        entries = self._entries.get(directory)
+        if entries is None:
+            self.__track(directory)
+            entries = self._entries[directory]
+        found = []
+        for name, arrived_at in list(entries.items()):
+            if not fnmatch.fnmatchcase(name, first):
+                continue
+            path = os.path.join(directory, name)
+            if not rest:
+                found.append((path, arrived_at))
+            elif os.path.isdir(path):
+                if path not in self._entries:
+                    self.__track(path, arrived_at=None if arrived_at is None
+                                 else time.monotonic())
+                elif self.mode == self.SCAN:
+                    self.__refresh(path)
+                found.extend(self.__match(path, rest))
+        return found
+
+    def __resolve_pending(self):
+        # caller holds self._lock
+        still_pending = []
+        for directory, pattern, count, future in self._pending:
+            if future.done():
+                continue
+            found = self.__match(directory, pattern)
+            if len(found) >= count:
+                arrivals = [arrived_at for _, arrived_at in found
+                            if arrived_at is not None]
+                future.set_result({
+                    "paths": [path for path, _ in found],
+                    "arrived_at": max(arrivals) if arrivals
+                    else future.registered_at})
+            else:
+                still_pending.append((directory, pattern, count, future))
+        self._pending = still_pending
+
+    def __read_events(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self._fd, 65536)
+            except (OSError, ValueError):
+                return
+            now = time.monotonic()
+            with self._lock:
+                self.__apply_events(data, now)
+                self.__resolve_pending()
+
+    def __apply_events(self, data, now):
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped; rebuild the index from disk
+                for directory in list(self._entries):
+                    self.__scan(directory, arrived_at=now)
+                continue
+            directory = self._wd_to_dir.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._wd_to_dir.pop(wd, None)
+                self._dir_to_wd.pop(directory, None)
+                self._entries.pop(directory, None)
+                continue
+            entries = self._entries.setdefault(directory, {})
+            if mask & IN_MOVED_TO or \
+                    mask & IN_CREATE and mask & IN_ISDIR:
+                entries[name] = now
+            elif mask & IN_CLOSE_WRITE:
+                # the first close; a file rewritten later has arrived
+                entries.setdefault(name, now)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                entries.pop(name, None)
+                self._entries.pop(os.path.join(directory, name), None)
+
+
+def _filesystem_type(path):
+    """
+    Returns the type of the filesystem path is on, from /proc/mounts, or
+    None if it cannot be determined.
+    """
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or
+                        path.startswith(mount_point.rstrip("/") + "/")) \
+                        and len(mount_point) >= len(best):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return fs_type
@@ -0,0 +1,329 @@
+import os
+import json
+import math
+import time
+import logging
+import sqlite3
+import threading
+
+# Durations are also counted in log-scale bins, each HISTOGRAM_GROWTH
+# times as wide as the one below it, per suite, step and hour. Stats over
+# a window then read one row per (hour, step, bin) instead of every run,
+# and percentiles come out as a bin's upper bound, within 10% above the
+# true value.
+HISTOGRAM_GROWTH = 1.1
+# the bin of steps without a duration, e.g. suites that were skipped
+NO_DURATION_BIN = -1
+RUN_STEP = "(run)"
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    suite TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    elapsed_secs REAL NOT NULL,
+    num_failed INTEGER NOT NULL,
+    tests_failed TEXT NOT NULL,
+    pid INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_suite_started ON runs (suite, started_at);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+CREATE TABLE IF NOT EXISTS steps (
+    run INTEGER NOT NULL,
+    suite TEXT NOT NULL,
+    step TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    elapsed_secs REAL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run);
+CREATE INDEX IF NOT EXISTS steps_suite_step_started
+    ON steps (suite, step, started_at);
+CREATE INDEX IF NOT EXISTS steps_started ON steps (started_at);
+CREATE TABLE IF NOT EXISTS step_histogram (
+    suite TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    PRIMARY KEY (suite, hour, step, bin)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS step_histogram_hour ON step_histogram (hour);
+"""
+
+
+class HistoryStore():
+    """
+    Keeps every suite run, its steps and their durations in SQLite, so
+    trends such as DASH ingest latency creeping up can be seen.
+
+    The database (HISTORY_DB, default $LOG_DIR/history.sqlite3) is in
+    WAL mode, so the gunicorn workers write to it side by side and
+    readers never block writers. Each process, and each thread in it,
+    opens its own connection.
+
+    The steps of a run are:
+    - kind "run": the run as a whole, under the step name "(run)"
+    - kind "suite": each leaf suite of the run (see SuiteEngine)
+    - kind "wait": each entry of info["Wait timings"]
+    - kind "stage": each stage of info["Timeline"], timed from the stage
+      before it
+
+    Rows older than HISTORY_RETENTION_DAYS (default 90) are dropped.
+    """
+
+    def __init__(self, path=None, retention_days=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if retention_days is None:
+            retention_days = float(os.getenv("HISTORY_RETENTION_DAYS", 90))
+        self.path = path
+        self.retention_days = retention_days
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pruned_at = None
+
+    def record(self, suite, result, leaves, started_at, finished_at):
+        """
+        Stores a finished run. A failure to store it is logged and
+        otherwise ignored.
+
+        Args:
+            suite (str): The suite that was run.
+            result (dict): Its result dictionary.
+            leaves (dict): Maps each leaf suite of the run to a dictionary
+                with its status ("passed", "failed", "skipped",
+                "not run") and elapsed_secs (None if it did not run).
+            started_at (float): When the run started, as time.time().
+            finished_at (float): When it finished, as time.time().
+        """
+        steps = [(RUN_STEP, "run", finished_at - started_at,
+                  result["num_failed"] == 0)]
+        for leaf, outcome in leaves.items():
+            steps.append((leaf, "suite", outcome["elapsed_secs"],
+                          outcome["status"] == "passed"))
+        for name, wait in (result["info"].get("Wait timings") or
+                           {}).items():
+            steps.append((name, "wait", wait.get("elapsed_secs"),
+                          bool(wait.get("ok"))))
+        timeline = result["info"].get("Timeline") or {}
+        for stage in timeline.get("stages", []):
+            steps.append((stage["stage"], "stage",
+                          stage.get("since_previous_secs"),
+                          bool(stage.get("ok"))))
+
+        hour = int(started_at // 3600)
+        try:
+            conn = self.__connection()
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO runs (suite, started_at, finished_at, "
+                    "elapsed_secs, num_failed, tests_failed, pid) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (suite, started_at, finished_at,
+                     finished_at - started_at, result["num_failed"],
+                     json.dumps(result["tests_failed"], default=str),
+                     os.getpid()))
+                run = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO steps (run, suite, step, kind, "
+                    "started_at, elapsed_secs, ok) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(run, suite, step, kind, started_at, elapsed, int(ok))
+                     for step, kind, elapsed, ok in steps])
+                conn.executemany(
+                    "INSERT INTO step_histogram (suite, hour, step, bin, "
+                    "count, failures) VALUES (?, ?, ?, ?, 1, ?) "
+                    "ON CONFLICT (suite, hour, step, bin) DO UPDATE SET "
+                    "count = count + 1, "
+                    "failures = failures + excluded.failures",
+                    [(suite, hour, step, _bin(elapsed), int(not ok))
+                     for step, _, elapsed, ok in steps])
+            self.__prune(conn)
+        except sqlite3.Error as err:
+            self.logger.warning(f"Could not store the {suite} run in the "
+                                f"history: {err}")
+
+    def runs(self, suite=None, limit=50, before=None):
+        """
+        Returns the most recent runs, newest first, with their steps.
+
+        Args:
+            suite (str, optional): Only runs of this suite.
+            limit (int): At most this many runs.
+            before (float, optional): Only runs started before this
+                time.time(), to page back through older runs.
+
+        Returns:
+            list: One dictionary per run.
+        """
+        query = "SELECT id, suite, started_at, finished_at, elapsed_secs, " \
+            "num_failed, tests_failed FROM runs"
+        conditions, params = [], []
+        if suite is not None:
+            conditions.append("suite = ?")
+            params.append(suite)
+        if before is not None:
+            conditions.append("started_at < ?")
+            params.append(before)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY started_at DESC LIMIT ?"
+        params.append(limit)
+
+        conn = self.__connection()
+        runs = [{"id": row[0], "suite": row[1],
+                 "started_at": row[2], "finished_at": row[3],
+                 "elapsed_secs": round(row[4], 3), "num_failed": row[5],
+                 "tests_failed": json.loads(row[6]), "steps": []}
+                for row in conn.execute(query, params)]
+        by_id = {run["id"]: run for run in runs}
+        if by_id:
+            placeholders = ", ".join("?" * len(by_id))
+            for run, step, kind, elapsed, ok in conn.execute(
+                    "SELECT run, step, kind, elapsed_secs, ok FROM steps "
+                    f"WHERE run IN ({placeholders}) ORDER BY rowid",
+                    list(by_id)):
+                by_id[run]["steps"].append(
+                    {"step": step, "kind": kind,
+                     "elapsed_secs": None if elapsed is None
+                     else round(elapsed, 3),
+                     "ok": bool(ok)})
+        return runs
+
+    def stats(self, suite, windows=None, now=None):
+        """
+        Returns run counts, failure rates and duration percentiles of a
+        suite and each of its steps over rolling windows.
+
+        Windows are rolling, at the histogram's resolution of an hour:
+        a window covers every hour that overlaps it, from the hour it
+        starts in to the current one, so it may take in up to an hour
+        more than its length (a 1h window at 10:01 covers 09:00 to
+        10:01).
+
+        Args:
+            suite (str): The suite.
+            windows (list, optional): Window lengths such as "24h" or
+                "7d". Defaults to HISTORY_WINDOWS ("1h,24h,7d,30d").
+            now (float, optional): The end of the windows, as time.time().
+
+        Returns:
+            dict: Maps each window to {"runs", "failures",
+                "failure_rate", "elapsed", "steps"}: "elapsed" has the
+                p50, p95 and p99 run time and "steps" maps each step to
+                {"count", "failures", "failure_rate", "p50", "p95",
+                "p99"}, all times in seconds.
+        """
+        if windows is None:
+            windows = os.getenv("HISTORY_WINDOWS",
+                                "1h,24h,7d,30d").split(",")
+        now = time.time() if now is None else now
+        conn = self.__connection()
+        stats = {}
+        for window in windows:
+            first_hour = math.floor((now - window_secs(window)) / 3600)
+            steps = {}
+            for step, bin_, count, failures in conn.execute(
+                    "SELECT step, bin, SUM(count), SUM(failures) "
+                    "FROM step_histogram WHERE suite = ? AND hour >= ? "
+                    "GROUP BY step, bin ORDER BY step, bin",
+                    (suite, first_hour)):
+                steps.setdefault(step, []).append((bin_, count, failures))
+            summaries = {step: _summarize(bins)
+                         for step, bins in steps.items()}
+            run = summaries.pop(RUN_STEP, _summarize([]))
+            stats[window.strip()] = {"runs": run["count"],
+                                     "failures": run["failures"],
+                                     "failure_rate": run["failure_rate"],
+                                     "elapsed": {name: run[name]
+                                                 for name in PERCENTILES},
+                                     "steps": summaries}
+        return stats
+
+    def __connection(self):
+        # sqlite3 connections belong to the thread, and the process,
+        # that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            if self.path is None:
+                # resolved on first use rather than at import, so LOG_DIR
+                # may be set later (e.g. by the stand-ins)
+                log_dir = os.getenv("LOG_DIR", "/home/etdadm/logs/etd_itest")
+                self.path = os.getenv("HISTORY_DB",
+                                      f"{log_dir}/history.sqlite3")
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=float(
+                os.getenv("HISTORY_BUSY_TIMEOUT_SECS", 5)))
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __prune(self, conn):
+        # at most once an hour per process
+        with self._lock:
+            now = time.time()
+            if self._pruned_at is not None and now - self._pruned_at < 3600:
+                return
+            self._pruned_at = now
+        cutoff = now - self.retention_days * 86400
+        with conn:
+            conn.execute("DELETE FROM runs WHERE started_at < ?", (cutoff,))
+            conn.execute("DELETE FROM steps WHERE started_at < ?", (cutoff,))
+            conn.execute("DELETE FROM step_histogram WHERE hour < ?",
+                         (int(cutoff // 3600),))
+
+
+def window_secs(window):
+    """
+    Returns the length of a window such as "90m", "24h" or "7d" in
+    seconds.
+
+    Raises:
+        ValueError: If the window is not a number with a unit.
+    """
+    window = window.strip()
+    unit = WINDOW_UNITS.get(window[-1:])
+    if unit is None or not window[:-1].isdigit() or int(window[:-1]) <= 0:
+        raise ValueError(f"Not a window: {window!r}; use e.g. 24h or 7d")
+    return int(window[:-1]) * unit
+
+
+def _bin(elapsed_secs):
+    if elapsed_secs is None:
+        return NO_DURATION_BIN
+    millis = elapsed_secs * 1000
+    if millis <= 1:
+        return 0
+    return math.ceil(math.log(millis, HISTOGRAM_GROWTH))
+
+
+def _bin_upper_secs(bin_):
+    return round(HISTOGRAM_GROWTH ** bin_ / 1000, 3)
+
+
+def _summarize(bins):
+    count = sum(n for _, n, _ in bins)
+    failures = sum(f for _, _, f in bins)
+    summary = {"count": count, "failures": failures,
+               "failure_rate": round(failures / count, 4) if count else None}
+    timed = [(bin_, n) for bin_, n, _ in bins if bin_ != NO_DURATION_BIN]
+    timed_count = sum(n for _, n in timed)
+    for name, q in PERCENTILES.items():
+        summary[name] = None
+        seen = 0
+        for bin_, n in timed:
+            seen += n
+            if seen >= q * timed_count:
+                summary[name] = _bin_upper_secs(bin_)
+                break
+    return summary
@@ -0,0 +1,276 @@
+import os
+import time
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+
+from app.circuit_breaker import get_breaker
+from app.deadline import clamp_timeout, current_deadline, note_failure
+from app.metrics import observe_call
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class HttpClient():
+    """
+    Process-wide HTTP client with keep-alive connection pools.
+
+    One requests.Session holds a connection pool per host, so repeated
+    calls to DASH and DIMS reuse their TCP/TLS connections. Every call
+    gets a default timeout. Connection failures are retried for every
+    method; read failures and 502/503/504 responses only for idempotent
+    methods, so a non-idempotent POST such as a DIMS ingest is never sent
+    twice.
+
+    Calls made for a named dependency (DASH, DIMS) go through its circuit
+    breaker: once it has failed BREAKER_FAILURE_THRESHOLD times in a row,
+    with a connection error or a 5xx, calls fail at once with
+    CircuitOpenError until the breaker lets a trial call through.
+
+    During a run with a deadline (see app.deadline) the timeout of every
+    attempt is capped at what is left of the run's budget, and a call
+    is not retried once the budget would run out during the backoff.
+
+    A call, retries included, is one call to the circuit breaker, and
+    is counted and timed once in app.metrics, under its dependency or
+    "HTTP".
+    """
+
+    def __init__(self, timeout=None, retries=None, backoff_factor=None,
+                 pool_connections=None, pool_maxsize=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if timeout is None:
+            timeout = float(os.getenv("HTTP_TIMEOUT_SECS", 30))
+        if retries is None:
+            retries = int(os.getenv("HTTP_RETRIES", 3))
+        if backoff_factor is None:
+            backoff_factor = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5))
+        if pool_connections is None:
+            pool_connections = int(os.getenv("HTTP_POOL_HOSTS", 10))
+        if pool_maxsize is None:
+            pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", 10))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def session(self):
+        """
+        Returns this process's requests.Session, creating it on first use
+        and again after a fork.
+        """
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = self.__new_session()
+                self._pid = os.getpid()
+            return self._session
+
+    def request(self, method, url, dependency=None, **kwargs):
+        step = f"{dependency or 'HTTP'} {method} {url}"
+        # refuse a call with no budget left before it reaches the breaker
+        kwargs["timeout"] = clamp_timeout(kwargs.get("timeout",
+                                                     self.timeout), step)
+        kwargs.setdefault("verify", False)
+        try:
+            with observe_call(dependency or "HTTP") as call:
+                if dependency is None:
+                    response = self.__with_retries(step, method, url,
+                                                   **kwargs)
+                else:
+                    response = get_breaker(dependency).call(
+                        self.__with_retries, step, method, url,
+                        failure_types=(requests.exceptions.ConnectionError,
+                                       requests.exceptions.Timeout),
+                        is_failure=lambda response:
+                            response.status_code >= 500,
+                        **kwargs)
+                if response.status_code >= 500:
+                    call["outcome"] = "error"
+                return response
+        except requests.exceptions.RequestException:
+            note_failure(step)
+            raise
+
+    def get(self, url, dependency=None, **kwargs):
+        return self.request("GET", url, dependency, **kwargs)
+
+    def post(self, url, dependency=None, **kwargs):
+        return self.request("POST", url, dependency, **kwargs)
+
+    def delete(self, url, dependency=None, **kwargs):
+        return self.request("DELETE", url, dependency, **kwargs)
+
+    def __with_retries(self, step, method, url, timeout=None, **kwargs):
+        """
+        Sends a request, retrying it up to self.retries times with
+        exponential backoff. A request that never reached the server is
+        retried whatever its method; a read failure or a 502/503/504
+        only if the method is idempotent.
+        """
+        idempotent = method.upper() in Retry.DEFAULT_ALLOWED_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = self.session().request(
+                    method, url, timeout=clamp_timeout(timeout, step),
+                    **kwargs)
+                if response.status_code not in RETRY_STATUSES or \
+                        not idempotent or \
+                        not self.__retry_after_backoff(attempt, step):
+                    return response
+                response.close()
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as err:
+                if not (idempotent or _never_sent(err)) or \
+                        not self.__retry_after_backoff(attempt, step):
+                    raise
+            attempt += 1
+
+    def __retry_after_backoff(self, attempt, step):
+        """
+        Sleeps before retry number attempt + 1 and returns True, or
+        returns False if there are no retries left or the run's budget
+        would run out first.
+        """
+        if attempt >= self.retries:
+            return False
+        backoff = self.backoff_factor * 2 ** attempt
+        deadline = current_deadline()
+        if deadline is not None and deadline.remaining() <= backoff:
+            self.logger.info(f"Not retrying {step}: the run deadline "
+                             "leaves no time")
+            return False
+        time.sleep(backoff)
+        return True
+
+    def __new_session(self):
+        # no retries in urllib3; request() retries within the deadline
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize)
+        session = requests.Session()
+        # Stay stateless like bare requests calls: cookies such as the
+        # DSpace JSESSIONID are only sent when a caller asks for them.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+
+class DashClient():
+    """
+    DSpace REST calls used by the DASH checks.
+
+    The JSESSIONID from a login is cached for the process and reused for
+    later deletes; it is only refreshed when DSpace answers 401.
+    """
+
+    def __init__(self, http_client, rest_url=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.http_client = http_client
+        self.rest_url = rest_url
+        self._lock = threading.Lock()
+        self._session_key = None
+
+    def get_rest_url(self):
+        if self.rest_url:
+            return self.rest_url
+        return os.getenv("DASH_REST_URL",
+                         "https://dspace6-qai.lib.harvard.edu/rest")
+
+    def find_by_identifier(self, identifier):
+        """
+        Returns the raw JSON text of the items whose dc.identifier.other
+        is the given identifier.
+        """
+        query_url = f"{self.get_rest_url()}/items/find-by-metadata-field"
+        json_query = {"key": "dc.identifier.other", "value": identifier}
+        resp = self.http_client.post(query_url, "DASH", json=json_query)
+        return resp.text
+
+    def session_key(self, refresh=False):
+        """
+        Returns a DSpace JSESSIONID, logging in only if there is no
+        cached one or refresh is set.
+        """
+        with self._lock:
+            if self._session_key is None or refresh:
+                self._session_key = self.__login()
+            return self._session_key
+
+    def delete_item(self, uuid):
+        """
+        Deletes an item, logging in again once if the cached session has
+        expired.
+
+        Returns:
+            requests.Response: The response to the final DELETE.
+        """
+        url = f"{self.get_rest_url()}/items/{uuid}"
+        response = self.http_client.delete(
+            url, "DASH", headers=self.__auth_headers(self.session_key()))
+        if response.status_code == 401:
+            self.logger.info("DSpace session expired, logging in again")
+            response = self.http_client.delete(
+                url, "DASH", headers=self.__auth_headers(
+                    self.session_key(refresh=True)))
+        return response
+
+    def __login(self):
+        login_url = f"{self.get_rest_url()}/login"
+        login_info = {"email": os.getenv("DASH_LOGIN_EMAIL"),
+                      "password": os.getenv("DASH_LOGIN_PW")}
+        resp = self.http_client.post(login_url, "DASH", data=login_info)
+        return resp.cookies.get('JSESSIONID')
+
+    @staticmethod
+    def __auth_headers(session_key):
+        return {'Cookie': f'JSESSIONID={session_key}'}
+
+
+def _never_sent(err):
+    """
+    Whether a request failed before reaching the server, so sending it
+    again cannot repeat it.
+    """
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(err.args[0] if err.args else None, "reason", None)
+    # NewConnectionError, e.g. a refused connection, is a subclass
+    return isinstance(reason, ConnectTimeoutError)
+
+
+_http_client = None
+_dash_client = None
+_clients_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    Returns the process-wide HTTP client.
+    """
+    global _http_client
+    with _clients_lock:
+        if _http_client is None:
+            _http_client = HttpClient()
+        return _http_client
+
+
+def get_dash_client():
+    """
+    Returns the process-wide DSpace REST client.
+    """
+    global _dash_client
+    http_client = get_http_client()
+    with _clients_lock:
+        if _dash_client is None:
+            _dash_client = DashClient(http_client)
+        return _dash_client
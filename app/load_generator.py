@@ -0,0 +1,261 @@
+import os
+import json
+import math
+import time
+import logging
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from app.deadline import current_deadline
+from app.http_client import get_dash_client
+from app.polling import wait_until, default_timeout
+from app.sftp_pool import get_sftp_pool
+from app.run_namespace import RunNamespace, is_reserved_identifier
+from app.tests.etd_end_to_end import ETDEndToEnd
+
+FIXTURE = "submission_999999.zip"
+SCHOOL_CODE = "gsd"
+
+
+class LoadGenerator():
+    """
+    Drives the ProQuest -> DASH pipeline with many submissions to find
+    the rate etd-dash-service keeps up with.
+
+    Submissions are started at a fixed rate (an open workload) and at
+    most `concurrency` are in flight at once. Each one gets its own PQ ID
+    (replace_pq_id), is uploaded to the ProQuest dropbox through the
+    shared SFTP pool, is published as a send_to_dash task through the
+    process-wide publisher and is then polled until it is visible in
+    DASH.
+
+    Latency is measured from when a submission was scheduled, not from
+    when a worker picked it up, so time spent queued behind a saturated
+    pipeline counts against it instead of being hidden.
+    """
+
+    def __init__(self, concurrency=None, rate_per_min=None,
+                 submissions=None, bucket_secs=None,
+                 visibility_timeout=None, cleanup=None, namespace=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        # submissions are named (and their PQ IDs chosen) from it
+        self.namespace = namespace if namespace is not None \
+            else RunNamespace()
+        if concurrency is None:
+            concurrency = os.getenv("LOAD_CONCURRENCY", 4)
+        if rate_per_min is None:
+            rate_per_min = os.getenv("LOAD_RATE_PER_MIN", 10)
+        if submissions is None:
+            submissions = os.getenv("LOAD_SUBMISSIONS", 20)
+        if bucket_secs is None:
+            bucket_secs = os.getenv("LOAD_BUCKET_SECS", 60)
+        self.concurrency = int(concurrency)
+        self.rate_per_min = float(rate_per_min)
+        self.submissions = int(submissions)
+        self.bucket_secs = float(bucket_secs)
+        for name in ("concurrency", "rate_per_min", "submissions",
+                     "bucket_secs"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"Load {name} must be greater than 0, "
+                                 f"not {getattr(self, name)}")
+        if visibility_timeout is None:
+            visibility_timeout = os.getenv("LOAD_VISIBILITY_TIMEOUT_SECS",
+                                           default_timeout())
+        self.visibility_timeout = float(visibility_timeout)
+        if cleanup is None:
+            cleanup = os.getenv("LOAD_CLEANUP", "true").lower() == "true"
+        self.cleanup = cleanup
+        self.test_data_dir = "./testdata"
+
+    def run(self):
+        """
+        Runs the load and summarizes it.
+
+        Returns:
+            dict: A result dictionary; info["Load"] holds the report (see
+                summarize()). A run with any failed submission counts as
+                one failed test.
+        """
+        result = {"num_failed": 0,
+                  "tests_failed": [],
+                  "info": {}}
+        interval = 60.0 / self.rate_per_min
+        records = []
+        self.logger.info(f">>> Load: {self.submissions} submissions at "
+                         f"{self.rate_per_min}/min, concurrency "
+                         f"{self.concurrency}")
+        deadline = current_deadline()
+        not_started = 0
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="load") as executor:
+            futures = []
+            for index in range(self.submissions):
+                scheduled_at = start + index * interval
+                delay = scheduled_at - time.monotonic()
+                if deadline is not None:
+                    delay = min(delay, deadline.remaining())
+                if delay > 0:
+                    time.sleep(delay)
+                # no new submissions once the run's budget is spent
+                if deadline is not None and deadline.expired():
+                    deadline.exhausted("load generation")
+                    not_started = self.submissions - index
+                    break
+                # submissions share the run's deadline
+                futures.append(executor.submit(
+                    contextvars.copy_context().run, self.__submission,
+                    index, scheduled_at))
+            for future in futures:
+                records.append(future.result())
+
+        report = summarize(records, start, self.bucket_secs)
+        report.update({"concurrency": self.concurrency,
+                       "target_rate_per_min": self.rate_per_min,
+                       "not_started": not_started})
+        result["info"]["Load"] = report
+        result["info"]["Run namespace"] = self.namespace.as_dict()
+        if report["failed"] or not_started:
+            result["num_failed"] += 1
+            result["tests_failed"].append("Load")
+        return result
+
+    def __submission(self, index, scheduled_at):
+        e2e = ETDEndToEnd(self.namespace)
+        # each submission has its own PQ ID, unique to this run
+        base_name = self.namespace.base_name()
+        zip_name = f"submission_{base_name}.zip"
+        zip_path = os.path.join(self.test_data_dir, zip_name)
+        record = {"index": index, "pq_id": base_name,
+                  "scheduled_at": scheduled_at,
+                  "started_at": time.monotonic(),
+                  "finished_at": None, "ok": False, "error": None,
+                  "publish_secs": None}
+        stage = "prepare"
+        try:
+            e2e.replace_pq_id(base_name, zip_path,
+                              os.path.join(self.test_data_dir, FIXTURE))
+            stage = "upload"
+            self.__upload(zip_path, zip_name)
+            stage = "publish"
+            published = e2e.publish_to_dash(base_name)
+            record["publish_secs"] = published["elapsed_secs"]
+            stage = "dash"
+            visible = wait_until(
+                lambda: json.loads(get_dash_client()
+                                   .find_by_identifier(base_name)),
+                timeout=self.visibility_timeout,
+                description=f"{base_name} in DASH")
+            record["finished_at"] = time.monotonic()
+            if visible.ok:
+                record["ok"] = True
+            elif visible.error is not None:
+                record["error"] = f"dash: {visible.error}"
+            else:
+                record["error"] = "dash: not visible before the timeout"
+            if visible.ok and self.cleanup and \
+                    is_reserved_identifier(base_name):
+                stage = "cleanup"
+                for item in visible.value:
+                    get_dash_client().delete_item(item["uuid"])
+        except Exception as err:
+            if record["finished_at"] is None:
+                record["finished_at"] = time.monotonic()
+            if not record["ok"]:
+                record["error"] = f"{stage}: {err}"
+            self.logger.error(f"Load submission {base_name} failed at "
+                              f"{stage}: {err}")
+        finally:
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+        return record
+
+    def __upload(self, zip_path, zip_name):
+        # Unlike ETDEndToEnd.sftp_test_object, a failed put raises, so it
+        # is reported as an upload error rather than as a submission
+        # that never showed up in DASH.
+        with get_sftp_pool().session(
+                host=os.getenv("dropboxServer"),
+                username=os.getenv("dropboxUser"),
+                private_key=os.getenv("PRIVATE_KEY_PATH")) as sftp:
+            sftp.put(zip_path, f"incoming/{SCHOOL_CODE}/{zip_name}")
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list, or None if the
+    list is empty.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {"p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None}
+
+
+def summarize(records, start, bucket_secs):
+    """
+    Summarizes load records overall and per time bucket.
+
+    Args:
+        records (list): Per-submission records from LoadGenerator.
+        start (float): The time.monotonic() the run started.
+        bucket_secs (float): Width of the time buckets; a submission
+            falls in the bucket in which it finished.
+
+    Returns:
+        dict: submitted, succeeded, failed, error_rate, duration_secs,
+            throughput_per_min, latency_secs (p50/p95/p99/max of
+            successful submissions), publish_secs (the same for the
+            confirmed send_to_dash publishes), errors (counts by
+            message) and buckets (the same figures per bucket).
+    """
+    finished = [r for r in records if r["finished_at"] is not None]
+    end = max([r["finished_at"] for r in finished], default=start)
+    duration = max(end - start, 1e-9)
+    succeeded = [r for r in records if r["ok"]]
+
+    buckets = {}
+    for r in finished:
+        bucket = int((r["finished_at"] - start) // bucket_secs)
+        buckets.setdefault(bucket, []).append(r)
+    bucket_reports = []
+    for bucket in sorted(buckets):
+        members = buckets[bucket]
+        ok = [r for r in members if r["ok"]]
+        bucket_reports.append({
+            "start_secs": round(bucket * bucket_secs, 3),
+            "completed": len(members),
+            "succeeded": len(ok),
+            "failed": len(members) - len(ok),
+            "error_rate": round((len(members) - len(ok)) / len(members), 4),
+            "throughput_per_min": round(len(ok) * 60.0 / bucket_secs, 3),
+            "latency_secs": _latency_summary(
+                [round(r["finished_at"] - r["scheduled_at"], 3)
+                 for r in ok])})
+
+    return {"submitted": len(records),
+            "succeeded": len(succeeded),
+            "failed": len(records) - len(succeeded),
+            "error_rate": round((len(records) - len(succeeded)) /
+                                len(records), 4) if records else 0.0,
+            "duration_secs": round(duration, 3),
+            "throughput_per_min": round(len(succeeded) * 60.0 / duration,
+                                        3),
+            "latency_secs": _latency_summary(
+                [round(r["finished_at"] - r["scheduled_at"], 3)
+                 for r in succeeded]),
+            "publish_secs": _latency_summary(
+                [r["publish_secs"] for r in records
+                 if r["publish_secs"] is not None]),
+            "errors": dict(Counter(r["error"] for r in records
+                                   if r["error"]).most_common(10)),
+            "buckets": bucket_reports}
@@ -0,0 +1,126 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, \
+    REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+
+from app.circuit_breaker import CircuitOpenError
+
+RUN_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 900, 1800, 3600)
+CALL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                30, 60)
+WAIT_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+ATTEMPT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+SUITE_RUNS = Counter(
+    "etd_itest_suite_runs_total",
+    "Suite runs, by suite and outcome (passed or failed).",
+    ["suite", "outcome"])
+SUITE_RUN_SECONDS = Histogram(
+    "etd_itest_suite_run_seconds",
+    "Wall-clock time of a suite run, dependencies included.",
+    ["suite"], buckets=RUN_BUCKETS)
+STEP_RUNS = Counter(
+    "etd_itest_step_runs_total",
+    "Leaf suites run as steps of a run, by status (passed, failed, "
+    "skipped or not run).",
+    ["suite", "step", "status"])
+STEP_SECONDS = Histogram(
+    "etd_itest_step_seconds",
+    "Time taken by the leaf suites of a run that were started.",
+    ["suite", "step"], buckets=RUN_BUCKETS)
+DEPENDENCY_CALLS = Counter(
+    "etd_itest_dependency_calls_total",
+    "Calls to external dependencies, by outcome (ok, error, or rejected "
+    "by an open circuit breaker).",
+    ["dependency", "outcome"])
+DEPENDENCY_CALL_SECONDS = Histogram(
+    "etd_itest_dependency_call_seconds",
+    "Time taken by calls to external dependencies that were attempted.",
+    ["dependency"], buckets=CALL_BUCKETS)
+POLL_CHECKS = Counter(
+    "etd_itest_poll_checks_total",
+    "Conditions evaluated by wait_until.")
+WAITS = Counter(
+    "etd_itest_waits_total",
+    "Waits by outcome (held, gave_up or circuit_open).",
+    ["outcome"])
+WAIT_SECONDS = Histogram(
+    "etd_itest_wait_seconds",
+    "Time until a wait's condition held or the wait gave up.",
+    ["outcome"], buckets=WAIT_BUCKETS)
+WAIT_ATTEMPTS = Histogram(
+    "etd_itest_wait_attempts",
+    "Polling iterations a wait took.",
+    ["outcome"], buckets=ATTEMPT_BUCKETS)
+
+
+def record_run(suite, result, leaves, started_at, finished_at):
+    """
+    Counts a finished run and its leaf suites; a SuiteEngine recorder.
+    """
+    SUITE_RUNS.labels(suite, "passed" if result["num_failed"] == 0
+                      else "failed").inc()
+    SUITE_RUN_SECONDS.labels(suite).observe(finished_at - started_at)
+    for step, leaf in leaves.items():
+        STEP_RUNS.labels(suite, step, leaf["status"]).inc()
+        if leaf["elapsed_secs"] is not None:
+            STEP_SECONDS.labels(suite, step).observe(leaf["elapsed_secs"])
+
+
+@contextmanager
+def observe_call(dependency):
+    """
+    Times a call to a dependency ("DASH", "DIMS", "SFTP", "Mongo",
+    "Celery") made in a with block.
+
+    The block counts as failed if it raises, or if it sets
+    call["outcome"] to "error", e.g. for a 5xx response. A call refused
+    by an open circuit breaker is counted as "rejected" and not timed.
+
+    Yields:
+        dict: The call's outcome, "ok" unless changed.
+    """
+    call = {"outcome": "ok"}
+    start = time.monotonic()
+    try:
+        yield call
+    except CircuitOpenError:
+        call["outcome"] = "rejected"
+        raise
+    except Exception:
+        call["outcome"] = "error"
+        raise
+    finally:
+        DEPENDENCY_CALLS.labels(dependency, call["outcome"]).inc()
+        if call["outcome"] != "rejected":
+            DEPENDENCY_CALL_SECONDS.labels(dependency).observe(
+                time.monotonic() - start)
+
+
+def observe_wait(outcome, elapsed_secs, attempts):
+    """
+    Counts a finished wait_until and the polling iterations it took.
+    """
+    POLL_CHECKS.inc(attempts)
+    WAITS.labels(outcome).inc()
+    WAIT_SECONDS.labels(outcome).observe(elapsed_secs)
+    WAIT_ATTEMPTS.labels(outcome).observe(attempts)
+
+
+def render():
+    """
+    Returns the metrics in the Prometheus text format, and its content
+    type.
+
+    Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py)
+    and every worker writes its metrics there, so a scrape answered by
+    any worker reports the totals of all of them.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
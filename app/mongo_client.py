@@ -0,0 +1,200 @@
+import os
+import logging
+import threading
+
+from pymongo import MongoClient, monitoring
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from app.circuit_breaker import get_breaker
+from app.deadline import clamp_timeout, note_failure
+from app.metrics import observe_call
+
+# the option that bounds a query's server-side run time, by method
+MAX_TIME_OPTIONS = {"find": "max_time_ms",
+                    "find_one": "max_time_ms",
+                    "count_documents": "maxTimeMS"}
+# methods whose cursors are read to the end inside the breaker
+CURSOR_METHODS = ("find", "aggregate")
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events so pool usage can be reported.
+    """
+
+    def __init__(self, max_pool_size):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self.counts = {"created": 0, "closed": 0, "checked_out": 0,
+                       "checked_in": 0, "check_out_failed": 0,
+                       "pool_cleared": 0}
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats["in_use"] = stats["checked_out"] - stats["checked_in"]
+        stats["open"] = stats["created"] - stats["closed"]
+        return stats
+
+    def __count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.__count("pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.__count("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.__count("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.__count("check_out_failed")
+
+    def connection_checked_out(self, event):
+        self.__count("checked_out")
+
+    def connection_checked_in(self, event):
+        self.__count("checked_in")
+
+
+_client = None
+_listener = None
+_lock = threading.Lock()
+
+
+def get_mongo_client():
+    """
+    Returns the process-wide MongoClient, creating it on first use.
+
+    MongoClient is not fork-safe, so the client is never created at
+    import time; with gunicorn --preload each worker builds its own
+    after the fork (see _reset_after_fork).
+
+    Returns:
+        MongoClient: A client connected to MONGO_URL.
+    """
+    global _client, _listener
+    with _lock:
+        if _client is None:
+            max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", 10))
+            _listener = PoolStatsListener(max_pool_size)
+            _client = MongoClient(
+                os.getenv('MONGO_URL'),
+                maxPoolSize=max_pool_size,
+                serverSelectionTimeoutMS=int(
+                    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+                connectTimeoutMS=int(
+                    os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+                event_listeners=[_listener])
+            logging.getLogger('etd_int_tests').debug(
+                f"Created MongoClient in process {os.getpid()}")
+        return _client
+
+
+def set_mongo_client(client):
+    """
+    Makes client the process-wide client, e.g. an in-memory stand-in
+    (see app.standins). Pass None to go back to a real MongoClient on the
+    next call to get_mongo_client().
+    """
+    global _client, _listener
+    with _lock:
+        _client = client
+        _listener = None
+
+
+class BreakerCollection():
+    """
+    A collection whose method calls go through the Mongo circuit breaker.
+    Connection failures count against it; other errors, such as a server
+    without change streams refusing watch(), do not.
+
+    During a run with a deadline (see app.deadline), queries are given
+    what is left of the run's budget as their server-side time limit.
+
+    find() and aggregate() return lists, not cursors: a cursor fetches
+    its batches as it is iterated, after the call has returned, so
+    failures and time spent reading it would escape the breaker and the
+    "Mongo" call metrics. Change streams from watch() are still returned
+    as they are; StatusWatcher reads them as a wait, and falls back to
+    polling if they fail.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        if name in CURSOR_METHODS:
+            def call(*args, **kwargs):
+                return list(attr(*args, **kwargs))
+        else:
+            call = attr
+
+        def guarded(*args, **kwargs):
+            step = f"Mongo {name}"
+            budget = clamp_timeout(None, step)
+            if budget is not None and name in MAX_TIME_OPTIONS:
+                kwargs.setdefault(MAX_TIME_OPTIONS[name],
+                                  max(1, int(budget * 1000)))
+            try:
+                with observe_call("Mongo"):
+                    return get_breaker("Mongo").call(
+                        call, *args, failure_types=(ConnectionFailure,),
+                        **kwargs)
+            except PyMongoError:
+                note_failure(step)
+                raise
+        return guarded
+
+
+def get_collection():
+    """
+    Returns the MONGO_COLLECTION collection of MONGO_DBNAME, behind the
+    Mongo circuit breaker.
+    """
+    mongo_db = get_mongo_client()[os.getenv("MONGO_DBNAME")]
+    return BreakerCollection(mongo_db[os.getenv("MONGO_COLLECTION")])
+
+
+def pool_stats():
+    """
+    Returns connection pool counters for this process's client, or an
+    empty dictionary if no client has been created yet.
+    """
+    with _lock:
+        if _listener is None:
+            return {}
+        stats = _listener.snapshot()
+        stats["max_pool_size"] = _listener.max_pool_size
+        stats["pid"] = os.getpid()
+        return stats
+
+
+def _reset_after_fork():
+    # The child must not use (or close) the parent's sockets and monitor
+    # threads; forget the client so the next call creates a fresh one.
+    global _client, _listener, _lock
+    _client = None
+    _listener = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+
+from pymongo.errors import PyMongoError
+
+from app.mongo_client import get_collection
+from app.deadline import clamp_timeout, note_failure
+from app.polling import WaitResult, wait_until, default_timeout
+
+_indexed = set()
+
+
+class StatusWatcher():
+    """
+    Waits for a record's status field to reach a value.
+
+    The watcher subscribes to a change stream on MONGO_COLLECTION,
+    filtered on directory_id, when it is entered, so it must be entered
+    before the record is inserted or the work that changes it is
+    triggered; the transition is then seen the moment it is written.
+    Change streams need a replica set; where they are not available (a
+    standalone local mongod, for example) the watcher falls back to
+    polling an indexed query with wait_until.
+
+    Usage:
+        with StatusWatcher(directory_id) as watcher:
+            ... insert the record, publish the task ...
+            outcome = watcher.wait_for("alma_submission_status", "FAILED")
+    """
+
+    CHANGE_STREAM = "change_stream"
+    POLLING = "polling"
+
+    def __init__(self, directory_id, collection=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.directory_id = directory_id
+        self.collection = collection
+        self.source = None
+        self._stream = None
+        self._started = None
+
+    def __enter__(self):
+        if self.collection is None:
+            self.collection = get_collection()
+        self._started = time.monotonic()
+        pipeline = [{"$match": {
+            "operationType": {"$in": ["insert", "update", "replace"]},
+            "fullDocument.directory_id": self.directory_id}}]
+        try:
+            self._stream = self.collection.watch(
+                pipeline, full_document="updateLookup",
+                max_await_time_ms=int(
+                    os.getenv("MONGO_WATCH_AWAIT_MS", 1000)))
+            self.source = self.CHANGE_STREAM
+        except PyMongoError as err:
+            self.logger.info("Change streams unavailable, falling back "
+                             f"to polling: {err}")
+            self.__ensure_index()
+            self.source = self.POLLING
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        return False
+
+    def wait_for(self, field, value, timeout=None):
+        """
+        Waits until the record's field equals value.
+
+        Args:
+            field (str): The field to watch, e.g. alma_submission_status.
+            value: The value to wait for.
+            timeout (float, optional): Deadline in seconds, counted from
+                this call. Defaults to polling.default_timeout().
+
+        Returns:
+            WaitResult: value is the matching document; elapsed_secs is
+                measured from when the watcher was entered, i.e. the
+                transition latency.
+        """
+        if timeout is None:
+            timeout = default_timeout()
+        timeout = clamp_timeout(timeout, f"{field} {value}")
+        deadline = time.monotonic() + timeout
+        if self._stream is not None:
+            try:
+                return self.__wait_on_stream(field, value, deadline)
+            except PyMongoError as err:
+                self.logger.warning(f"Change stream failed, falling back "
+                                    f"to polling: {err}")
+                self._stream.close()
+                self._stream = None
+                self.__ensure_index()
+                self.source = self.POLLING
+        return self.__wait_by_polling(field, value, deadline)
+
+    def __wait_on_stream(self, field, value, deadline):
+        events = 0
+        # The transition may have been written before the stream saw
+        # anything we were waiting for; look once before blocking.
+        document = self.__find()
+        while not (document and document.get(field) == value):
+            if time.monotonic() >= deadline:
+                note_failure(f"{field} {value}")
+                return WaitResult(False, document, self.__elapsed(), events,
+                                  None)
+            change = self._stream.try_next()
+            if change is None:
+                continue
+            events += 1
+            document = change.get("fullDocument")
+        self.logger.info(f"{field} became {value} for {self.directory_id} "
+                         f"after {self.__elapsed()}s")
+        return WaitResult(True, document, self.__elapsed(), events, None)
+
+    def __wait_by_polling(self, field, value, deadline):
+        last = {}
+
+        def matches():
+            last["document"] = self.__find()
+            return last["document"] and \
+                last["document"].get(field) == value
+
+        outcome = wait_until(matches,
+                             timeout=max(0, deadline - time.monotonic()),
+                             description=f"{field} {value}")
+        return WaitResult(outcome.ok, last.get("document"), self.__elapsed(),
+                          outcome.attempts, outcome.error)
+
+    def __find(self):
+        return self.collection.find_one({"directory_id": self.directory_id})
+
+    def __elapsed(self):
+        return round(time.monotonic() - self._started, 3)
+
+    def __ensure_index(self):
+        # Once per process and collection; a failure only costs speed.
+        key = self.collection.full_name
+        if key in _indexed:
+            return
+        try:
+            self.collection.create_index("directory_id")
+            _indexed.add(key)
+        except PyMongoError as err:
+            self.logger.warning(f"Could not index directory_id: {err}")
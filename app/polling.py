@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+from collections import namedtuple
+
+from app.circuit_breaker import CircuitOpenError
+from app.deadline import clamp_timeout, deadline_step, note_failure
+from app.metrics import observe_wait
+
+logger = logging.getLogger('etd_int_tests')
+
+
+class WaitResult(namedtuple("WaitResult", ["ok", "value", "elapsed_secs",
+                                           "attempts", "error"])):
+    """
+    The outcome of wait_until.
+
+    ok: whether the condition held before the deadline
+    value: the last value returned by the condition
+    elapsed_secs: time until the condition held (or until giving up)
+    attempts: number of times the condition was evaluated
+    error: the last exception raised by the condition, if any
+    """
+
+    def as_dict(self):
+        """
+        The JSON-friendly summary recorded in result["info"].
+        """
+        return {"ok": self.ok,
+                "elapsed_secs": self.elapsed_secs,
+                "attempts": self.attempts}
+
+
+def default_timeout():
+    """
+    The overall budget for a wait: the old MAX_TRIALS x SLEEP_SECS
+    unless POLL_TIMEOUT_SECS says otherwise.
+    """
+    max_trials = int(os.getenv("MAX_TRIALS", 10))
+    sleep_secs = int(os.getenv("SLEEP_SECS", 30))
+    return float(os.getenv("POLL_TIMEOUT_SECS", max_trials * sleep_secs))
+
+
+def wait_until(condition, timeout=None, initial_interval=None,
+               max_interval=None, factor=2.0, description="condition"):
+    """
+    Polls a condition until it returns a truthy value or the deadline
+    passes.
+
+    The first checks are made quickly and the interval between checks
+    grows exponentially up to max_interval, so a pipeline that reacts in
+    seconds is noticed in seconds while a slow one is not hammered.
+    Exceptions raised by the condition count as "not yet" and are kept
+    in the result, except CircuitOpenError: a dependency the condition
+    needs is down, so the wait gives up at once rather than poll it
+    until the deadline. The deadline is capped at what is left of the
+    run's budget (see app.deadline). Every wait is counted, with its
+    polling iterations, in app.metrics.
+
+    Args:
+        condition (callable): Called with no arguments; the wait stops
+            as soon as it returns a truthy value.
+        timeout (float, optional): Overall deadline in seconds. Defaults
+            to default_timeout().
+        initial_interval (float, optional): First sleep between checks.
+            Defaults to POLL_INITIAL_SECS (0.5).
+        max_interval (float, optional): Cap on the sleep between checks.
+            Defaults to POLL_MAX_INTERVAL_SECS, or SLEEP_SECS.
+        factor (float): Growth factor of the interval.
+        description (str): Used in log messages.
+
+    Returns:
+        WaitResult: The outcome of the wait.
+
+    Raises:
+        DeadlineExceeded: If the run has no budget left to wait in.
+    """
+    if timeout is None:
+        timeout = default_timeout()
+    timeout = clamp_timeout(timeout, description)
+    if initial_interval is None:
+        initial_interval = float(os.getenv("POLL_INITIAL_SECS", 0.5))
+    if max_interval is None:
+        max_interval = float(os.getenv("POLL_MAX_INTERVAL_SECS",
+                                       os.getenv("SLEEP_SECS", 30)))
+
+    # calls the condition makes are reported as part of the wait
+    with deadline_step(description):
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = initial_interval
+        attempts = 0
+        value = None
+        error = None
+        while True:
+            attempts += 1
+            try:
+                value = condition()
+                error = None
+            except CircuitOpenError as err:
+                elapsed = time.monotonic() - start
+                logger.warning(f"Gave up waiting for {description} after "
+                               f"{elapsed:.2f}s: {err}")
+                note_failure(description)
+                observe_wait("circuit_open", elapsed, attempts)
+                return WaitResult(False, None, round(elapsed, 3), attempts,
+                                  err)
+            except Exception as err:
+                value = None
+                error = err
+                logger.debug(f"Waiting for {description}, attempt {attempts} "
+                             f"raised: {err}")
+            elapsed = time.monotonic() - start
+            if value:
+                logger.info(f"{description} held after {elapsed:.2f}s "
+                            f"({attempts} attempts)")
+                observe_wait("held", elapsed, attempts)
+                return WaitResult(True, value, round(elapsed, 3), attempts,
+                                  None)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Gave up waiting for {description} after "
+                               f"{elapsed:.2f}s ({attempts} attempts)")
+                note_failure(description)
+                observe_wait("gave_up", elapsed, attempts)
+                return WaitResult(False, value, round(elapsed, 3), attempts,
+                                  error)
+            time.sleep(min(interval, remaining))
+            interval = min(interval * factor, max_interval)
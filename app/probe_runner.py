@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from app.deadline import current_deadline, note_failure
+
+
+class ProbeRunner():
+    """
+    Runs independent check functions concurrently on a bounded thread pool.
+
+    Every probe gets its own deadline, measured from the moment the batch
+    is submitted, so the wall-clock cost of a batch is the slowest probe
+    rather than the sum of all of them. A probe that misses its deadline
+    is reported as failed; its thread is abandoned rather than joined.
+    During a run with a deadline (see app.deadline) no probe gets longer
+    than what is left of the run's budget.
+    """
+
+    def __init__(self, max_workers=None, default_timeout=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if max_workers is None:
+            max_workers = int(os.getenv("PROBE_MAX_WORKERS", 8))
+        if default_timeout is None:
+            default_timeout = float(os.getenv("PROBE_TIMEOUT_SECS", 10))
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+
+    def run(self, probes, timeouts=None):
+        """
+        Runs the probes concurrently and collects their results.
+
+        Args:
+            probes (dict): Maps a probe name to a callable returning a
+                result dictionary (num_failed, tests_failed, info).
+            timeouts (dict, optional): Per-probe deadlines in seconds.
+                Probes without an entry use the default timeout.
+
+        Returns:
+            dict: Maps each probe name to a dictionary with the keys
+                result (the probe's result dictionary), elapsed_secs
+                (float) and timed_out (bool), in the order the probes
+                were given.
+        """
+        timeouts = timeouts or {}
+        deadline = current_deadline()
+        outcomes = {}
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_workers, len(probes))),
+            thread_name_prefix="probe")
+        try:
+            start = time.monotonic()
+            futures = {}
+            for name, probe in probes.items():
+                timeout = timeouts.get(name, self.default_timeout)
+                if deadline is not None:
+                    timeout = min(timeout, deadline.remaining())
+                futures[name] = (executor.submit(
+                    contextvars.copy_context().run, self.__timed, probe),
+                    timeout)
+            for name, (future, timeout) in futures.items():
+                remaining = max(0, start + timeout - time.monotonic())
+                try:
+                    result, elapsed = future.result(timeout=remaining)
+                    outcomes[name] = {"result": result,
+                                      "elapsed_secs": round(elapsed, 3),
+                                      "timed_out": False}
+                except FutureTimeoutError:
+                    future.cancel()
+                    note_failure(f"{name} probe")
+                    self.logger.error(f"Probe {name} timed out after "
+                                      f"{timeout}s")
+                    outcomes[name] = {
+                        "result": {"num_failed": 1,
+                                   "tests_failed": [name],
+                                   "info": {f"{name} probe timed out":
+                                            {"status_code": 504,
+                                             "text": "No response within "
+                                             f"{timeout}s"}}},
+                        "elapsed_secs": round(time.monotonic() - start, 3),
+                        "timed_out": True}
+                except Exception as err:
+                    self.logger.error(f"Probe {name} failed: {err}")
+                    outcomes[name] = {
+                        "result": {"num_failed": 1,
+                                   "tests_failed": [name],
+                                   "info": {f"{name} probe failed":
+                                            {"status_code": 500,
+                                             "text": str(err)}}},
+                        "elapsed_secs": round(time.monotonic() - start, 3),
+                        "timed_out": False}
+        finally:
+            # Never block the caller on a probe that blew its deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+        return outcomes
+
+    @staticmethod
+    def __timed(probe):
+        start = time.monotonic()
+        result = probe()
+        return result, time.monotonic() - start
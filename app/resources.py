@@ -1,14 +1,12 @@
+from flask import url_for, request, abort, Response
 from flask_restx import Resource, Api
 import os
 import json
 
-from app.tests.connectivity_checks import ConnectivityChecks
-from app.tests.etd_dash_service_checks import ETDDashServiceChecks
-from app.tests.etd_dais_end_to_end import ETDDAISEndToEnd
-from app.tests.etd_alma_service_checks import ETDAlmaServiceChecks
-from app.tests.etd_alma_monitor_service_checks \
-    import ETDAlmaMonitorServiceChecks
-from app.tests.etd_end_to_end import ETDEndToEnd
+from app.history_store import window_secs
+from app.metrics import render
+from app.suites import suite_engine, run_manager, run_suite, \
+    history_store
 
 
 def define_resources(app):
@@ -29,203 +27,130 @@ def define_resources(app):
             version = os.environ.get('APP_VERSION', "NOT FOUND")
             return {"version": version}
 
+    def deadline_arg():
+        # ?deadline_secs=<seconds> sets the run's time budget
+        value = request.args.get("deadline_secs")
+        if value is None:
+            return None
+        try:
+            deadline_secs = float(value)
+        except ValueError:
+            deadline_secs = 0
+        if deadline_secs <= 0:
+            abort(400, f"deadline_secs must be a positive number: {value}")
+        return deadline_secs
+
+    # Suites return native result dictionaries; they are only
+    # serialized here, at the HTTP edge. Identical requests made while a
+    # run is in flight share its result (see SingleFlight).
     @app.route('/connectivity')
     def connectivity():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        connectivityChecks = ConnectivityChecks()
-        # Mongo
-        mongo_result = connectivityChecks.mongodb_connectivity_test()
-        result["num_failed"] += mongo_result["num_failed"]
-        if len(mongo_result["tests_failed"]) > 0:
-            result["tests_failed"].append(mongo_result["tests_failed"])
-        result["info"] = result["info"] | mongo_result["info"]
-
-        # DASH
-        dash_result = connectivityChecks.dash_connectivity_test()
-        result["num_failed"] += dash_result["num_failed"]
-        if len(dash_result["tests_failed"]) > 0:
-            result["tests_failed"].append(dash_result["tests_failed"])
-        result["info"] = result["info"] | dash_result["info"]
-
-        # DIMS
-        dims_result = connectivityChecks.dims_connectivity_test()
-        result["num_failed"] += dims_result["num_failed"]
-        if len(dims_result["tests_failed"]) > 0:
-            result["tests_failed"].append(dims_result["tests_failed"])
-        result["info"] = result["info"] | dims_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("connectivity", deadline_arg()))
 
     @app.route('/dash_service')
     def etd_dash_service_testing():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        etdDashServiceChecks = ETDDashServiceChecks()
-        deposit_result = etdDashServiceChecks.dash_deposit_test()
-        result["num_failed"] = deposit_result["num_failed"]
-        if len(deposit_result["tests_failed"]) > 0:
-            result["tests_failed"].append(deposit_result["tests_failed"])
-        result["info"] = result["info"] | deposit_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("dash_service", deadline_arg()))
 
     @app.route('/integration')
     def integration_test():
-        # Should we save this for the end-to-end?
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        # For now call all tests since the endpoints haven't
-        # been updated in the services yet.
-        res1 = connectivity()
-        res2 = etd_dash_service_testing()
-        res3 = etd_alma_monitor_service_testing()
-        res1_json = json.loads(res1)
-        res2_json = json.loads(res2)
-        res3_json = json.loads(res3)
-        result["num_failed"] = res1_json["num_failed"] \
-            + res2_json["num_failed"] + res3_json["num_failed"]
-        if len(res1_json["tests_failed"]) > 0:
-            result["tests_failed"].append(res1_json["tests_failed"])
-        if len(res2_json["tests_failed"]) > 0:
-            result["tests_failed"].append(res2_json["tests_failed"])
-        if len(res3_json["tests_failed"]) > 0:
-            result["tests_failed"].append(res3_json["tests_failed"])
-        result["info"] = result["info"] | res1_json["info"] | \
-            res2_json["info"] | res3_json["info"]
-
-        return json.dumps(result)
+        # Connectivity, DASH deposit and alma-monitor run concurrently
+        return json.dumps(run_suite("integration", deadline_arg()))
 
     @app.route('/etd_basic_test')
     def etd_test():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        dais_end_to_end_image = ETDDAISEndToEnd()
-        end_to_end_result = dais_end_to_end_image \
-            .end_to_end_documentation_test()
-        result["num_failed"] = end_to_end_result["num_failed"]
-        if len(end_to_end_result["tests_failed"]) > 0:
-            result["tests_failed"].append(end_to_end_result["tests_failed"])
-        result["info"] = result["info"] | end_to_end_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("etd_basic_test", deadline_arg()))
 
     @app.route('/etd_with_images_test')
     def etd_with_images_test():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        dais_end_to_end_image = ETDDAISEndToEnd()
-        end_to_end_result = dais_end_to_end_image.end_to_end_images_test()
-        result["num_failed"] = end_to_end_result["num_failed"]
-        if len(end_to_end_result["tests_failed"]) > 0:
-            result["tests_failed"].append(end_to_end_result["tests_failed"])
-        result["info"] = result["info"] | end_to_end_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("etd_with_images_test", deadline_arg()))
 
     @app.route('/etd_with_opaque_test')
     def etd_with_opaque_and_image_test():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        dais_end_to_end_image = ETDDAISEndToEnd()
-        end_to_end_result = dais_end_to_end_image.end_to_end_opaque_gif_test()
-        result["num_failed"] = end_to_end_result["num_failed"]
-        if len(end_to_end_result["tests_failed"]) > 0:
-            result["tests_failed"].append(end_to_end_result["tests_failed"])
-        result["info"] = result["info"] | end_to_end_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("etd_with_opaque_test", deadline_arg()))
 
     @app.route('/etd_with_audio_test')
     def etd_with_audio_test():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        dais_end_to_end_image = ETDDAISEndToEnd()
-        end_to_end_result = dais_end_to_end_image.end_to_end_audio_test()
-        result["num_failed"] = end_to_end_result["num_failed"]
-        if len(end_to_end_result["tests_failed"]) > 0:
-            result["tests_failed"].append(end_to_end_result["tests_failed"])
-        result["info"] = result["info"] | end_to_end_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("etd_with_audio_test", deadline_arg()))
 
     @app.route('/alma_service')
     def etd_alma_service_testing():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        etdAlmaServiceChecks = ETDAlmaServiceChecks()
-        export_result = etdAlmaServiceChecks.alma_service_test()
-        result["num_failed"] = export_result["num_failed"]
-        if len(export_result["tests_failed"]) > 0:
-            result["tests_failed"].append(export_result["tests_failed"])
-        result["info"] = result["info"] | export_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("alma_service", deadline_arg()))
 
     @app.route('/alma_monitor_service')
     def etd_alma_monitor_service_testing():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        etdAlmaMonitorServiceChecks = ETDAlmaMonitorServiceChecks()
-        export_result = etdAlmaMonitorServiceChecks. \
-            monitor_alma_and_invoke_dims()
-        result["num_failed"] = export_result["num_failed"]
-        if len(export_result["tests_failed"]) > 0:
-            result["tests_failed"].append(export_result["tests_failed"])
-        result["info"] = result["info"] | export_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("alma_monitor_service", deadline_arg()))
 
     @app.route('/alma_monitor_service_missing_submission')
     def etd_alma_monitor_service_missing_submission_testing():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        etdAlmaMonitorServiceChecks = ETDAlmaMonitorServiceChecks()
-        export_result = etdAlmaMonitorServiceChecks. \
-            monitor_alma_and_invoke_dim_missing_submission()
-        result["num_failed"] = export_result["num_failed"]
-        if len(export_result["tests_failed"]) > 0:
-            result["tests_failed"].append(export_result["tests_failed"])
-        result["info"] = result["info"] | export_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(
+            run_suite("alma_monitor_service_missing_submission",
+                      deadline_arg()))
 
     @app.route('/etd_end_to_end')
     def etd_end_to_end():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        etd_end_to_end = ETDEndToEnd()
-        end_to_end_result = etd_end_to_end \
-            .end_to_end()
-        result["num_failed"] = end_to_end_result["num_failed"]
-        if len(end_to_end_result["tests_failed"]) > 0:
-            result["tests_failed"].append(end_to_end_result["tests_failed"])
-        result["info"] = result["info"] | end_to_end_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("etd_end_to_end", deadline_arg()))
 
     @app.route('/etd_end_to_end_no_dash')
     def etd_end_to_end_no_dash():
-        result = {"num_failed": 0,
-                  "tests_failed": [], "info": {}}
-
-        etd_end_to_end = ETDEndToEnd()
-        end_to_end_result = etd_end_to_end \
-            .end_to_end(False)
-        result["num_failed"] = end_to_end_result["num_failed"]
-        if len(end_to_end_result["tests_failed"]) > 0:
-            result["tests_failed"].append(end_to_end_result["tests_failed"])
-        result["info"] = result["info"] | end_to_end_result["info"]
-
-        return json.dumps(result)
+        return json.dumps(run_suite("etd_end_to_end_no_dash", deadline_arg()))
+
+    @app.route('/etd_load')
+    def etd_load():
+        # Runs for minutes; POST /runs/etd_load is usually the better fit
+        return json.dumps(run_suite("etd_load", deadline_arg()))
+
+    # Asynchronous runs: submit a suite, get a run ID back right away
+    # and poll it, instead of holding a worker for the whole run.
+    @app.route('/runs/<suite>', methods=['POST'])
+    def submit_run(suite):
+        try:
+            record = run_manager.submit(suite, deadline_arg())
+        except KeyError as err:
+            return {"error": str(err),
+                    "suites": suite_engine.names()}, 404
+        return {"run_id": record["run_id"],
+                "suite": record["suite"],
+                "status": record["status"],
+                "url": url_for("get_run", run_id=record["run_id"])}, 202
+
+    @app.route('/runs/<run_id>', methods=['GET'])
+    def get_run(run_id):
+        record = run_manager.get(run_id)
+        if record is None:
+            return {"error": f"Unknown run: {run_id}"}, 404
+        return record
+
+    # Every run is kept in the history store, whichever route ran it.
+    @app.route('/history', methods=['GET'])
+    def history():
+        suite = request.args.get("suite")
+        try:
+            limit = max(1, min(int(request.args.get("limit", 50)), 500))
+            before = request.args.get("before")
+            before = float(before) if before is not None else None
+        except ValueError as err:
+            return {"error": str(err)}, 400
+        return {"runs": history_store.runs(suite, limit, before)}
+
+    @app.route('/history/<suite>/stats', methods=['GET'])
+    def history_stats(suite):
+        if suite not in suite_engine.names():
+            return {"error": f"Unknown suite: {suite}",
+                    "suites": suite_engine.names()}, 404
+        windows = request.args.get("windows")
+        if windows is not None:
+            windows = windows.split(",")
+            try:
+                for window in windows:
+                    window_secs(window)
+            except ValueError as err:
+                return {"error": str(err)}, 400
+        return {"suite": suite,
+                "windows": history_store.stats(suite, windows)}
+
+    # Prometheus scrape target: suite runs, steps, dependency calls and
+    # waits, summed over every gunicorn worker
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        body, content_type = render()
+        return Response(body, content_type=content_type)
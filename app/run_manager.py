@@ -0,0 +1,168 @@
+import os
+import copy
+import json
+import time
+import uuid
+import logging
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RunManager():
+    """
+    Runs suites in a background executor and tracks them by run ID.
+
+    Run records are written as JSON files to a directory shared by all
+    gunicorn workers, so a run submitted to one worker can be polled
+    through any other. Each record holds the run status, its progress
+    through the leaf suites and, once finished, the result dictionary.
+
+    With single_flight, a run attaches to an identical run already in
+    flight; its progress then stays empty until the result arrives.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    def __init__(self, engine, state_dir=None, max_workers=None,
+                 retention_secs=None, single_flight=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.engine = engine
+        self.single_flight = single_flight
+        if state_dir is None:
+            log_dir = os.getenv("LOG_DIR", "/home/etdadm/logs/etd_itest")
+            state_dir = os.getenv("RUN_STATE_DIR", f"{log_dir}/runs")
+        if max_workers is None:
+            max_workers = int(os.getenv("RUN_MAX_WORKERS", 4))
+        if retention_secs is None:
+            retention_secs = int(os.getenv("RUN_RETENTION_SECS", 604800))
+        self.state_dir = state_dir
+        self.max_workers = max_workers
+        self.retention_secs = retention_secs
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def submit(self, suite, deadline_secs=None):
+        """
+        Queues a suite for a background run.
+
+        Args:
+            suite (str): The name of a leaf or composite suite.
+            deadline_secs (float, optional): The run's time budget,
+                counted from when it starts. Defaults to
+                RUN_DEADLINE_SECS.
+
+        Returns:
+            dict: The initial run record, including the run_id.
+        """
+        if suite not in self.engine.names():
+            raise KeyError(f"Unknown suite: {suite}")
+        self.__prune()
+        run_id = uuid.uuid4().hex
+        record = {"run_id": run_id,
+                  "suite": suite,
+                  "status": self.QUEUED,
+                  "deadline_secs": deadline_secs,
+                  "submitted_at": datetime.now().isoformat(),
+                  "started_at": None,
+                  "finished_at": None,
+                  "progress": {"total": len(self.engine.leaves(suite)),
+                               "running": [],
+                               "finished": []},
+                  "result": None}
+        self.__write(record)
+        snapshot = copy.deepcopy(record)
+        self.__get_executor().submit(self.__run, record)
+        return snapshot
+
+    def get(self, run_id):
+        """
+        Returns the current record of a run, or None if it is unknown.
+        """
+        path = self.__path(run_id)
+        if path is None or not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def __run(self, record):
+        record_lock = threading.Lock()
+
+        def progress(name, status):
+            with record_lock:
+                if status == "running":
+                    record["progress"]["running"].append(name)
+                else:
+                    if name in record["progress"]["running"]:
+                        record["progress"]["running"].remove(name)
+                    record["progress"]["finished"].append(name)
+                self.__write(record)
+
+        record["status"] = self.RUNNING
+        record["started_at"] = datetime.now().isoformat()
+        self.__write(record)
+        try:
+            if self.single_flight is None:
+                record["result"] = self.engine.run(
+                    record["suite"], progress, record["deadline_secs"])
+            else:
+                record["result"] = self.single_flight.run(
+                    record["suite"],
+                    lambda: self.engine.run(record["suite"], progress),
+                    record["deadline_secs"])
+            record["status"] = self.FINISHED
+        except Exception as err:
+            self.logger.error(traceback.format_exc())
+            record["status"] = self.FAILED
+            record["result"] = {"num_failed": 1,
+                                "tests_failed": [record["suite"]],
+                                "info": {"Run failed with exception":
+                                         {"status_code": 500,
+                                          "text": str(err)}}}
+        record["finished_at"] = datetime.now().isoformat()
+        with record_lock:
+            self.__write(record)
+
+    def __get_executor(self):
+        # The executor is created lazily, and again after a fork, so that
+        # each gunicorn worker owns its own threads.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="run")
+                self._pid = os.getpid()
+            return self._executor
+
+    def __path(self, run_id):
+        # Run IDs are uuid4 hex strings; anything else cannot be a file
+        # we wrote.
+        if not run_id.isalnum():
+            return None
+        return os.path.join(self.state_dir, f"{run_id}.json")
+
+    def __write(self, record):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self.__path(record["run_id"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def __prune(self):
+        if not os.path.isdir(self.state_dir):
+            return
+        cutoff = time.time() - self.retention_secs
+        with os.scandir(self.state_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".json") and \
+                            entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
@@ -0,0 +1,187 @@
+import os
+import time
+import shutil
+import logging
+import secrets
+import tempfile
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+from app.submission_zip import rewrite_pq_id
+
+MONGO_TAG_FIELD = "integration_test_run"
+# run IDs have the shape of a ProQuest ID
+RUN_ID_DIGITS = 10
+
+
+def run_id_prefix():
+    """
+    RUN_ID_PREFIX (default "99"): the leading digits of every run ID, a
+    range real ProQuest IDs never use.
+    """
+    prefix = os.getenv("RUN_ID_PREFIX", "99")
+    if not prefix.isdigit() or len(prefix) >= RUN_ID_DIGITS - 4:
+        raise ValueError(f"RUN_ID_PREFIX must be 1 to {RUN_ID_DIGITS - 5} "
+                         f"digits: {prefix!r}")
+    return prefix
+
+
+def new_run_id():
+    """
+    Returns a random run ID in the reserved range.
+    """
+    prefix = run_id_prefix()
+    digits = RUN_ID_DIGITS - len(prefix)
+    return f"{prefix}{secrets.randbelow(10 ** digits):0{digits}d}"
+
+
+def is_reserved_identifier(identifier):
+    """
+    Whether a PQ ID or DASH identifier is one the harness gave out: a run
+    ID, or a run ID followed by a submission number (see base_name()).
+    Anything else may be a real submission and must not be deleted.
+    """
+    identifier = str(identifier)
+    return identifier.isdigit() and \
+        identifier.startswith(run_id_prefix()) and \
+        len(identifier) in (RUN_ID_DIGITS, RUN_ID_DIGITS + 2)
+
+
+class RunNamespace():
+    """
+    The names one run of a suite gives to everything it creates, so runs
+    in different gunicorn workers (or threads of one composite or load
+    run) never touch each other's objects:
+
+    - pq_id: a ProQuest ID of its own, written into the run's copies of
+      the fixtures (see submission_fixture()). The ETD services deposit
+      those with it as dc.identifier.other, so it is also the DASH
+      identifier the run searches for and deletes. Run IDs start with
+      RUN_ID_PREFIX, which real ProQuest IDs never do, and DASH items
+      are only deleted if is_reserved_identifier() says so.
+    - base_name(): unique submission file names
+      (submission_<base_name>.zip), and so unique
+      proquest<ts>-<base_name>-<school> batch directories.
+    - directory(): directory names the run creates itself, e.g. in
+      ETD_IN_DIR, start with dir_prefix.
+    - tag(): Mongo records the run inserts carry MONGO_TAG_FIELD, and
+      cleanup only ever deletes the run's own records (see
+      cleanup_filter()).
+    - stamp: unique DIMS package ids and OSNs.
+
+    Usage:
+        with RunNamespace() as namespace:
+            fixture = namespace.submission_fixture(
+                "./testdata/submission_999999.zip")
+            ...
+    """
+
+    def __init__(self, run_id=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if run_id is None:
+            run_id = new_run_id()
+        elif not is_reserved_identifier(run_id) or \
+                len(run_id) != RUN_ID_DIGITS:
+            raise ValueError(f"Run ID {run_id} is not {RUN_ID_DIGITS} "
+                             f"digits starting with {run_id_prefix()}")
+        self.run_id = run_id
+        self.pq_id = self.run_id
+        self.dash_identifier = self.pq_id
+        self.dir_prefix = f"itest_{self.run_id}_"
+        self.stamp = f"{int(time.time())}_{self.run_id}"
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._fixtures = {}
+        self._tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def base_name(self):
+        """
+        Returns a new submission base name, unique to this run.
+        """
+        with self._lock:
+            return f"{self.run_id}{next(self._counter):02d}"
+
+    def directory(self, name):
+        """
+        Returns the run's name for a directory it creates.
+        """
+        return f"{self.dir_prefix}{name}"
+
+    def tag(self, record):
+        """
+        Returns a copy of a Mongo record tagged with the run.
+        """
+        return dict(record, **{MONGO_TAG_FIELD: self.run_id})
+
+    def own_records(self, query=None):
+        """
+        Returns a Mongo filter for the run's own records.
+        """
+        return dict(query or {}, **{MONGO_TAG_FIELD: self.run_id})
+
+    def cleanup_filters(self, query, stale_field=None):
+        """
+        Returns the Mongo filters a run may delete with before it
+        inserts: its own records, records from before runs were tagged,
+        and, with stale_field (an ISO timestamp field), tagged records
+        older than RUN_NAMESPACE_STALE_SECS (default a day), whose runs
+        are long over. Records of runs in progress are left alone.
+
+        Args:
+            query (dict): What the records have in common, e.g.
+                {"proquest_id": ...}.
+            stale_field (str, optional): The record's creation time.
+
+        Returns:
+            list: Filters to pass to delete_many, one at a time.
+        """
+        filters = [self.own_records(query),
+                   dict(query, **{MONGO_TAG_FIELD: {"$exists": False}})]
+        if stale_field is not None:
+            stale_secs = int(os.getenv("RUN_NAMESPACE_STALE_SECS", 86400))
+            cutoff = datetime.now() - timedelta(seconds=stale_secs)
+            filters.append(dict(query, **{
+                stale_field: {"$lt": cutoff.isoformat()}}))
+        return filters
+
+    def submission_fixture(self, source_path):
+        """
+        Returns a copy of a submission fixture, under its own name, whose
+        mets.xml carries the run's PQ ID. Copies are made once per run
+        and removed by close().
+        """
+        with self._lock:
+            if source_path not in self._fixtures:
+                if self._tmp_dir is None:
+                    self._tmp_dir = tempfile.mkdtemp(
+                        prefix=self.dir_prefix)
+                dest_path = os.path.join(self._tmp_dir,
+                                         os.path.basename(source_path))
+                rewrite_pq_id(source_path, dest_path, self.pq_id)
+                self._fixtures[source_path] = dest_path
+            return self._fixtures[source_path]
+
+    def close(self):
+        """
+        Removes the run's fixture copies.
+        """
+        with self._lock:
+            if self._tmp_dir is not None:
+                shutil.rmtree(self._tmp_dir, ignore_errors=True)
+                self._tmp_dir = None
+            self._fixtures = {}
+
+    def as_dict(self):
+        return {"run_id": self.run_id,
+                "pq_id": self.pq_id,
+                "dash_identifier": self.dash_identifier,
+                "dir_prefix": self.dir_prefix,
+                "mongo_tag": {MONGO_TAG_FIELD: self.run_id}}
@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+import threading
+import socket
+from contextlib import contextmanager
+
+import paramiko
+import pysftp
+
+from app.circuit_breaker import get_breaker
+from app.deadline import clamp_timeout, current_deadline, note_failure
+from app.metrics import observe_call
+
+# errors in a session that mean the server or the link is gone, as
+# opposed to e.g. a missing file
+TRANSPORT_ERRORS = (paramiko.SSHException, EOFError, socket.timeout,
+                    ConnectionError)
+
+
+class SFTPSessionPool():
+    """
+    Keeps authenticated SFTP sessions open for reuse.
+
+    Sessions are keyed by (host, port, username, private key path), so
+    every dropbox operation in a process shares the TCP connection, key
+    exchange and authentication of an earlier one. Idle sessions are
+    evicted after idle_timeout seconds, sessions that sat idle longer
+    than liveness_check_secs are checked with a round trip before they
+    are handed out, and no more than max_per_host sessions are open to
+    one host at a time.
+
+    Each host:port has a circuit breaker ("SFTP <host>:<port>"): failed
+    logins and transport errors count against it, and while it is open
+    new sessions fail at once with CircuitOpenError.
+
+    During a run with a deadline (see app.deadline), waiting for a
+    session and every read and write on it give up when the run's budget
+    runs out. A session that ends in a transport error, such as one of
+    those timeouts, is closed rather than returned to the pool.
+
+    Each session, from checkout to checkin, is counted and timed as an
+    "SFTP" call in app.metrics.
+    """
+
+    def __init__(self, max_per_host=None, idle_timeout=None,
+                 liveness_check_secs=None, checkout_timeout=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if max_per_host is None:
+            max_per_host = int(os.getenv("SFTP_MAX_SESSIONS_PER_HOST", 4))
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv("SFTP_IDLE_TIMEOUT_SECS", 300))
+        if liveness_check_secs is None:
+            liveness_check_secs = float(
+                os.getenv("SFTP_LIVENESS_CHECK_SECS", 30))
+        if checkout_timeout is None:
+            checkout_timeout = float(os.getenv("SFTP_CHECKOUT_TIMEOUT_SECS",
+                                               60))
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.liveness_check_secs = liveness_check_secs
+        self.checkout_timeout = checkout_timeout
+        self._cond = threading.Condition()
+        # key -> list of (connection, returned_at)
+        self._idle = {}
+        # host -> number of open sessions, idle or checked out
+        self._open = {}
+        self._pid = os.getpid()
+        self.stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    @contextmanager
+    def session(self, host, username, private_key, port=None, cnopts=None):
+        """
+        Checks out a session for the duration of a with block.
+
+        Args:
+            host (str): The SFTP host, optionally as "host:port".
+            username (str): The user to log in as.
+            private_key (str): Path to the private key.
+            port (int, optional): The SSH port. Defaults to the port in
+                host, or SFTP_PORT (22).
+            cnopts (pysftp.CnOpts, optional): Connection options for new
+                sessions. Defaults to host keys from SFTP_KNOWN_HOSTS if
+                it is set, else ~/.ssh/known_hosts.
+
+        Yields:
+            pysftp.Connection: An open connection. Relative paths resolve
+                against the login directory.
+        """
+        if port is None:
+            name, sep, host_port = host.rpartition(":")
+            if sep and host_port.isdigit() and ":" not in name:
+                host, port = name, host_port
+            else:
+                port = os.getenv("SFTP_PORT", 22)
+        key = (host, int(port), username, private_key)
+        step = f"SFTP {username}@{host}"
+        with observe_call("SFTP"):
+            conn = self.__checkout(key, cnopts,
+                                   clamp_timeout(self.checkout_timeout,
+                                                 step))
+            try:
+                if current_deadline() is not None:
+                    conn.timeout = clamp_timeout(None, step)
+                yield conn
+            except Exception as err:
+                note_failure(step)
+                if isinstance(err, TRANSPORT_ERRORS):
+                    self.__breaker(key).record_failure()
+                    # e.g. a read timed out by the run deadline: the SFTP
+                    # packet stream may be left half read, so the
+                    # session is never handed to anyone else
+                    self.__discard(key, conn)
+                else:
+                    self.__checkin(key, conn)
+                raise
+            self.__checkin(key, conn)
+
+    def close_all(self):
+        """
+        Closes every idle session.
+        """
+        with self._cond:
+            self.__reset_after_fork()
+            for key, idle in self._idle.items():
+                for conn, _ in idle:
+                    self.__close(key, conn)
+            self._idle = {}
+            self._cond.notify_all()
+
+    def __checkout(self, key, cnopts, checkout_timeout):
+        host = key[0]
+        deadline = time.monotonic() + checkout_timeout
+        with self._cond:
+            while True:
+                self.__reset_after_fork()
+                self.__evict_idle()
+                idle = self._idle.get(key, [])
+                while idle:
+                    conn, returned_at = idle.pop()
+                    if self.__is_alive(conn, returned_at):
+                        self.stats["reused"] += 1
+                        return conn
+                    self.__close(key, conn)
+                if self._open.get(host, 0) < self.max_per_host:
+                    self._open[host] = self._open.get(host, 0) + 1
+                    break
+                # At the cap: make room by closing an idle session that
+                # was opened for another user or key on the same host.
+                if self.__close_idle_for_host(host):
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No SFTP session for {host} "
+                                       "became available within "
+                                       f"{checkout_timeout:.1f}s")
+                self._cond.wait(remaining)
+        if cnopts is None and os.getenv("SFTP_KNOWN_HOSTS"):
+            cnopts = pysftp.CnOpts(knownhosts=os.getenv("SFTP_KNOWN_HOSTS"))
+        try:
+            conn = self.__breaker(key).call(pysftp.Connection,
+                                            host=host, port=key[1],
+                                            username=key[2],
+                                            private_key=key[3],
+                                            cnopts=cnopts)
+        except Exception:
+            with self._cond:
+                self._open[host] -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self.stats["created"] += 1
+        self.logger.debug(f"Opened SFTP session to {key[2]}@{host}")
+        return conn
+
+    @staticmethod
+    def __breaker(key):
+        return get_breaker(f"SFTP {key[0]}:{key[1]}")
+
+    def __checkin(self, key, conn):
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            if self.__transport_active(conn):
+                # forget any cd() and run deadline so the next user
+                # starts afresh
+                conn.sftp_client.chdir(None)
+                conn.sftp_client.get_channel().settimeout(None)
+                self._idle.setdefault(key, []).append(
+                    (conn, time.monotonic()))
+            else:
+                self.__close(key, conn)
+            self._cond.notify_all()
+
+    def __discard(self, key, conn):
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            self.__close(key, conn)
+            self._cond.notify_all()
+
+    def __is_alive(self, conn, returned_at):
+        if not self.__transport_active(conn):
+            return False
+        if time.monotonic() - returned_at < self.liveness_check_secs:
+            return True
+        try:
+            conn.sftp_client.normalize(".")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def __transport_active(conn):
+        try:
+            return conn.sftp_client.get_channel().get_transport() \
+                .is_active()
+        except Exception:
+            return False
+
+    def __evict_idle(self):
+        now = time.monotonic()
+        for key, idle in self._idle.items():
+            keep = []
+            for conn, returned_at in idle:
+                if now - returned_at > self.idle_timeout:
+                    self.stats["evicted"] += 1
+                    self.__close(key, conn)
+                else:
+                    keep.append((conn, returned_at))
+            self._idle[key] = keep
+
+    def __close_idle_for_host(self, host):
+        for key, idle in self._idle.items():
+            if key[0] == host and idle:
+                conn, _ = idle.pop(0)
+                self.stats["evicted"] += 1
+                self.__close(key, conn)
+                return True
+        return False
+
+    def __close(self, key, conn):
+        # caller holds self._cond
+        self._open[key[0]] = max(0, self._open.get(key[0], 0) - 1)
+        try:
+            conn.close()
+        except Exception as err:
+            self.logger.debug(f"Error closing SFTP session: {err}")
+
+    def __reset_after_fork(self):
+        # Sessions inherited from the parent share its sockets; drop them
+        # without closing so the parent's sessions are left alone.
+        if os.getpid() != self._pid:
+            self._idle = {}
+            self._open = {}
+            self._pid = os.getpid()
+
+
+_sftp_pool = None
+_sftp_pool_lock = threading.Lock()
+
+
+def get_sftp_pool():
+    """
+    Returns the process-wide SFTP session pool.
+    """
+    global _sftp_pool
+    with _sftp_pool_lock:
+        if _sftp_pool is None:
+            _sftp_pool = SFTPSessionPool()
+        return _sftp_pool
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+
+from app.deadline import default_budget, not_run_result, run_deadline
+
+
+class SingleFlight():
+    """
+    Coalesces identical suite runs across gunicorn workers.
+
+    A run holds an exclusive flock on <state_dir>/<suite>.lock for as
+    long as it takes. A request for the same suite that finds the lock
+    taken waits for it instead of starting a second run, then returns
+    the result the run left in <state_dir>/<suite>.json. That result
+    also answers any request made within ttl_secs of the run finishing.
+
+    The kernel drops the lock when its holder exits, so a worker that
+    dies mid-run does not wedge anyone: the next waiter finds no fresh
+    result and runs the suite itself.
+
+    Runs are coalesced per suite and time budget: a request never gets
+    the result of a run with a different deadline_secs. The time a
+    request spends waiting comes out of its budget, and a waiter whose
+    budget runs out stops waiting and returns a 504 "<suite> not run"
+    result.
+
+    Results say how they were served in info["Single flight"]: "ran",
+    "joined" (attached to the run in flight), "cache" or "gave up"
+    (waited until the deadline).
+    """
+
+    RAN = "ran"
+    JOINED = "joined"
+    CACHE = "cache"
+    GAVE_UP = "gave up"
+    # how often a waiter with a deadline tries the lock again
+    POLL_SECS = 0.5
+
+    def __init__(self, state_dir=None, ttl_secs=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        if state_dir is None:
+            log_dir = os.getenv("LOG_DIR", "/home/etdadm/logs/etd_itest")
+            state_dir = os.getenv("SINGLE_FLIGHT_DIR",
+                                  f"{log_dir}/single_flight")
+        if ttl_secs is None:
+            ttl_secs = float(os.getenv("SINGLE_FLIGHT_TTL_SECS", 60))
+        self.state_dir = state_dir
+        self.ttl_secs = ttl_secs
+
+    def run(self, suite, function, deadline_secs=None):
+        """
+        Runs function for suite, unless an identical run is in flight or
+        finished within ttl_secs.
+
+        Args:
+            suite (str): The suite name.
+            function (callable): Runs the suite and returns its result
+                dictionary. It is called inside the request's run
+                deadline (see app.deadline), so the suite gets what is
+                left of the budget after any wait.
+            deadline_secs (float, optional): The run's time budget.
+                Defaults to RUN_DEADLINE_SECS. With the suite, the
+                coalescing key.
+
+        Returns:
+            dict: The result dictionary.
+        """
+        if not suite.replace("_", "").isalnum():
+            raise KeyError(f"Unknown suite: {suite}")
+        if deadline_secs is None:
+            deadline_secs = default_budget()
+        key = suite if deadline_secs is None \
+            else f"{suite}.{float(deadline_secs):g}s"
+        entry = self.__read(key)
+        if self.__fresh(entry):
+            return self.__served(entry, self.CACHE)
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        waiting_since = time.time()
+        with run_deadline(deadline_secs) as deadline, \
+                open(os.path.join(self.state_dir, f"{key}.lock"),
+                     "a") as lock_file:
+            joined = self.__lock(lock_file, suite, deadline)
+            if joined is None:
+                return self.__gave_up(suite, deadline)
+            try:
+                entry = self.__read(key)
+                # a waiter takes the result of the run it waited on,
+                # however short the TTL
+                if joined and entry is not None and \
+                        entry["finished_at"] >= waiting_since:
+                    return self.__served(entry, self.JOINED)
+                if self.__fresh(entry):
+                    return self.__served(entry, self.CACHE)
+                entry = {"suite": suite, "pid": os.getpid(),
+                         "deadline_secs": deadline_secs,
+                         "started_at": time.time()}
+                entry["result"] = function()
+                entry["finished_at"] = time.time()
+                self.__write(key, entry)
+                return self.__served(entry, self.RAN)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __lock(self, lock_file, suite, deadline):
+        """
+        Takes the lock, waiting for the run that holds it at most until
+        the deadline. Returns whether it had to wait, or None if the
+        deadline ran out first.
+        """
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            self.logger.info(f"{suite} is already running, waiting for "
+                             "its result")
+        if deadline is None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return True
+        while True:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.POLL_SECS, remaining))
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                pass
+
+    def __gave_up(self, suite, deadline):
+        deadline.exhausted(f"waiting for {suite}")
+        self.logger.warning(f"Not running {suite}: the run deadline ran "
+                            "out waiting for the run in flight")
+        result = not_run_result(suite, deadline)
+        result["info"]["Deadline"] = deadline.as_dict()
+        result["info"]["Single flight"] = {
+            "source": self.GAVE_UP,
+            "deadline_secs": deadline.budget_secs}
+        return result
+
+    def __fresh(self, entry):
+        return entry is not None and \
+            time.time() - entry["finished_at"] <= self.ttl_secs
+
+    def __served(self, entry, source):
+        result = entry["result"]
+        result["info"]["Single flight"] = {
+            "source": source,
+            "pid": entry["pid"],
+            "deadline_secs": entry.get("deadline_secs"),
+            "started_at": round(entry["started_at"], 3),
+            "finished_at": round(entry["finished_at"], 3),
+            "age_secs": round(time.time() - entry["finished_at"], 3)}
+        return result
+
+    def __read(self, key):
+        try:
+            with open(os.path.join(self.state_dir, f"{key}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __write(self, key, entry):
+        path = os.path.join(self.state_dir, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f, default=str)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as err:
+            # waiters then run the suite themselves
+            self.logger.warning(f"Could not store the {key} result: {err}")
@@ -0,0 +1,201 @@
+import os
+import time
+import errno
+import fcntl
+import logging
+import threading
+from collections import namedtuple
+
+FICLONE = 0x40049409
+COPY_CHUNK = 1024 * 1024
+DEFAULT_STRATEGIES = "reflink,hardlink,copy_file_range,sendfile,copy"
+
+# errors meaning "this strategy does not work here", as opposed to a real
+# failure such as a missing source file or a full disk
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY,
+                      errno.EINVAL, errno.ENOSYS, errno.EPERM, errno.EMLINK,
+                      errno.EBADF}
+
+logger = logging.getLogger('etd_int_tests')
+
+
+class StageResult(namedtuple("StageResult",
+                             "path strategy bytes elapsed_secs")):
+    """
+    The outcome of stage_file().
+
+    Attributes:
+        path (str): The staged file.
+        strategy (str): How it was staged: reflink, hardlink,
+            copy_file_range, sendfile or copy.
+        bytes (int): The size of the file.
+        elapsed_secs (float): How long staging took.
+    """
+
+    __slots__ = ()
+
+    @property
+    def bytes_per_sec(self):
+        if self.elapsed_secs <= 0:
+            return None
+        return round(self.bytes / self.elapsed_secs)
+
+    def as_dict(self):
+        return {"strategy": self.strategy, "bytes": self.bytes,
+                "elapsed_secs": self.elapsed_secs,
+                "bytes_per_sec": self.bytes_per_sec}
+
+
+def stage_file(source_path, dest_dir, strategies=None):
+    """
+    Places a copy of a fixture in dest_dir as cheaply as possible.
+
+    Strategies are tried in order until one works: a reflink (FICLONE,
+    on btrfs/XFS, which shares extents copy-on-write), a hardlink (same
+    filesystem), an in-kernel copy_file_range or sendfile, and finally a
+    buffered copy. The byte-copying strategies tell the kernel they are
+    done with the pages afterwards, so staging a large fixture does not
+    push the rest of the page cache out.
+
+    A hardlink shares the fixture's inode: anything that modifies the
+    staged file in place (rather than replacing or deleting it) changes
+    the fixture too. Leave hardlink out of STAGING_STRATEGIES if the
+    consumer of dest_dir does that.
+
+    The file is staged under a temporary name and renamed into place, so
+    nothing watching dest_dir sees a partial file.
+
+    Args:
+        source_path (str): The fixture.
+        dest_dir (str): The directory to stage it into.
+        strategies (list, optional): Strategy names to try, in order.
+            Defaults to STAGING_STRATEGIES.
+
+    Returns:
+        StageResult: The staged path and how it was staged.
+    """
+    if strategies is None:
+        strategies = os.getenv("STAGING_STRATEGIES", DEFAULT_STRATEGIES)
+        strategies = [s.strip() for s in strategies.split(",") if s.strip()]
+    dest_path = os.path.join(dest_dir, os.path.basename(source_path))
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    size = os.stat(source_path).st_size
+    # A leftover temporary file may be a hardlink to the fixture; unlink
+    # it rather than truncating it
+    _remove(tmp_path)
+
+    start = time.monotonic()
+    for strategy in strategies:
+        try:
+            _STRATEGIES[strategy](source_path, tmp_path, size)
+        except OSError as err:
+            _remove(tmp_path)
+            if err.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            logger.debug(f"Staging with {strategy} unavailable: {err}")
+            continue
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        os.replace(tmp_path, dest_path)
+        # rename() is a no-op if both names are links to the same file
+        _remove(tmp_path)
+        result = StageResult(dest_path, strategy, size,
+                             round(time.monotonic() - start, 6))
+        logger.info(f"Staged {source_path} to {dest_dir} "
+                    f"using {strategy}: {result.as_dict()}")
+        return result
+    raise OSError(errno.EOPNOTSUPP,
+                  f"No staging strategy worked for {source_path}",
+                  dest_path)
+
+
+def _reflink(source_path, tmp_path, size):
+    with open(source_path, "rb") as src, open(tmp_path, "xb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    _copy_mode(source_path, tmp_path)
+
+
+def _hardlink(source_path, tmp_path, size):
+    os.link(source_path, tmp_path)
+
+
+def _copy_file_range(source_path, tmp_path, size):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    with open(source_path, "rb") as src, open(tmp_path, "xb") as dst:
+        copied = 0
+        while copied < size:
+            n = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+            if n == 0:
+                break
+            copied += n
+        _drop_cache(src, dst)
+    _check_copied("copy_file_range", copied, size)
+    _copy_mode(source_path, tmp_path)
+
+
+def _sendfile(source_path, tmp_path, size):
+    with open(source_path, "rb") as src, open(tmp_path, "xb") as dst:
+        copied = 0
+        while copied < size:
+            n = os.sendfile(dst.fileno(), src.fileno(), copied,
+                            size - copied)
+            if n == 0:
+                break
+            copied += n
+        _drop_cache(src, dst)
+    _check_copied("sendfile", copied, size)
+    _copy_mode(source_path, tmp_path)
+
+
+def _copy(source_path, tmp_path, size):
+    buffer = bytearray(COPY_CHUNK)
+    view = memoryview(buffer)
+    with open(source_path, "rb", buffering=0) as src, \
+            open(tmp_path, "xb", buffering=0) as dst:
+        while True:
+            n = src.readinto(buffer)
+            if not n:
+                break
+            dst.write(view[:n])
+        _drop_cache(src, dst)
+    _copy_mode(source_path, tmp_path)
+
+
+def _check_copied(strategy, copied, size):
+    # copy_file_range returns 0 where it cannot copy between two
+    # filesystems; a short copy must fall through to the next strategy,
+    # not be renamed into place
+    if copied < size:
+        raise OSError(errno.EOPNOTSUPP,
+                      f"{strategy} stopped after {copied} of {size} bytes")
+
+
+def _drop_cache(*files):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for f in files:
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+def _copy_mode(source_path, tmp_path):
+    # shutil.copy kept the permission bits; keep doing so
+    os.chmod(tmp_path, os.stat(source_path).st_mode & 0o7777)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_STRATEGIES = {"reflink": _reflink,
+               "hardlink": _hardlink,
+               "copy_file_range": _copy_file_range,
+               "sendfile": _sendfile,
+               "copy": _copy}
@@ -0,0 +1,11 @@
+"""
+Local stand-ins for the services the integration suites talk to, so the
+suites can run hermetically (see StandIns and python -m app.standins).
+"""
+from app.standins.faults import Faults, InjectedFailure
+from app.standins.dims import DimsStandIn
+from app.standins.dspace import DSpaceStandIn
+from app.standins.mongo import MongoStandIn
+from app.standins.pipeline import PipelineStandIn
+from app.standins.sftp_server import SFTPStandIn
+from app.standins.stack import StandIns
@@ -0,0 +1,88 @@
+"""
+Runs the suites against local stand-ins.
+
+    python -m app.standins run [suite ...]
+        Runs the suites (default: every suite that can run against the
+        stand-ins) one after another and prints the results as JSON.
+    python -m app.standins serve
+        Starts the stand-ins, prints the environment that points at them
+        and waits for Ctrl-C, e.g. to run gunicorn against them.
+"""
+import sys
+import json
+import time
+import argparse
+import logging
+
+from app import configure_logger
+from app.standins.stack import StandIns
+
+# alma_service copies its fixtures from hardcoded /home/etdadm paths
+NOT_HERMETIC = {"alma_service"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.standins")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run suites")
+    run_parser.add_argument("suites", nargs="*")
+    run_parser.add_argument("--workdir",
+                            help="keep the stand-ins' files here")
+    serve_parser = commands.add_parser("serve", help="serve until Ctrl-C")
+    serve_parser.add_argument("--workdir",
+                              help="keep the stand-ins' files here")
+    args = parser.parse_args(argv)
+
+    configure_logger()
+    with StandIns(workdir=args.workdir) as stand_ins:
+        if args.command == "serve":
+            return serve(stand_ins)
+        return run(stand_ins, args.suites)
+
+
+def serve(stand_ins):
+    for key, value in sorted(stand_ins.env.items()):
+        print(f"{key}={value}")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run(stand_ins, suites):
+    # imported once the environment points at the stand-ins
+    from app.suites import suite_engine, PROBES
+
+    if not suites:
+        # every suite runs its own probes first
+        suites = ["connectivity"] + [name for name in suite_engine.suites
+                                     if name not in NOT_HERMETIC and
+                                     name not in PROBES]
+    results = {}
+    num_failed = 0
+    started = time.monotonic()
+    for name in suites:
+        suite_started = time.monotonic()
+        try:
+            result = suite_engine.run(name)
+        except Exception as err:
+            logging.getLogger('etd_int_tests').exception(f"{name} failed")
+            result = {"num_failed": 1, "tests_failed": [name],
+                      "info": {"Exception": {"status_code": 500,
+                                             "text": str(err)}}}
+        result["elapsed_secs"] = round(time.monotonic() - suite_started, 3)
+        results[name] = result
+        num_failed += result["num_failed"]
+    print(json.dumps({"num_failed": num_failed,
+                      "elapsed_secs": round(time.monotonic() - started, 3),
+                      "suites": results,
+                      "stand_ins": stand_ins.fault_stats()},
+                     indent=2, default=str))
+    return 1 if num_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
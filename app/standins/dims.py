@@ -0,0 +1,40 @@
+import json
+import threading
+from urllib.parse import urlsplit
+
+from app.standins.http_server import StandInHTTPServer, json_response
+
+
+class DimsStandIn(StandInHTTPServer):
+    """
+    A DIMS stand-in: GET on any path answers 200 (the connectivity
+    check) and POST /ingest accepts a DRS admin metadata payload,
+    checking that it names its files and source path. Accepted payloads
+    are kept in ingested.
+    """
+
+    name = "dims"
+
+    def __init__(self, host="127.0.0.1", port=0, faults=None):
+        super().__init__(host, port, faults)
+        self._lock = threading.Lock()
+        self.ingested = []
+
+    def handle(self, method, path, headers, body):
+        path = urlsplit(path).path
+        if method == "GET":
+            return json_response(200, {"status": "running"})
+
+        if method == "POST" and path.rstrip("/").endswith("/ingest"):
+            payload = json.loads(body or b"{}")
+            file_info = payload.get("admin_metadata", {}).get("file_info")
+            if not payload.get("package_id") or not file_info or \
+                    not payload.get("fs_source_path"):
+                return json_response(400, {"status": "failure",
+                                           "message": "Incomplete payload"})
+            with self._lock:
+                self.ingested.append(payload)
+            return json_response(200, {"status": "success",
+                                       "package_id": payload["package_id"]})
+
+        return json_response(404, {"error": f"No route for {path}"})
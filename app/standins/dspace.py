@@ -0,0 +1,106 @@
+import json
+import uuid
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlsplit
+
+from app.standins.http_server import StandInHTTPServer, json_response
+
+
+class DSpaceStandIn(StandInHTTPServer):
+    """
+    A DSpace 6 REST API (DASH) stand-in, serving the calls the suites
+    make under /rest:
+
+    - GET test: the connectivity check
+    - POST login: form email/password, answers with a JSESSIONID cookie
+    - POST items/find-by-metadata-field: items whose metadata has the
+      given key and value
+    - DELETE items/<uuid>: needs a JSESSIONID from login, 401 otherwise
+
+    Items are added by the pipeline stand-in (or add_item()) as
+    submissions are deposited.
+    """
+
+    name = "dspace"
+
+    def __init__(self, host="127.0.0.1", port=0, faults=None):
+        super().__init__(host, port, faults)
+        self._lock = threading.Lock()
+        self._items = {}
+        self._sessions = set()
+        self._next_handle = 1
+
+    @property
+    def rest_url(self):
+        return f"{self.url}/rest"
+
+    def add_item(self, identifier, name=None):
+        """
+        Adds an item with dc.identifier.other set to identifier.
+
+        Returns:
+            dict: The item, including its uuid and handle.
+        """
+        with self._lock:
+            item = {"uuid": str(uuid.uuid4()),
+                    "name": name or f"Submission {identifier}",
+                    "handle": f"1/{self._next_handle}",
+                    "type": "item",
+                    "metadata": [{"key": "dc.identifier.other",
+                                  "value": identifier}]}
+            item["link"] = f"/rest/items/{item['uuid']}"
+            self._next_handle += 1
+            self._items[item["uuid"]] = item
+            return dict(item)
+
+    def find(self, key, value):
+        with self._lock:
+            return [dict(item) for item in self._items.values()
+                    if {"key": key, "value": value} in item["metadata"]]
+
+    def expire_sessions(self):
+        """
+        Forgets every login, so the next DELETE answers 401.
+        """
+        with self._lock:
+            self._sessions.clear()
+
+    def handle(self, method, path, headers, body):
+        path = urlsplit(path).path
+        if not path.startswith("/rest/"):
+            return json_response(404, {"error": f"No route for {path}"})
+        route = path[len("/rest/"):]
+
+        if method == "GET" and route == "test":
+            return 200, {"Content-Type": "text/plain"}, \
+                b"REST api is running."
+
+        if method == "POST" and route == "login":
+            form = parse_qs(body.decode())
+            if not form.get("email") or not form.get("password"):
+                return json_response(401, {"error": "Login failed"})
+            session = uuid.uuid4().hex
+            with self._lock:
+                self._sessions.add(session)
+            return 200, {"Set-Cookie":
+                         f"JSESSIONID={session}; Path=/rest; HttpOnly"}, b""
+
+        if method == "POST" and route == "items/find-by-metadata-field":
+            query = json.loads(body or b"{}")
+            return json_response(200, self.find(query.get("key"),
+                                                query.get("value")))
+
+        if method == "DELETE" and route.startswith("items/"):
+            cookie = SimpleCookie(headers.get("Cookie", ""))
+            session = cookie["JSESSIONID"].value \
+                if "JSESSIONID" in cookie else None
+            item_uuid = route[len("items/"):]
+            with self._lock:
+                if session not in self._sessions:
+                    return json_response(401, {"error": "Unauthorized"})
+                if self._items.pop(item_uuid, None) is None:
+                    return json_response(404, {"error": "No such item"})
+            return 200, {}, b""
+
+        return json_response(404, {"error": f"No route for {path}"})
@@ -0,0 +1,75 @@
+import os
+import time
+import random
+import threading
+
+
+class InjectedFailure(Exception):
+    """
+    Raised by a stand-in when fault injection decides a call fails.
+    """
+
+
+class Faults():
+    """
+    Latency and failure injection for a stand-in.
+
+    Every call a stand-in serves goes through apply(): it sleeps for
+    latency_secs plus up to jitter_secs, then fails with probability
+    failure_rate. Settings can be changed while the stand-in runs.
+
+    Defaults come from STANDIN_<NAME>_LATENCY_SECS,
+    STANDIN_<NAME>_JITTER_SECS and STANDIN_<NAME>_FAILURE_RATE, e.g.
+    STANDIN_DSPACE_FAILURE_RATE=0.1.
+    """
+
+    def __init__(self, latency_secs=0.0, jitter_secs=0.0, failure_rate=0.0,
+                 seed=None):
+        self.latency_secs = latency_secs
+        self.jitter_secs = jitter_secs
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, name):
+        prefix = f"STANDIN_{name.upper()}_"
+        return cls(latency_secs=float(os.getenv(prefix + "LATENCY_SECS", 0)),
+                   jitter_secs=float(os.getenv(prefix + "JITTER_SECS", 0)),
+                   failure_rate=float(os.getenv(prefix + "FAILURE_RATE", 0)))
+
+    def apply(self):
+        """
+        Delays the call and decides whether it fails.
+
+        Returns:
+            bool: True if the call should fail.
+        """
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_secs
+            if self.jitter_secs:
+                delay += self._random.uniform(0, self.jitter_secs)
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay > 0:
+            time.sleep(delay)
+        return fail
+
+    def check(self, what="call"):
+        """
+        Like apply(), but raises InjectedFailure instead of returning
+        True.
+        """
+        if self.apply():
+            raise InjectedFailure(f"Injected failure of {what}")
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "failures": self.failures,
+                    "latency_secs": self.latency_secs,
+                    "jitter_secs": self.jitter_secs,
+                    "failure_rate": self.failure_rate}
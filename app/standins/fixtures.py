@@ -0,0 +1,71 @@
+import os
+import json
+import zipfile
+
+METS_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<mets xmlns="http://www.loc.gov/METS/">
+  <dmdSec ID="dmd_1">
+    <mdWrap MDTYPE="OTHER" OTHERMDTYPE="DIM">
+      <xmlData>
+        <dim:dim xmlns:dim="http://www.dspace.org/xmlns/dspace/dim">
+          <dim:field mdschema="dc" element="title">Stand-in submission</dim:field>
+          <dim:field mdschema="dc" element="identifier" qualifier="other">{pq_id}</dim:field>
+        </dim:dim>
+      </xmlData>
+    </mdWrap>
+  </dmdSec>
+</mets>
+"""  # noqa: E501
+
+# extra members per fixture, after mets.xml, the license and the thesis
+SUPPLEMENTS = {
+    "submission_five_gifs.zip": [f"figure_{n}.gif" for n in range(1, 6)],
+    "submission_opaque_gif.zip": ["opaque.gif"],
+    "submission_audio.zip": ["interview.mp3"],
+}
+
+NO_DASH_FIXTURE = "submission_no_dash.zip"
+NO_DASH_PQ_ID = "PQ-00000000"
+
+
+def write_fixtures(directory, manifest_path=None):
+    """
+    Writes small synthetic submission zips for every fixture in the DRS
+    manifest, plus submission_no_dash.zip, laid out the way the real
+    ProQuest submissions are: mets.xml carrying the PQ ID, a
+    setup_*.pdf license, the thesis and any supplements.
+
+    Args:
+        directory (str): Where to write them.
+        manifest_path (str, optional): Defaults to DRS_MANIFEST_FILE.
+
+    Returns:
+        dict: The manifest the fixtures were made from.
+    """
+    if manifest_path is None:
+        manifest_path = os.getenv("DRS_MANIFEST_FILE", "drs_manifest.json")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    os.makedirs(directory, exist_ok=True)
+    for name, entry in manifest.items():
+        write_submission(os.path.join(directory, name), entry["pq_id"],
+                         entry["thesis"], SUPPLEMENTS.get(name, []))
+    write_submission(os.path.join(directory, NO_DASH_FIXTURE), NO_DASH_PQ_ID,
+                     "thesis.pdf")
+    return manifest
+
+
+def write_submission(path, pq_id, thesis, supplements=()):
+    """
+    Writes one synthetic submission zip.
+    """
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("mets.xml", METS_TEMPLATE.format(pq_id=pq_id))
+        zf.writestr(f"setup_{pq_id}.pdf", _pdf("license"))
+        zf.writestr(thesis, _pdf(thesis))
+        for supplement in supplements:
+            zf.writestr(supplement, os.urandom(2048))
+
+
+def _pdf(title):
+    return f"%PDF-1.4\n% {title}\n%%EOF\n".encode()
@@ -0,0 +1,134 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.standins.faults import Faults
+
+
+def json_response(status, body, headers=None):
+    """
+    Builds a (status, headers, body) response with a JSON body.
+    """
+    headers = dict(headers or {})
+    headers["Content-Type"] = "application/json"
+    return status, headers, json.dumps(body).encode()
+
+
+class StandInHTTPServer():
+    """
+    Base class for the HTTP stand-ins: serves handle() on a local port
+    from a daemon thread, with HTTP/1.1 keep-alive so the shared HTTP
+    client's connection pooling behaves as it does against the real
+    services.
+
+    Subclasses set name (used for STANDIN_<NAME>_* fault settings) and
+    implement handle().
+    """
+
+    name = "http"
+
+    def __init__(self, host="127.0.0.1", port=0, faults=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.host = host
+        self.port = port
+        self.faults = faults if faults is not None \
+            else Faults.from_env(self.name)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port),
+                                           _make_handler(self))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.1},
+            name=f"standin-{self.name}", daemon=True)
+        self._thread.start()
+        self.logger.info(f"{self.name} stand-in listening on {self.url}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def handle(self, method, path, headers, body):
+        """
+        Serves one request.
+
+        Args:
+            method (str): GET, POST, DELETE, ...
+            path (str): The request path, including any query string.
+            headers (email.message.Message): The request headers.
+            body (bytes): The request body.
+
+        Returns:
+            tuple: (status, headers dict, body bytes)
+        """
+        return json_response(404, {"error": f"No route for {path}"})
+
+
+def _make_handler(stand_in):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body go out in separate writes; without this,
+        # keep-alive requests stall on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.__serve()
+
+        def do_POST(self):
+            self.__serve()
+
+        def do_PUT(self):
+            self.__serve()
+
+        def do_DELETE(self):
+            self.__serve()
+
+        def log_message(self, format, *args):
+            stand_in.logger.debug(f"{stand_in.name}: {format % args}")
+
+        def __serve(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            if stand_in.faults.apply():
+                status, headers, payload = json_response(
+                    503, {"status": "failure",
+                          "message": "Injected failure"})
+            else:
+                try:
+                    status, headers, payload = stand_in.handle(
+                        self.command, self.path, self.headers, body)
+                except Exception as err:
+                    stand_in.logger.exception(f"{stand_in.name} stand-in "
+                                              "failed")
+                    status, headers, payload = json_response(
+                        500, {"status": "failure", "message": str(err)})
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
@@ -0,0 +1,205 @@
+import copy
+import operator
+import threading
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+
+from app.standins.faults import Faults
+
+
+class MongoStandIn():
+    """
+    An in-memory stand-in for the MongoClient the suites use. Install it
+    with app.mongo_client.set_mongo_client().
+
+    Collections support the calls the suites make: insert_one, find,
+    find_one, update_one, update_many, delete_many, count_documents and
+    create_index, with equality, $in, $ne, $exists, $lt, $lte, $gt and
+    $gte filters and inclusion projections. watch() fails the way it does on a
+    standalone mongod, so StatusWatcher falls back to polling.
+    """
+
+    name = "mongo"
+
+    def __init__(self, faults=None):
+        self.faults = faults if faults is not None \
+            else Faults.from_env(self.name)
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = MongoStandInDatabase(self, name)
+            return self._databases[name]
+
+    @property
+    def admin(self):
+        return self["admin"]
+
+    def close(self):
+        pass
+
+
+class MongoStandInDatabase():
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MongoStandInCollection(self, name)
+            return self._collections[name]
+
+    def command(self, command):
+        _check(self.client.faults)
+        if command == "ping":
+            return {"ok": 1.0}
+        raise OperationFailure(f"no such command: '{command}'", code=59)
+
+
+class MongoStandInCollection():
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._documents = []
+        self._lock = threading.Lock()
+
+    @property
+    def faults(self):
+        return self.database.client.faults
+
+    def insert_one(self, document):
+        _check(self.faults)
+        document.setdefault("_id", ObjectId())
+        with self._lock:
+            self._documents.append(copy.deepcopy(document))
+        return InsertOneResult(document["_id"], True)
+
+    def find(self, filter=None, projection=None, max_time_ms=None):
+        # time limits are accepted like pymongo's, and never reached
+        _check(self.faults)
+        with self._lock:
+            matches = [copy.deepcopy(d) for d in self._documents
+                       if _matches(d, filter or {})]
+        return iter([_project(d, projection) for d in matches])
+
+    def find_one(self, filter=None, projection=None, max_time_ms=None):
+        return next(self.find(filter, projection), None)
+
+    def count_documents(self, filter, maxTimeMS=None):
+        return len(list(self.find(filter)))
+
+    def update_one(self, filter, update, upsert=False):
+        return self.__update(filter, update, upsert, many=False)
+
+    def update_many(self, filter, update, upsert=False):
+        return self.__update(filter, update, upsert, many=True)
+
+    def delete_many(self, filter):
+        _check(self.faults)
+        with self._lock:
+            keep = [d for d in self._documents if not _matches(d, filter)]
+            deleted = len(self._documents) - len(keep)
+            self._documents = keep
+        return DeleteResult({"n": deleted, "ok": 1.0}, True)
+
+    def create_index(self, keys, **kwargs):
+        _check(self.faults)
+        if isinstance(keys, str):
+            return f"{keys}_1"
+        return "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    def watch(self, *args, **kwargs):
+        _check(self.faults)
+        raise OperationFailure("The $changeStream stage is only supported "
+                               "on replica sets", code=40573)
+
+    def __update(self, filter, update, upsert, many):
+        _check(self.faults)
+        unsupported = set(update) - {"$set"}
+        if unsupported:
+            raise OperationFailure(f"Unsupported update: {unsupported}")
+        matched = 0
+        with self._lock:
+            for document in self._documents:
+                if _matches(document, filter):
+                    matched += 1
+                    document.update(copy.deepcopy(update.get("$set", {})))
+                    if not many:
+                        break
+            upserted_id = None
+            if not matched and upsert:
+                document = {k: v for k, v in filter.items()
+                            if not k.startswith("$")}
+                document.update(copy.deepcopy(update.get("$set", {})))
+                document["_id"] = upserted_id = ObjectId()
+                self._documents.append(document)
+        raw = {"n": matched or int(upserted_id is not None),
+               "nModified": matched, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+
+def _check(faults):
+    if faults.apply():
+        raise AutoReconnect("Injected failure")
+
+
+_MISSING = object()
+_COMPARISONS = {"$lt": operator.lt, "$lte": operator.le,
+                "$gt": operator.gt, "$gte": operator.ge}
+
+
+def _get(document, key):
+    value = document
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches(document, filter):
+    for key, condition in filter.items():
+        value = _get(document, key)
+        if isinstance(condition, dict) and condition and \
+                all(op.startswith("$") for op in condition):
+            for op, operand in condition.items():
+                if op == "$in":
+                    if value is _MISSING or value not in operand:
+                        return False
+                elif op == "$ne":
+                    if value is not _MISSING and value == operand:
+                        return False
+                elif op == "$exists":
+                    if (value is not _MISSING) != bool(operand):
+                        return False
+                elif op in _COMPARISONS:
+                    if value is _MISSING or \
+                            not _COMPARISONS[op](value, operand):
+                        return False
+                else:
+                    raise OperationFailure(f"Unsupported operator {op}")
+        elif value is _MISSING or value != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return document
+    fields = [k for k, v in projection.items() if v and k != "_id"]
+    projected = {k: document[k] for k in fields if k in document}
+    if projection.get("_id", 1) and "_id" in document:
+        projected["_id"] = document["_id"]
+    return projected
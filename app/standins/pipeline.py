@@ -0,0 +1,189 @@
+import os
+import re
+import logging
+import zipfile
+import threading
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+from celery.signals import after_task_publish
+
+from app.standins.faults import Faults
+from app.submission_zip import METS_NAME, PQ_ID_XPATH, DIM_NAMESPACES
+
+SUBMISSION_PATTERN = re.compile(r'^submission_(.+)\.zip$')
+
+
+class PipelineStandIn():
+    """
+    Stands in for the ETD services on the other end of the Celery
+    queues. It listens for tasks published from this process (with
+    BROKER_URL=memory:// nothing else would consume them) and does what
+    the services do that the suites check for:
+
+    - etd-dash-service send_to_dash: moves each submission in the
+      dropbox's incoming/<school> to archives/<school> (or, if it is
+      already archived, to dupe/<school>), deposits it in the DSpace
+      stand-in and writes ETD_OUT_DIR/proquest<ts>-<id>-<school>/mapfile;
+      a PQ ID DSpace already has gets an ETD_DUPE_DIR directory instead.
+      Only schools in STANDIN_DASH_SCHOOLS (default gsd) go to DASH.
+    - etd-alma-service send_to_alma: writes the Alma delivery file to the
+      Alma dropbox's incoming directory.
+    - etd-alma-monitor-service send_to_drs: moves ALMA_DROPBOX records to
+      SENT_TO_DIMS, or to FAILED when their directory is missing from
+      ETD_IN_DIR.
+
+    Tasks are handled one at a time on a background thread, after the
+    pipeline's latency and failure injection (STANDIN_PIPELINE_*); a
+    failed task is dropped, as a lost message would be. Submissions
+    still being uploaded are left for a later send_to_dash.
+    """
+
+    name = "pipeline"
+
+    def __init__(self, dropbox, alma_dropbox, dspace, collection=None,
+                 faults=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.dropbox = dropbox
+        self.dropbox_root = dropbox.root
+        self.alma_dropbox_root = alma_dropbox.root
+        self.dspace = dspace
+        self.collection = collection
+        self.faults = faults if faults is not None \
+            else Faults.from_env(self.name)
+        self.handled = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._handlers = {
+            "etd-dash-service.tasks.send_to_dash": self.send_to_dash,
+            "etd-alma-service.tasks.send_to_alma": self.send_to_alma,
+            "etd-alma-monitor-service.tasks.send_to_drs": self.send_to_drs,
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        after_task_publish.connect(self.__on_publish, weak=False,
+                                   dispatch_uid=self.__uid())
+        return self
+
+    def stop(self):
+        after_task_publish.disconnect(dispatch_uid=self.__uid())
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def __uid(self):
+        return f"standin-pipeline-{id(self)}"
+
+    def __on_publish(self, sender=None, body=None, **kwargs):
+        handler = self._handlers.get(sender)
+        if handler is None:
+            self.logger.warning(f"pipeline stand-in: no handler for {sender}")
+            return
+        # protocol 2 bodies are (args, kwargs, embed)
+        args, task_kwargs = body[0], body[1]
+        thread = threading.Thread(target=self.__run,
+                                  args=(sender, handler, args, task_kwargs),
+                                  name="standin-pipeline", daemon=True)
+        self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def __run(self, task_name, handler, args, kwargs):
+        if self.faults.apply():
+            self.logger.info(f"pipeline stand-in: dropped {task_name}")
+            return
+        with self._lock:
+            try:
+                handler(*args, **kwargs)
+            except Exception:
+                self.logger.exception(f"pipeline stand-in: {task_name} "
+                                      "failed")
+                return
+            self.handled[task_name] = self.handled.get(task_name, 0) + 1
+
+    def send_to_dash(self, message, **kwargs):
+        dash_schools = os.getenv("STANDIN_DASH_SCHOOLS", "gsd").split(",")
+        incoming = os.path.join(self.dropbox_root, "incoming")
+        for school in sorted(os.listdir(incoming)):
+            school_dir = os.path.join(incoming, school)
+            for name in sorted(os.listdir(school_dir)):
+                match = SUBMISSION_PATTERN.match(name)
+                if match and not self.dropbox.is_uploading(
+                        os.path.join(school_dir, name)):
+                    self.__deposit(school, name, match.group(1),
+                                   school in dash_schools)
+
+    def __deposit(self, school, name, base_name, to_dash):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        source = os.path.join(self.dropbox_root, "incoming", school, name)
+        archived = os.path.join(self.dropbox_root, "archives", school, name)
+        if os.path.exists(archived):
+            dupe = os.path.join(self.dropbox_root, "dupe", school,
+                                f"submission_{base_name}_{timestamp}.zip")
+            os.makedirs(os.path.dirname(dupe), exist_ok=True)
+            os.replace(source, dupe)
+            self.logger.info(f"pipeline stand-in: {name} already archived, "
+                             f"moved to dupe/{school}")
+            return
+        os.makedirs(os.path.dirname(archived), exist_ok=True)
+        os.replace(source, archived)
+        if not to_dash:
+            return
+
+        pq_id = read_pq_id(archived)
+        batch = f"proquest{timestamp}-{base_name}-{school}"
+        if self.dspace.find("dc.identifier.other", pq_id):
+            os.makedirs(os.path.join(os.getenv("ETD_DUPE_DIR"),
+                                     f"{batch}_{timestamp}"))
+            self.logger.info(f"pipeline stand-in: {pq_id} already in DASH")
+            return
+        item = self.dspace.add_item(pq_id)
+        out_dir = os.path.join(os.getenv("ETD_OUT_DIR"), batch)
+        os.makedirs(out_dir, exist_ok=True)
+        # written under another name and renamed, so watchers never see
+        # a partial mapfile
+        mapfile = os.path.join(out_dir, "mapfile")
+        with open(mapfile + ".tmp", "w") as f:
+            f.write(f"submission_{base_name} {item['handle']}\n")
+        os.replace(mapfile + ".tmp", mapfile)
+
+    def send_to_alma(self, message, **kwargs):
+        instance = os.getenv('INSTANCE', '')
+        if instance == 'prod':
+            instance = ''
+        stamp = datetime.now().strftime("%Y%m%d%H%M")
+        incoming = os.path.join(self.alma_dropbox_root, "incoming")
+        os.makedirs(incoming, exist_ok=True)
+        path = os.path.join(
+            incoming, f"AlmaDeliveryTest{instance.capitalize()}_{stamp}.xml")
+        with open(path, "w") as f:
+            f.write("<collection/>\n")
+
+    def send_to_drs(self, message, **kwargs):
+        for record in self.collection.find(
+                {"alma_submission_status": "ALMA_DROPBOX"}):
+            directory = os.path.join(os.getenv("ETD_IN_DIR"),
+                                     record["directory_id"])
+            status = "SENT_TO_DIMS" if os.path.isdir(directory) \
+                else "FAILED"
+            self.collection.update_one(
+                {"_id": record["_id"]},
+                {"$set": {"alma_submission_status": status,
+                          "last_modified_date":
+                          datetime.now().isoformat()}})
+
+
+def read_pq_id(zip_path):
+    """
+    Returns the ProQuest ID (dc.identifier.other) in a submission's
+    mets.xml.
+    """
+    with zipfile.ZipFile(zip_path) as zf:
+        root = ET.fromstring(zf.read(METS_NAME))
+    return root.find(PQ_ID_XPATH, DIM_NAMESPACES).text
@@ -0,0 +1,289 @@
+import os
+import socket
+import posixpath
+import logging
+import threading
+
+import paramiko
+from paramiko.sftp import SFTP_OK, SFTP_FAILURE, SFTP_NO_SUCH_FILE, \
+    SFTP_PERMISSION_DENIED
+
+from app.standins.faults import Faults
+
+
+class SFTPStandIn():
+    """
+    An SFTP server (the ProQuest and Alma dropboxes) serving a local
+    directory.
+
+    Any user name is accepted with the client key the stand-in
+    generates (client_key_path). The server's host key is written to
+    known_hosts_path for SFTP_KNOWN_HOSTS. Pass host_key and client_key
+    (e.g. another stand-in's) to reuse keys instead; pysftp looks host
+    keys up by host name alone, so stand-ins on the same host must share
+    one. Paths are resolved against
+    root, which is also the login directory.
+
+    Files are written in place, as on the real dropboxes; is_uploading()
+    tells whether a client still has one open for writing.
+    """
+
+    name = "sftp"
+
+    def __init__(self, root, host="127.0.0.1", port=0, faults=None,
+                 key_dir=None, host_key=None, client_key=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.root = os.path.realpath(root)
+        self.host = host
+        self.port = port
+        self.faults = faults if faults is not None \
+            else Faults.from_env(self.name)
+        self.key_dir = key_dir or self.root
+        self.client_key_path = None
+        self.known_hosts_path = None
+        self.host_key = host_key
+        self.client_key = client_key
+        self._socket = None
+        self._thread = None
+        self._transports = []
+        self._stop = threading.Event()
+        self._writing = {}
+        self._writing_lock = threading.Lock()
+
+    @property
+    def address(self):
+        """
+        "host:port", as accepted by the SFTP session pool.
+        """
+        return f"{self.host}:{self.port}"
+
+    def is_uploading(self, local_path):
+        """
+        Returns True while a client has local_path open for writing.
+        """
+        with self._writing_lock:
+            return self._writing.get(os.path.realpath(local_path), 0) > 0
+
+    def _track_write(self, local_path, delta):
+        local_path = os.path.realpath(local_path)
+        with self._writing_lock:
+            count = self._writing.get(local_path, 0) + delta
+            if count > 0:
+                self._writing[local_path] = count
+            else:
+                self._writing.pop(local_path, None)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        os.makedirs(self.key_dir, exist_ok=True)
+        if self.host_key is None:
+            self.host_key = paramiko.RSAKey.generate(2048)
+        if self.client_key is None:
+            self.client_key = paramiko.RSAKey.generate(2048)
+        self.client_key_path = os.path.join(self.key_dir, "id_rsa")
+        self.client_key.write_private_key_file(self.client_key_path)
+        self.known_hosts_path = os.path.join(self.key_dir, "known_hosts")
+        with open(self.known_hosts_path, "w") as f:
+            f.write(f"{self.host} {self.host_key.get_name()} "
+                    f"{self.host_key.get_base64()}\n")
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(16)
+        self._socket.settimeout(0.2)
+        self.port = self._socket.getsockname()[1]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.__accept,
+                                        name="standin-sftp", daemon=True)
+        self._thread.start()
+        self.logger.info(f"sftp stand-in listening on {self.address}, "
+                         f"serving {self.root}")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+    def __accept(self):
+        while not self._stop.is_set():
+            try:
+                sock, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer,
+                                            _SFTPServer, stand_in=self)
+            try:
+                transport.start_server(
+                    server=_Server(self.client_key))
+            except (paramiko.SSHException, EOFError, OSError) as err:
+                self.logger.debug(f"sftp stand-in handshake failed: {err}")
+                continue
+            self._transports = [t for t in self._transports
+                                if t.is_active()] + [transport]
+
+
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, client_key):
+        self.client_key = client_key
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_auth_publickey(self, username, key):
+        if key == self.client_key:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+
+    def __init__(self, flags, stand_in=None):
+        super().__init__(flags)
+        self.stand_in = stand_in
+
+    def close(self):
+        super().close()
+        if self.stand_in is not None:
+            self.stand_in._track_write(self.filename, -1)
+            self.stand_in = None
+
+    def stat(self):
+        f = getattr(self, "readfile", None) or getattr(self, "writefile")
+        return paramiko.SFTPAttributes.from_stat(os.fstat(f.fileno()))
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+
+    def __init__(self, server, *args, stand_in=None, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.stand_in = stand_in
+        self.root = stand_in.root
+        self.faults = stand_in.faults
+
+    def canonicalize(self, path):
+        return _normalize(path)
+
+    def list_folder(self, path):
+        if self.faults.apply():
+            return SFTP_FAILURE
+        local = self.__local(path)
+        try:
+            entries = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(
+                    os.lstat(os.path.join(local, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+
+    def stat(self, path):
+        if self.faults.apply():
+            return SFTP_FAILURE
+        try:
+            return paramiko.SFTPAttributes.from_stat(
+                os.stat(self.__local(path)))
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+
+    def lstat(self, path):
+        return self.stat(path)
+
+    def open(self, path, flags, attr):
+        if self.faults.apply():
+            return SFTP_FAILURE
+        local = self.__local(path)
+        try:
+            fd = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o644)
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+        writing = bool(flags & (os.O_WRONLY | os.O_RDWR))
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = _SFTPHandle(flags, self.stand_in if writing else None)
+        if writing:
+            self.stand_in._track_write(local, 1)
+        f = os.fdopen(fd, mode)
+        handle.filename = local
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        return self.__call(os.remove, self.__local(path))
+
+    def rename(self, oldpath, newpath):
+        return self.__call(os.rename, self.__local(oldpath),
+                           self.__local(newpath))
+
+    def posix_rename(self, oldpath, newpath):
+        return self.__call(os.replace, self.__local(oldpath),
+                           self.__local(newpath))
+
+    def mkdir(self, path, attr):
+        return self.__call(os.mkdir, self.__local(path))
+
+    def rmdir(self, path):
+        return self.__call(os.rmdir, self.__local(path))
+
+    def chattr(self, path, attr):
+        if not os.path.exists(self.__local(path)):
+            return SFTP_NO_SUCH_FILE
+        return SFTP_OK
+
+    def symlink(self, target_path, path):
+        return SFTP_PERMISSION_DENIED
+
+    def readlink(self, path):
+        return SFTP_PERMISSION_DENIED
+
+    def __call(self, function, *args):
+        if self.faults.apply():
+            return SFTP_FAILURE
+        try:
+            function(*args)
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def __local(self, path):
+        return os.path.join(self.root, _normalize(path).lstrip("/"))
+
+
+def _normalize(path):
+    # relative paths start at the login directory (the root) and ".."
+    # cannot climb out of it
+    return "/" + posixpath.normpath("/" + path).lstrip("/")
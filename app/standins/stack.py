@@ -0,0 +1,203 @@
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import importlib
+
+from app.mongo_client import set_mongo_client
+from app.sftp_pool import get_sftp_pool
+from app.standins.dims import DimsStandIn
+from app.standins.dspace import DSpaceStandIn
+from app.standins.fixtures import write_fixtures
+from app.standins.mongo import MongoStandIn
+from app.standins.pipeline import PipelineStandIn
+from app.standins.sftp_server import SFTPStandIn
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+SCHOOLS = ["gsd", "college"]
+
+# waits settle in well under a second against the stand-ins; only set
+# where the environment does not already say otherwise
+FAST_POLLING = {"POLL_INITIAL_SECS": "0.05",
+                "POLL_MAX_INTERVAL_SECS": "0.2",
+                "POLL_TIMEOUT_SECS": "10",
+                "SLEEP_SECS": "1",
+                "LOAD_RATE_PER_MIN": "600",
+                "LOAD_SUBMISSIONS": "10",
+                "LOAD_BUCKET_SECS": "1"}
+
+
+class StandIns():
+    """
+    Runs every external dependency of the suites locally: the DSpace
+    REST API (DASH), DIMS, the ProQuest and Alma SFTP dropboxes, Mongo
+    and, with an in-memory Celery broker, the ETD services themselves
+    (see PipelineStandIn).
+
+    On start the stand-ins get a fresh working directory (the dropboxes,
+    ETD_IN_DIR/ETD_OUT_DIR/ETD_DUPE_DIR, synthetic fixtures in
+    testdata/, logs) and the environment is pointed at them; stop()
+    restores the environment and removes the directory. With
+    chdir=True the process also runs from the working directory, since
+    the suites read fixtures from ./testdata.
+
+    Usage:
+        with StandIns() as stand_ins:
+            suite_engine.run("dash_service")
+    """
+
+    def __init__(self, workdir=None, chdir=True, keep=False):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.workdir = workdir
+        self.chdir = chdir
+        self.keep = keep or workdir is not None
+        self.env = {}
+        self.dspace = None
+        self.dims = None
+        self.dropbox = None
+        self.alma_dropbox = None
+        self.mongo = None
+        self.pipeline = None
+        self._saved_env = {}
+        self._saved_cwd = None
+        self._started = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        if self.workdir is None:
+            self.workdir = tempfile.mkdtemp(prefix="etd-standins-")
+        self.workdir = os.path.realpath(self.workdir)
+        try:
+            self.__start()
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def __start(self):
+        path = self.__path
+        for root in ("dropbox", "alma_dropbox"):
+            for kind in ("incoming", "archives", "dupe"):
+                for school in SCHOOLS:
+                    os.makedirs(path(root, kind, school), exist_ok=True)
+        for directory in ("etd/in", "etd/out", "etd/dupe", "logs", "keys"):
+            os.makedirs(path(directory), exist_ok=True)
+        manifest = write_fixtures(path("testdata"),
+                                  os.path.join(REPO_ROOT,
+                                               "drs_manifest.json"))
+
+        self.dspace = self.__run(DSpaceStandIn())
+        self.dims = self.__run(DimsStandIn())
+        self.dropbox = self.__run(SFTPStandIn(path("dropbox"),
+                                              key_dir=path("keys",
+                                                           "dropbox")))
+        self.alma_dropbox = self.__run(SFTPStandIn(
+            path("alma_dropbox"), key_dir=path("keys", "alma"),
+            host_key=self.dropbox.host_key,
+            client_key=self.dropbox.client_key))
+        self.mongo = MongoStandIn()
+        set_mongo_client(self.mongo)
+
+        self.env = {
+            "DASH_REST_URL": self.dspace.rest_url,
+            "DASH_LOGIN_EMAIL": "standin@example.org",
+            "DASH_LOGIN_PW": "standin",
+            "DIMS_URL": self.dims.url,
+            "DIMS_ENDPOINT": self.dims.url,
+            "dropboxServer": self.dropbox.address,
+            "dropboxUser": "proquest",
+            "PRIVATE_KEY_PATH": self.dropbox.client_key_path,
+            "ALMA_DROPBOX_SERVER": self.alma_dropbox.address,
+            "ALMA_DROPBOX_USER": "alma",
+            "ALMA_PRIVATE_KEY_PATH": self.alma_dropbox.client_key_path,
+            "SFTP_KNOWN_HOSTS": self.dropbox.known_hosts_path,
+            "BROKER_URL": "memory://",
+            "MONGO_DBNAME": "standins",
+            "MONGO_COLLECTION": "integration_test",
+            "ETD_IN_DIR": path("etd", "in"),
+            "ETD_OUT_DIR": path("etd", "out"),
+            "ETD_DUPE_DIR": path("etd", "dupe"),
+            "TEST_DATA_DIRECTORY": path("testdata"),
+            "SUBMISSION_PQ_ID":
+                manifest["submission_999999.zip"]["pq_id"],
+            "LOG_DIR": path("logs"),
+            "RUN_STATE_DIR": path("logs", "runs"),
+            "TIMELINE_DIR": path("logs", "timelines"),
+            "MESSAGE_FILE": os.path.join(REPO_ROOT, "message.json"),
+            "ALMA_MESSAGE_FILE": os.path.join(REPO_ROOT,
+                                              "alma_message.json"),
+            "DRS_MANIFEST_FILE": os.path.join(REPO_ROOT,
+                                              "drs_manifest.json"),
+        }
+        for key, value in FAST_POLLING.items():
+            self.env.setdefault(key, os.getenv(key, value))
+        for key, value in self.env.items():
+            self._saved_env[key] = os.environ.get(key)
+            os.environ[key] = value
+        # celeryconfig reads BROKER_URL when it is imported
+        if "celeryconfig" in sys.modules:
+            importlib.reload(sys.modules["celeryconfig"])
+
+        self.pipeline = self.__run(PipelineStandIn(
+            self.dropbox, self.alma_dropbox, self.dspace,
+            self.mongo[self.env["MONGO_DBNAME"]][
+                self.env["MONGO_COLLECTION"]]))
+
+        if self.chdir:
+            if REPO_ROOT not in sys.path:
+                sys.path.insert(0, REPO_ROOT)
+            self._saved_cwd = os.getcwd()
+            os.chdir(self.workdir)
+        self.logger.info(f"Stand-ins running in {self.workdir}")
+
+    def stop(self):
+        for stand_in in reversed(self._started):
+            try:
+                stand_in.stop()
+            except Exception:
+                self.logger.exception(f"Could not stop {stand_in.name} "
+                                      "stand-in")
+        self._started = []
+        get_sftp_pool().close_all()
+        if self.mongo is not None:
+            set_mongo_client(None)
+            self.mongo = None
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self._saved_env = {}
+        if self._saved_cwd is not None:
+            os.chdir(self._saved_cwd)
+            self._saved_cwd = None
+        if not self.keep and self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def fault_stats(self):
+        """
+        Returns the calls and injected failures of each stand-in.
+        """
+        stand_ins = {"dspace": self.dspace, "dims": self.dims,
+                     "dropbox": self.dropbox,
+                     "alma_dropbox": self.alma_dropbox,
+                     "mongo": self.mongo, "pipeline": self.pipeline}
+        return {name: stand_in.faults.stats()
+                for name, stand_in in stand_ins.items()
+                if stand_in is not None}
+
+    def __run(self, stand_in):
+        stand_in.start()
+        self._started.append(stand_in)
+        return stand_in
+
+    def __path(self, *parts):
+        return os.path.join(self.workdir, *parts)
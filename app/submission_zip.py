@@ -0,0 +1,247 @@
+import io
+import os
+import zlib
+import struct
+import logging
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+
+METS_NAME = "mets.xml"
+PQ_ID_XPATH = (".//dim:field[@mdschema='dc'][@element='identifier']"
+               "[@qualifier='other']")
+DIM_NAMESPACES = {'dim': 'http://www.dspace.org/xmlns/dspace/dim'}
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIG = 0x04034b50
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+CENTRAL_HEADER_SIG = 0x02014b50
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD_SIG = 0x06054b50
+ZIP64_LOCATOR_SIG = 0x07064b50
+DATA_DESCRIPTOR_SIG = 0x08074b50
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_ENCRYPTED = 0x01
+COPY_CHUNK = 1024 * 1024
+
+logger = logging.getLogger('etd_int_tests')
+
+
+class UnsupportedZip(Exception):
+    """
+    Raised for archives the streaming rewrite does not handle (zip64,
+    encrypted or unusually compressed members); rewrite_member() falls
+    back to a full in-memory rewrite for them.
+    """
+
+
+def rewrite_pq_id(source_path, dest_path, new_pq_id):
+    """
+    Writes a copy of a submission zip whose mets.xml carries a new
+    ProQuest ID (dc.identifier.other).
+
+    Args:
+        source_path (str): The submission zip to read.
+        dest_path (str): Where to write the new zip. May be the same as
+            source_path.
+        new_pq_id (str): The new ProQuest ID.
+    """
+    def set_pq_id(data):
+        tree = ET.parse(io.BytesIO(data))
+        tree.getroot().find(PQ_ID_XPATH, DIM_NAMESPACES).text = new_pq_id
+        out = io.BytesIO()
+        tree.write(out)
+        return out.getvalue()
+
+    rewrite_member(source_path, dest_path, METS_NAME, set_pq_id)
+
+
+def rewrite_member(source_path, dest_path, member, transform):
+    """
+    Streams a zip archive to dest_path, replacing one member.
+
+    Every other member is copied as raw compressed bytes: nothing is
+    extracted to disk and nothing but the replaced member is
+    decompressed or recompressed. The archive is written to a temporary
+    file next to dest_path and renamed into place, so concurrent calls
+    with distinct destinations never see each other's files.
+
+    Args:
+        source_path (str): The zip to read.
+        dest_path (str): The zip to write.
+        member (str): The name of the member to replace.
+        transform (callable): Called with the member's bytes, returns
+            the new bytes.
+    """
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            _stream_rewrite(source_path, tmp_path, member, transform)
+        except UnsupportedZip as err:
+            logger.debug(f"Rewriting {source_path} in memory: {err}")
+            _rewrite_in_memory(source_path, tmp_path, member, transform)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _stream_rewrite(source_path, tmp_path, member, transform):
+    with open(source_path, "rb", buffering=0) as src, \
+            zipfile.ZipFile(source_path) as archive:
+        end_record, comment = _read_end_record(src)
+        (_, _, _, _, entries, cd_size, cd_offset, _) = end_record
+        src.seek(cd_offset)
+        central_dir = _read_exact(src, cd_size)
+
+        records = []
+        pos = 0
+        for _ in range(entries):
+            fields = list(CENTRAL_HEADER.unpack_from(central_dir, pos))
+            if fields[0] != CENTRAL_HEADER_SIG:
+                raise UnsupportedZip("bad central directory")
+            name_len, extra_len, comment_len = fields[10:13]
+            size = CENTRAL_HEADER.size + name_len + extra_len + comment_len
+            raw = central_dir[pos:pos + size]
+            name = raw[CENTRAL_HEADER.size:CENTRAL_HEADER.size + name_len]
+            records.append((fields, raw, name))
+            pos += size
+        if not any(name.decode("utf-8", "replace") == member
+                   for _, _, name in records):
+            raise KeyError(f"There is no item named {member!r} "
+                           "in the archive")
+
+        with open(tmp_path, "wb", buffering=0) as dst:
+            central = []
+            for fields, raw, name in records:
+                flags, method = fields[3], fields[4]
+                if 0xFFFFFFFF in (fields[8], fields[9], fields[16]):
+                    raise UnsupportedZip("zip64 member")
+                new_offset = dst.tell()
+                if name.decode("utf-8", "replace") == member:
+                    if flags & FLAG_ENCRYPTED or \
+                            method not in (zipfile.ZIP_STORED,
+                                           zipfile.ZIP_DEFLATED):
+                        raise UnsupportedZip(f"cannot rewrite {member}")
+                    data = transform(archive.read(member))
+                    crc = zlib.crc32(data)
+                    if method == zipfile.ZIP_DEFLATED:
+                        compressor = zlib.compressobj(
+                            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+                        payload = compressor.compress(data) + \
+                            compressor.flush()
+                    else:
+                        payload = data
+                    local = _read_local_header(src, fields[16])
+                    header = list(LOCAL_HEADER.unpack_from(local))
+                    header[2] = flags & ~FLAG_DATA_DESCRIPTOR
+                    header[6:9] = [crc, len(payload), len(data)]
+                    dst.write(LOCAL_HEADER.pack(*header) +
+                              local[LOCAL_HEADER.size:])
+                    dst.write(payload)
+                    fields[3] = flags & ~FLAG_DATA_DESCRIPTOR
+                    fields[7:10] = [crc, len(payload), len(data)]
+                else:
+                    start = fields[16]
+                    length = _stored_length(src, start, fields[8], flags)
+                    _copy_range(src, dst, start, length)
+                fields[16] = new_offset
+                central.append(CENTRAL_HEADER.pack(*fields) +
+                               raw[CENTRAL_HEADER.size:])
+
+            new_cd_offset = dst.tell()
+            new_cd = b"".join(central)
+            dst.write(new_cd)
+            dst.write(END_RECORD.pack(END_RECORD_SIG, 0, 0, entries,
+                                      entries, len(new_cd), new_cd_offset,
+                                      len(comment)) + comment)
+
+
+def _read_end_record(src):
+    size = os.fstat(src.fileno()).st_size
+    tail_len = min(size, END_RECORD.size + 0xFFFF)
+    src.seek(size - tail_len)
+    tail = _read_exact(src, tail_len)
+    index = tail.rfind(struct.pack("<I", END_RECORD_SIG))
+    if index < 0:
+        raise UnsupportedZip("no end of central directory record")
+    end_record = END_RECORD.unpack_from(tail, index)
+    if index >= 20 and struct.unpack_from("<I", tail, index - 20)[0] == \
+            ZIP64_LOCATOR_SIG:
+        raise UnsupportedZip("zip64 archive")
+    if end_record[1] != 0 or end_record[2] != 0 or \
+            end_record[3] != end_record[4]:
+        raise UnsupportedZip("multi-disk archive")
+    comment_len = end_record[7]
+    comment = tail[index + END_RECORD.size:
+                   index + END_RECORD.size + comment_len]
+    if end_record[6] + end_record[5] != size - tail_len + index:
+        # data before the archive (e.g. a self-extractor stub)
+        raise UnsupportedZip("archive has a prefix")
+    return end_record, comment
+
+
+def _read_local_header(src, offset):
+    src.seek(offset)
+    fixed = _read_exact(src, LOCAL_HEADER.size)
+    header = LOCAL_HEADER.unpack(fixed)
+    if header[0] != LOCAL_HEADER_SIG:
+        raise UnsupportedZip("bad local header")
+    return fixed + _read_exact(src, header[9] + header[10])
+
+
+def _stored_length(src, offset, compress_size, flags):
+    """
+    Length of a member as stored: local header, data and any data
+    descriptor.
+    """
+    local = _read_local_header(src, offset)
+    length = len(local) + compress_size
+    if flags & FLAG_DATA_DESCRIPTOR:
+        src.seek(offset + length)
+        signature = struct.unpack("<I", _read_exact(src, 4))[0]
+        length += 16 if signature == DATA_DESCRIPTOR_SIG else 12
+    return length
+
+
+def _copy_range(src, dst, start, length):
+    # Let the kernel copy where it can; fall back to a buffered loop.
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            while length > 0:
+                n = copy_file_range(src.fileno(), dst.fileno(), length,
+                                    start)
+                if n == 0:
+                    break
+                # dst has moved on by n; a failure on a later chunk must
+                # not make the loop below copy these bytes again
+                start, length = start + n, length - n
+        except OSError:
+            pass
+        if length == 0:
+            return
+    src.seek(start)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise UnsupportedZip("unexpected end of archive")
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _read_exact(src, length):
+    data = src.read(length)
+    if len(data) != length:
+        raise UnsupportedZip("unexpected end of archive")
+    return data
+
+
+def _rewrite_in_memory(source_path, tmp_path, member, transform):
+    with zipfile.ZipFile(source_path) as archive, \
+            zipfile.ZipFile(tmp_path, "w") as out:
+        for info in archive.infolist():
+            data = archive.read(info)
+            if info.filename == member:
+                data = transform(data)
+            out.writestr(info, data)
@@ -0,0 +1,279 @@
+import os
+import time
+import logging
+import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, \
+    FIRST_COMPLETED
+
+from app.deadline import DeadlineExceeded, current_deadline, \
+    default_budget, not_run_result, run_deadline
+
+
+def new_result():
+    return {"num_failed": 0,
+            "tests_failed": [], "info": {}}
+
+
+def merge_result(result, other):
+    """
+    Folds one result dictionary into another, the same way the routes
+    have always combined the results of individual checks.
+
+    Args:
+        result (dict): The result dictionary to fold into.
+        other (dict): The result dictionary to fold in.
+
+    Returns:
+        dict: The updated result dictionary.
+    """
+    result["num_failed"] += other["num_failed"]
+    if len(other["tests_failed"]) > 0:
+        result["tests_failed"].append(other["tests_failed"])
+    result["info"] = result["info"] | other["info"]
+    return result
+
+
+class SuiteEngine():
+    """
+    Runs named suites and combines their native result dictionaries.
+
+    Leaf suites are plain callables returning a result dictionary.
+    Composite suites are lists of other suite names. A leaf may depend on
+    other suites (e.g. DASH deposit on the DASH and SFTP connectivity
+    probes); a run takes in everything the requested suites depend on and
+    runs it as a DAG: a suite starts as soon as everything it depends on
+    has passed, independent branches run concurrently, and a suite whose
+    dependency failed is skipped, without waiting for the rest of the run,
+    rather than left to time out against a service that is down. Results
+    are only serialized at the HTTP edge.
+
+    A run may be given a time budget (deadline_secs, or
+    RUN_DEADLINE_SECS): every step of every suite in it is capped at what
+    is left (see app.deadline), suites not yet started when it runs out
+    are not started, and info["Deadline"] says which step used it up.
+
+    extra_info, if given, is called once a run is done and what it
+    returns is added to the run's info, e.g. circuit breaker states.
+    recorder, if given, is called with (name, result, leaves, started_at,
+    finished_at) after every run, e.g. to keep its history; leaves maps
+    each leaf suite of the run to its status ("passed", "failed",
+    "skipped" or "not run") and elapsed_secs.
+    """
+
+    def __init__(self, suites, composites=None, max_workers=None,
+                 dependencies=None, extra_info=None, recorder=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.suites = suites
+        self.composites = composites or {}
+        self.dependencies = dependencies or {}
+        self.extra_info = extra_info
+        self.recorder = recorder
+        if max_workers is None:
+            max_workers = int(os.getenv("SUITE_MAX_WORKERS", 4))
+        self.max_workers = max_workers
+        # fail at startup, not on the first request, on an unknown name
+        # or a cycle
+        self.__plan(self.names())
+
+    def names(self):
+        return list(self.suites) + list(self.composites)
+
+    def run(self, name, progress=None, deadline_secs=None):
+        """
+        Runs a leaf or composite suite, and the suites it depends on.
+
+        Args:
+            name (str): The name of the suite.
+            progress (callable, optional): Called with (suite name,
+                status) as each leaf suite starts ("running"), ends
+                ("finished") or is skipped ("skipped").
+            deadline_secs (float, optional): The run's time budget.
+                Defaults to RUN_DEADLINE_SECS; ignored inside a run that
+                already has a deadline.
+
+        Returns:
+            dict: The result dictionary with the keys num_failed,
+                tests_failed and info.
+        """
+        deadline = current_deadline()
+        if deadline is None:
+            if deadline_secs is None:
+                deadline_secs = default_budget()
+            if deadline_secs is not None:
+                with run_deadline(deadline_secs):
+                    return self.run(name, progress)
+        started_at = time.time()
+        if name in self.composites or self.dependencies.get(name):
+            suite_result, leaves = self.__run_dag([name], progress)
+        elif name in self.suites:
+            if progress:
+                progress(name, "running")
+            start = time.monotonic()
+            suite_result = self.__run_leaf(name)
+            leaves = {name: {"status": "passed"
+                             if suite_result["num_failed"] == 0
+                             else "failed",
+                             "elapsed_secs": round(time.monotonic() -
+                                                   start, 3)}}
+            if progress:
+                progress(name, "finished")
+        else:
+            raise KeyError(f"Unknown suite: {name}")
+        if deadline is not None:
+            suite_result["info"]["Deadline"] = deadline.as_dict()
+        if self.recorder is not None:
+            try:
+                self.recorder(name, suite_result, leaves, started_at,
+                              time.time())
+            except Exception:
+                self.logger.error(traceback.format_exc())
+        if self.extra_info is not None:
+            suite_result["info"].update(self.extra_info())
+        return suite_result
+
+    def leaves(self, name):
+        """
+        Returns the names of the leaf suites a run of a suite takes in,
+        dependencies first.
+        """
+        return self.__plan([name])
+
+    def run_many(self, names, progress=None):
+        """
+        Runs several suites, and the suites they depend on, as a DAG and
+        merges their results, dependencies first.
+
+        Args:
+            names (list): The names of the suites to run.
+            progress (callable, optional): Passed on as in run().
+
+        Returns:
+            dict: The combined result dictionary.
+        """
+        return self.__run_dag(names, progress)[0]
+
+    def __run_dag(self, names, progress):
+        plan = self.__plan(names)
+        deadline = current_deadline()
+        upstream = {leaf: self.__plan(self.dependencies.get(leaf, []))
+                    for leaf in plan}
+        results = {}
+        statuses = {}
+        suite_timings = {}
+        pending = list(plan)
+        running = {}
+        workers = max(1, min(self.max_workers, len(plan)))
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix="suite") as executor:
+            while pending or running:
+                # the plan lists dependencies first, so one pass skips a
+                # whole failed branch
+                for leaf in list(pending):
+                    failed = [dependency for dependency in upstream[leaf]
+                              if dependency in results and
+                              results[dependency]["num_failed"] > 0]
+                    if failed:
+                        pending.remove(leaf)
+                        results[leaf] = self.__skipped(leaf, failed)
+                        statuses[leaf] = "skipped"
+                        if progress:
+                            progress(leaf, "skipped")
+                    elif all(dependency in results
+                             for dependency in upstream[leaf]):
+                        pending.remove(leaf)
+                        if deadline is not None and deadline.expired():
+                            deadline.exhausted(leaf)
+                            results[leaf] = self.__out_of_time(leaf,
+                                                               deadline)
+                            statuses[leaf] = "not run"
+                            if progress:
+                                progress(leaf, "skipped")
+                            continue
+                        # the suite's thread shares the run's deadline
+                        running[executor.submit(
+                            contextvars.copy_context().run,
+                            self.__timed_run, leaf, progress)] = leaf
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    leaf = running.pop(future)
+                    results[leaf], elapsed = future.result()
+                    suite_timings[leaf] = round(elapsed, 3)
+
+        result = new_result()
+        leaves = {}
+        for leaf in plan:
+            merge_result(result, results[leaf])
+            leaves[leaf] = {
+                "status": statuses.get(leaf, "passed"
+                                       if results[leaf]["num_failed"] == 0
+                                       else "failed"),
+                "elapsed_secs": suite_timings.get(leaf)}
+        result["info"]["Suite timings"] = suite_timings
+        return result, leaves
+
+    def __plan(self, names):
+        plan = []
+
+        def visit(name, path):
+            if name in path:
+                raise ValueError("Suite dependency cycle: " +
+                                 " -> ".join(path + (name,)))
+            if name in self.composites:
+                for member in self.composites[name]:
+                    visit(member, path + (name,))
+                return
+            if name not in self.suites:
+                raise KeyError(f"Unknown suite: {name}")
+            for dependency in self.dependencies.get(name, []):
+                visit(dependency, path + (name,))
+            if name not in plan:
+                plan.append(name)
+
+        for name in names:
+            visit(name, ())
+        return plan
+
+    def __skipped(self, name, failed):
+        self.logger.warning(f"Skipping {name}: {', '.join(failed)} "
+                            "did not pass")
+        return {"num_failed": 1,
+                "tests_failed": [name],
+                "info": {f"{name} skipped":
+                         {"status_code": 424,
+                          "text": f"Not run because {', '.join(failed)} "
+                          "did not pass"}}}
+
+    def __out_of_time(self, name, deadline):
+        self.logger.warning(f"Not starting {name}: the run deadline ran "
+                            f"out in {deadline.exhausted_by}")
+        return not_run_result(name, deadline)
+
+    def __timed_run(self, name, progress):
+        start = time.monotonic()
+        if progress:
+            progress(name, "running")
+        suite_result = self.__run_leaf(name)
+        if progress:
+            progress(name, "finished")
+        return suite_result, time.monotonic() - start
+
+    def __run_leaf(self, name):
+        try:
+            return self.suites[name]()
+        except DeadlineExceeded as err:
+            self.logger.warning(f"{name} ran out of time: {err}")
+            return {"num_failed": 1,
+                    "tests_failed": [name],
+                    "info": {f"{name} ran out of time":
+                             {"status_code": 504,
+                              "text": str(err)}}}
+        except Exception as err:
+            self.logger.error(traceback.format_exc())
+            return {"num_failed": 1,
+                    "tests_failed": [name],
+                    "info": {f"{name} failed with exception":
+                             {"status_code": 500,
+                              "text": str(err)}}}
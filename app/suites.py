@@ -0,0 +1,187 @@
+from app.celery_client import get_publisher
+from app.circuit_breaker import breaker_states
+from app.history_store import HistoryStore
+from app.load_generator import LoadGenerator
+from app.metrics import record_run as record_run_metrics
+from app.probe_runner import ProbeRunner
+from app.run_manager import RunManager
+from app.single_flight import SingleFlight
+from app.suite_engine import SuiteEngine, new_result, merge_result
+from app.tests.connectivity_checks import ConnectivityChecks
+from app.tests.etd_dash_service_checks import ETDDashServiceChecks
+from app.tests.etd_dais_end_to_end import ETDDAISEndToEnd
+from app.tests.etd_alma_service_checks import ETDAlmaServiceChecks
+from app.tests.etd_alma_monitor_service_checks \
+    import ETDAlmaMonitorServiceChecks
+from app.tests.etd_end_to_end import ETDEndToEnd
+
+
+def probe(name, check):
+    """
+    Runs one connectivity check under its own deadline, so a service that
+    hangs fails its probe in PROBE_TIMEOUT_SECS.
+    """
+    return merge_result(new_result(),
+                        ProbeRunner().run({name: check})[name]["result"])
+
+
+def mongo_connectivity():
+    return probe("Mongo", ConnectivityChecks().mongodb_connectivity_test)
+
+
+def dash_connectivity():
+    return probe("DASH", ConnectivityChecks().dash_connectivity_test)
+
+
+def dims_connectivity():
+    return probe("DIMS", ConnectivityChecks().dims_connectivity_test)
+
+
+def sftp_connectivity():
+    return probe("Proquest Dropbox",
+                 ConnectivityChecks().sftp_connectivity_test)
+
+
+def alma_sftp_connectivity():
+    return probe("Alma Dropbox",
+                 ConnectivityChecks().alma_sftp_connectivity_test)
+
+
+def dash_service():
+    return merge_result(new_result(),
+                        ETDDashServiceChecks().dash_deposit_test())
+
+
+def etd_basic():
+    return merge_result(new_result(),
+                        ETDDAISEndToEnd().end_to_end_documentation_test())
+
+
+def etd_with_images():
+    return merge_result(new_result(),
+                        ETDDAISEndToEnd().end_to_end_images_test())
+
+
+def etd_with_opaque():
+    return merge_result(new_result(),
+                        ETDDAISEndToEnd().end_to_end_opaque_gif_test())
+
+
+def etd_with_audio():
+    return merge_result(new_result(),
+                        ETDDAISEndToEnd().end_to_end_audio_test())
+
+
+def alma_service():
+    return merge_result(new_result(),
+                        ETDAlmaServiceChecks().alma_service_test())
+
+
+def alma_monitor_service():
+    return merge_result(new_result(),
+                        ETDAlmaMonitorServiceChecks()
+                        .monitor_alma_and_invoke_dims())
+
+
+def alma_monitor_service_missing_submission():
+    return merge_result(new_result(),
+                        ETDAlmaMonitorServiceChecks()
+                        .monitor_alma_and_invoke_dim_missing_submission())
+
+
+def etd_end_to_end():
+    return merge_result(new_result(), ETDEndToEnd().end_to_end())
+
+
+def etd_end_to_end_no_dash():
+    return merge_result(new_result(), ETDEndToEnd().end_to_end(False))
+
+
+def etd_load():
+    return merge_result(new_result(), LoadGenerator().run())
+
+
+PROBES = {
+    "mongo_connectivity": mongo_connectivity,
+    "dash_connectivity": dash_connectivity,
+    "dims_connectivity": dims_connectivity,
+    "sftp_connectivity": sftp_connectivity,
+    "alma_sftp_connectivity": alma_sftp_connectivity,
+}
+
+SUITES = {
+    **PROBES,
+    "dash_service": dash_service,
+    "etd_basic_test": etd_basic,
+    "etd_with_images_test": etd_with_images,
+    "etd_with_opaque_test": etd_with_opaque,
+    "etd_with_audio_test": etd_with_audio,
+    "alma_service": alma_service,
+    "alma_monitor_service": alma_monitor_service,
+    "alma_monitor_service_missing_submission":
+        alma_monitor_service_missing_submission,
+    "etd_end_to_end": etd_end_to_end,
+    "etd_end_to_end_no_dash": etd_end_to_end_no_dash,
+    "etd_load": etd_load,
+}
+
+COMPOSITE_SUITES = {
+    "connectivity": ["mongo_connectivity", "dash_connectivity",
+                     "dims_connectivity", "sftp_connectivity"],
+    "integration": ["connectivity", "dash_service", "alma_monitor_service"],
+}
+
+# What each suite needs up before it can pass. A suite only starts once
+# its probes pass and is skipped if one fails, so a service that is down
+# is reported by its probe in seconds instead of by every suite polling
+# it for MAX_TRIALS x SLEEP_SECS. Probes depend on nothing and run
+# concurrently.
+DEPENDENCIES = {
+    "dash_service": ["dash_connectivity", "sftp_connectivity"],
+    "etd_basic_test": ["dims_connectivity"],
+    "etd_with_images_test": ["dims_connectivity"],
+    "etd_with_opaque_test": ["dims_connectivity"],
+    "etd_with_audio_test": ["dims_connectivity"],
+    "alma_service": ["alma_sftp_connectivity"],
+    "alma_monitor_service": ["mongo_connectivity"],
+    "alma_monitor_service_missing_submission": ["mongo_connectivity"],
+    "etd_end_to_end": ["sftp_connectivity"],
+    "etd_end_to_end_no_dash": ["sftp_connectivity"],
+    "etd_load": ["dash_connectivity", "sftp_connectivity"],
+}
+
+# every run, its steps and their durations, for /history
+history_store = HistoryStore()
+
+
+def record_run(*run):
+    """
+    Keeps a finished run in the history store and counts it in /metrics.
+    """
+    history_store.record(*run)
+    record_run_metrics(*run)
+
+
+suite_engine = SuiteEngine(SUITES, COMPOSITE_SUITES,
+                           dependencies=DEPENDENCIES,
+                           extra_info=lambda: {
+                               "Circuit breakers": breaker_states(),
+                               "Celery publisher":
+                                   get_publisher().snapshot()},
+                           recorder=record_run)
+# identical requests arriving together, in any worker, share one run
+single_flight = SingleFlight()
+run_manager = RunManager(suite_engine, single_flight=single_flight)
+
+
+def run_suite(name, deadline_secs=None):
+    """
+    Runs a suite for a request, attaching to an identical run already in
+    flight (or just finished) instead of starting another. deadline_secs
+    is the run's time budget (default RUN_DEADLINE_SECS); only runs with
+    the same budget are shared, and waiting for one uses up the budget.
+    """
+    if name not in suite_engine.names():
+        raise KeyError(f"Unknown suite: {name}")
+    return single_flight.run(name, lambda: suite_engine.run(name),
+                             deadline_secs)
@@ -1,28 +1,34 @@
-import requests
 import os
-from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+from app.circuit_breaker import get_breaker
+from app.http_client import get_http_client
+from app.mongo_client import get_mongo_client, pool_stats
+from app.sftp_pool import get_sftp_pool
 
 
 class ConnectivityChecks():
 
+    def __init__(self, timeout=None):
+        if timeout is None:
+            timeout = float(os.getenv("PROBE_TIMEOUT_SECS", 10))
+        self.timeout = timeout
+
     def mongodb_connectivity_test(self):
         result = {"num_failed": 0,
                   "tests_failed": [], "info": {}}
 
-        # read from mongodb
-        mongo_url = os.environ.get('MONGO_URL')
+        # ping mongodb on the shared, already warm client
         try:
-            mongo_client = MongoClient(mongo_url, maxPoolSize=1)
-            # mongo_db = mongo_client[mongo_dbname]
-            mongo_client.close()
-
+            get_breaker("Mongo").call(
+                get_mongo_client().admin.command, 'ping',
+                failure_types=(ConnectionFailure,))
+            result["info"]["Mongo pool"] = pool_stats()
         except Exception as err:
             result = {"num_failed": 1,
                       "tests_failed": ["Mongo"],
                       "info": {"Failed Mongo":
                                {"status_code": 500,
                                 "text": str(err)}}}
-            mongo_client.close()
         return result
 
     def dash_connectivity_test(self):
@@ -32,7 +38,8 @@ class ConnectivityChecks():
         dash_rest_url = os.environ.get('DASH_REST_URL')
         dash_url = f'{dash_rest_url}/test'
         try:
-            dash_response = requests.get(dash_url, verify=False)
+            dash_response = get_http_client().get(
+                dash_url, "DASH", timeout=self.timeout)
             if dash_response.status_code != 200:
                 result = {"num_failed": 1,
                           "tests_failed": ["DASH"],
@@ -54,7 +61,8 @@ class ConnectivityChecks():
         # DIMS healthcheck
         dims_url = os.environ.get('DIMS_URL')
         try:
-            dims_response = requests.get(dims_url, verify=False)
+            dims_response = get_http_client().get(
+                dims_url, "DIMS", timeout=self.timeout)
             if dims_response.status_code != 200:
                 result = {"num_failed": 1,
                           "tests_failed": ["DASH"],
@@ -68,3 +76,32 @@ class ConnectivityChecks():
                                {"status_code": 500,
                                 "text": str(err)}}}
         return result
+
+    def sftp_connectivity_test(self):
+        return self.__sftp_test("Proquest Dropbox",
+                                os.getenv("dropboxServer"),
+                                os.getenv("dropboxUser"),
+                                os.getenv("PRIVATE_KEY_PATH"))
+
+    def alma_sftp_connectivity_test(self):
+        return self.__sftp_test("Alma Dropbox",
+                                os.getenv("ALMA_DROPBOX_SERVER"),
+                                os.getenv("ALMA_DROPBOX_USER"),
+                                os.getenv("ALMA_PRIVATE_KEY_PATH"))
+
+    def __sftp_test(self, name, host, username, private_key):
+        result = {"num_failed": 0,
+                  "tests_failed": [], "info": {}}
+        # log in and list the incoming directory the suites upload to
+        try:
+            with get_sftp_pool().session(host=host,
+                                         username=username,
+                                         private_key=private_key) as sftp:
+                sftp.listdir("incoming")
+        except Exception as err:
+            result = {"num_failed": 1,
+                      "tests_failed": [name],
+                      "info": {f"{name} sftp error":
+                               {"status_code": 500,
+                                "text": str(err)}}}
+        return result
@@ -1,17 +1,21 @@
 import os
-import time
-from celery import Celery
-import shutil
 import logging
 from datetime import datetime
-from pymongo import MongoClient
 import traceback
+from app.celery_client import get_publisher
+from app.mongo_watch import StatusWatcher
+from app.mongo_client import get_collection
+from app.staging import stage_file
+from app.run_namespace import RunNamespace
 
 
 class ETDAlmaMonitorServiceChecks():
 
-    def __init__(self):
+    def __init__(self, namespace=None):
         self.logger = logging.getLogger('etd_int_tests')
+        # names the ETD_IN_DIR directory and tags the Mongo record
+        self.namespace = namespace if namespace is not None \
+            else RunNamespace()
 
     def monitor_alma_and_invoke_dims(self):
         result = {"num_failed": 0,
@@ -20,8 +24,8 @@ class ETDAlmaMonitorServiceChecks():
         try:
             # Copy test submission file from data dir to ETD 'in' directory
             zip_file = "submission_999999.zip"
-            dir_unique_appender = str(int(datetime.now().timestamp()))
-            directory_id = "alma_monitor_service_test_" + dir_unique_appender
+            directory_id = self.namespace.directory(
+                "alma_monitor_service_test")
             copy_result = self.__copy_test_submission(
                 zip_file,
                 directory_id)
@@ -40,6 +44,7 @@ class ETDAlmaMonitorServiceChecks():
             result["info"].update({"Monitor failed with exception":
                                   {"status_code": 500,
                                    "text": str(e)}})
+        result["info"]["Run namespace"] = self.namespace.as_dict()
         return result
 
     def monitor_alma_and_invoke_dim_missing_submission(self):
@@ -47,15 +52,20 @@ class ETDAlmaMonitorServiceChecks():
                   "tests_failed": [],
                   "info": {}}
         try:
-            # Copy test submission file from data dir to ETD 'in' directory
-            dir_unique_appender = str(int(datetime.now().timestamp()))
-            directory_id = "missing_submission_alma_monitor_service_test_" \
-                + dir_unique_appender
-            result = self.__insert_alma_reccord_in_mongo(directory_id)
-            self.__place_queue_message()
-            sleep_secs = int(os.environ.get('SLEEP_SECS', 30))
-            time.sleep(sleep_secs)  # wait for queue
+            # Nothing is copied to ETD 'in' for this directory
+            directory_id = self.namespace.directory(
+                "missing_submission_alma_monitor_service_test")
+            # Subscribe before inserting so the monitor's update to
+            # FAILED cannot be missed
+            with StatusWatcher(directory_id) as watcher:
+                result = self.__insert_alma_reccord_in_mongo(directory_id)
+                self.__place_queue_message()
+                status_wait = watcher.wait_for("alma_submission_status",
+                                               "FAILED")
             result = self.__check_alma_status_failed(directory_id)
+            result["info"]["Wait timings"] = {
+                "Alma status FAILED": status_wait.as_dict() |
+                {"source": watcher.source}}
         except Exception as e:
             self.logger.error(traceback.format_exc())
             result["num_failed"] += 1
@@ -63,6 +73,7 @@ class ETDAlmaMonitorServiceChecks():
             result["info"].update({"Monitor failed with exception":
                                   {"status_code": 500,
                                    "text": str(e)}})
+        result["info"]["Run namespace"] = self.namespace.as_dict()
         return result
 
     def __copy_test_submission(self, zip_file, test_submission_dir_name):
@@ -76,7 +87,8 @@ class ETDAlmaMonitorServiceChecks():
         dest_path = os.path.join(dest_dir, test_submission_dir_name)
         os.makedirs(dest_path, exist_ok=True)
         try:
-            shutil.copy(test_path, dest_path)
+            staged = stage_file(test_path, dest_path)
+            result["info"]["Staging"] = staged.as_dict()
             if not os.path.isfile(os.path.join(dest_path, zip_file)):
                 result["num_failed"] += 1
                 result["tests_failed"].append("Copy failed without exception")
@@ -97,8 +109,8 @@ class ETDAlmaMonitorServiceChecks():
     def __insert_alma_reccord_in_mongo(self, directory_id):
         result = {"num_failed": 0,
                   "tests_failed": [], "info": {}}
-        # Set up mongo
-        mongo_url = os.getenv('MONGO_URL')
+        # The record keeps the PQ ID of the staged fixture; the run's tag
+        # and directory_id are what set it apart from other runs'.
         known_pq_id = os.getenv("SUBMISSION_PQ_ID")
         record = {"proquest_id": known_pq_id,
                   "school_alma_dropbox": "gsd",
@@ -109,13 +121,12 @@ class ETDAlmaMonitorServiceChecks():
                   datetime.now().isoformat(),
                   "directory_id": directory_id}
         try:
-            mongo_client = MongoClient(mongo_url, maxPoolSize=1)
-            mongo_db = mongo_client[os.getenv("MONGO_DBNAME")]
-            collection = mongo_db[os.getenv("MONGO_COLLECTION")]
-            # clean up any previous test runs
-            collection.delete_many({"proquest_id": known_pq_id})
-            collection.insert_one(record)
-            mongo_client.close()
+            collection = get_collection()
+            # clean up previous test runs, but not ones still in progress
+            for stale in self.namespace.cleanup_filters(
+                    {"proquest_id": known_pq_id}, "insertion_date"):
+                collection.delete_many(stale)
+            collection.insert_one(self.namespace.tag(record))
         except Exception as err:
             self.logger.error(traceback.format_exc())
             result = {"num_failed": 1,
@@ -123,22 +134,17 @@ class ETDAlmaMonitorServiceChecks():
                       "info": {"Failed Mongo":
                                {"status_code": 500,
                                 "text": str(err)}}}
-            mongo_client.close()
         return result
 
     def __check_alma_status_failed(self, directory_id):
         result = {"num_failed": 0,
                   "tests_failed": [], "info": {}}
-        # Set up mongo
-        mongo_url = os.getenv('MONGO_URL')
         query = {"directory_id":
                  directory_id}
         fields = {"alma_submission_status": 1}
         try:
-            mongo_client = MongoClient(mongo_url, maxPoolSize=1)
-            mongo_db = mongo_client[os.getenv("MONGO_DBNAME")]
-            collection = mongo_db[os.getenv("MONGO_COLLECTION")]
-            retvalues = list(collection.find(query, fields))
+            collection = get_collection()
+            retvalues = collection.find(query, fields)
             if len(retvalues) != 1:
                 result["num_failed"] += 1
                 result["tests_failed"].append("Expected Mongo results wrong")
@@ -153,7 +159,6 @@ class ETDAlmaMonitorServiceChecks():
                                   {"status_code": 500,
                                    "text": "Status returned {} for {}".
                                    format(retvalues[0]["alma_submission_status"], directory_id)}} # noqa
-            mongo_client.close()
         except Exception as err:
             self.logger.error(traceback.format_exc())
             result = {"num_failed": 1,
@@ -161,12 +166,9 @@ class ETDAlmaMonitorServiceChecks():
                       "info": {"Failed Mongo":
                                {"status_code": 500,
                                 "text": str(err)}}}
-            mongo_client.close()
         return result
 
     def __place_queue_message(self):
-        client = Celery('app')
-        client.config_from_object('celeryconfig')
         message = {
             "job_ticket_id": "integration_testing", "integration_test": True,
             "feature_flags":
@@ -177,6 +179,5 @@ class ETDAlmaMonitorServiceChecks():
             }
         }
         queue = os.getenv("ALMA_MONITOR_SERVICE_QUEUE_NAME")
-        client.send_task(name="etd-alma-monitor-service.tasks.send_to_drs",
-                         args=[message], kwargs={},
-                         queue=queue)
+        get_publisher().publish(
+            "etd-alma-monitor-service.tasks.send_to_drs", message, queue)
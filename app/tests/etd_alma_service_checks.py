@@ -1,12 +1,12 @@
-import time
 import os
 import json
-from celery import Celery
-import pysftp
 import glob
 import shutil
 import logging
 from lib.ltstools import get_date_time_stamp
+from app.celery_client import get_publisher
+from app.polling import wait_until
+from app.sftp_pool import get_sftp_pool
 
 
 class ETDAlmaServiceChecks():
@@ -33,8 +33,7 @@ class ETDAlmaServiceChecks():
         xmlCollectionFile = f'AlmaDeliveryTest{instance.capitalize()}' + \
             f'_{yyyymmddhhmm}.xml'
 
-        client = Celery('app')
-        client.config_from_object('celeryconfig')
+        publisher = get_publisher()
 
         self.logger.info(">>> Read message file")
         messagefile = os.environ.get('ALMA_MESSAGE_FILE', "alma_message.json")
@@ -62,24 +61,22 @@ class ETDAlmaServiceChecks():
 
                 # 3. send the test object to alma
                 self.logger.info(">>> Submit test object to alma")
-                client.send_task(name="etd-alma-service.tasks.send_to_alma",
-                                 args=[message], kwargs={},
-                                 queue=incoming_queue)
-                sleep_secs = int(os.environ.get('SLEEP_SECS', 30))
-                time.sleep(sleep_secs)  # wait for queue
+                publisher.publish("etd-alma-service.tasks.send_to_alma",
+                                  message, incoming_queue)
 
-                # 4. put the test object in the dropbox
+                # 4. wait for the export to show up in the dropbox
                 self.logger.info(">>> SFTP check Alma export")
-                exportExists = False
-                try:
-                    exportExists = self.sftp_check_export(xmlCollectionFile)
-                except Exception as err:
+                export_wait = wait_until(
+                    lambda: self.sftp_check_export(xmlCollectionFile),
+                    description="Alma export")
+                exportExists = export_wait.ok
+                if export_wait.error is not None:
                     result["num_failed"] += 1
                     result["tests_failed"].append("SFTP")
                     result["info"] = {"Alma Dropbox sftp failed":
                                       {"status_code": 500,
-                                       "text": str(err)}}
-                    self.logger.error(str(err))
+                                       "text": str(export_wait.error)}}
+                    self.logger.error(str(export_wait.error))
                 if not exportExists:
                     result["num_failed"] += 1
                     result["tests_failed"].append("ALMA_EXPORT")
@@ -91,15 +88,12 @@ class ETDAlmaServiceChecks():
                 # 5. cleanup the test object from the filesystem
                 self.logger.info(">>> Cleanup test object")
                 self.cleanup_test_object(batch_name)
+                result["info"]["Wait timings"] = {
+                    "Alma export": export_wait.as_dict()}
 
             else:
-                client.send_task(name="etd-alma-service.tasks.send_to_alma",
-                                 args=[message], kwargs={},
-                                 queue=incoming_queue)
-
-                sleep_secs = int(os.environ.get('SLEEP_SECS', 2))
-
-                time.sleep(sleep_secs)  # wait for queue
+                publisher.publish("etd-alma-service.tasks.send_to_alma",
+                                  message, incoming_queue)
 
         return result
 
@@ -133,9 +127,9 @@ class ETDAlmaServiceChecks():
         incomingDir = "incoming/"
         exportExists = False
 
-        with pysftp.Connection(host=remoteSite,
-                               username=remoteUser,
-                               private_key=private_key) as sftp:
+        with get_sftp_pool().session(host=remoteSite,
+                                     username=remoteUser,
+                                     private_key=private_key) as sftp:
             try:
                 if sftp.exists(f"{incomingDir}/{base_name}"):
                     # this file should be deleted. keep it for now so QA can
@@ -1,23 +1,49 @@
-import time
 import os
 import json
-from celery import Celery
-import pysftp
 import glob
 import shutil
-import requests
-import random
-import string
 import logging
 import re
+from app.circuit_breaker import CircuitOpenError
+from app.polling import wait_until
+from app.sftp_pool import get_sftp_pool
+from app.celery_client import get_publisher
+from app.http_client import get_dash_client
+from app.fs_watch import FsWatcher
+from app.timeline import Timeline
+from app.run_namespace import RunNamespace, is_reserved_identifier
 
 
 class ETDDashServiceChecks():
 
-    def __init__(self):
+    def __init__(self, namespace=None):
         self.logger = logging.getLogger('etd_int_tests')
+        # names the submissions, PQ ID and DASH item of this run
+        self.namespace = namespace if namespace is not None \
+            else RunNamespace()
+        # how long each awaited condition took to become true
+        self.wait_timings = {}
+        # watches ETD_OUT_DIR and ETD_DUPE_DIR for the length of a run
+        self.fs_watcher = None
+        # when each stage of the run completed
+        self.timeline = None
 
     def dash_deposit_test(self):
+        out_dir = os.environ.get('ETD_OUT_DIR')
+        dupe_dir = os.environ.get('ETD_DUPE_DIR')
+        self.timeline = Timeline("dash_service")
+        try:
+            with FsWatcher([out_dir, dupe_dir]) as self.fs_watcher:
+                result = self.__dash_deposit_test()
+        finally:
+            self.fs_watcher = None
+            self.namespace.close()
+            timeline = self.timeline.save()
+        result["info"]["Timeline"] = timeline
+        result["info"]["Run namespace"] = self.namespace.as_dict()
+        return result
+
+    def __dash_deposit_test(self):
         self.logger.info(">>> Starting integration test")
         result = {"num_failed": 0,
                   "tests_failed": [],
@@ -28,8 +54,7 @@ class ETDDashServiceChecks():
         FEATURE_FLAGS = "feature_flags"
         DASH_FEATURE_FLAG = "dash_feature_flag"
 
-        client = Celery('app')
-        client.config_from_object('celeryconfig')
+        publisher = get_publisher()
 
         self.logger.info(">>> Read message file")
         messagefile = os.environ.get('MESSAGE_FILE', "message.json")
@@ -43,7 +68,8 @@ class ETDDashServiceChecks():
             if (DASH_FEATURE_FLAG in feature_flags and
                     feature_flags[DASH_FEATURE_FLAG] == "on"):
 
-                base_name = self.random_digit_string()
+                base_name = self.namespace.base_name()
+                self.timeline.key = base_name
                 # 1. clear out any old test object
                 self.logger.info(">>> Cleanup test object")
                 self.cleanup_test_object(base_name)
@@ -54,6 +80,7 @@ class ETDDashServiceChecks():
                 self.logger.info(">>> SFTP test object")
                 try:
                     self.sftp_test_object(base_name)
+                    self.timeline.mark("upload done")
                 except Exception as err:
                     result["num_failed"] += 1
                     result["tests_failed"].append("SFTP")
@@ -61,14 +88,16 @@ class ETDDashServiceChecks():
                                       {"status_code": 500,
                                        "text": str(err)}}
                     self.logger.error(str(err))
+                    self.timeline.mark("upload done", ok=False)
 
                 # 3. send the test object to dash
                 self.logger.info(">>> Submit test object to dash")
-                client.send_task(name="etd-dash-service.tasks.send_to_dash",
-                                 args=[message], kwargs={},
-                                 queue=incoming_queue)
-                sleep_secs = int(os.environ.get('SLEEP_SECS', 30))
-                time.sleep(sleep_secs)  # wait for queue
+                out_dir = os.environ.get('ETD_OUT_DIR')
+                mapfile_expected = self.fs_watcher.expect(
+                    out_dir, f"proquest*-{base_name}-gsd/mapfile")
+                publisher.publish("etd-dash-service.tasks.send_to_dash",
+                                  message, incoming_queue)
+                self.timeline.mark("task published")
 
                 # 4. count should be 1, shows insertion into dash
                 self.logger.info(">>> Check dash for test object")
@@ -76,27 +105,29 @@ class ETDDashServiceChecks():
                                              "DASH",
                                              "Dash count is not 1",
                                              result)
+                self.timeline.mark("DASH visible")
 
                 # 5. validate mapfile
                 self.logger.info(">>> Validate test object mapfile")
-                self.validate_mapfile(base_name, result)
+                self.validate_mapfile(base_name, result, mapfile_expected)
 
                 # 6. cleanup the test object from the filesystem
                 self.logger.info(">>> Clean up test object")
                 self.cleanup_test_object(base_name)
 
                 # 7. put the test object in the dropbox for a second time
-                # generate a random base name for the test object to make
+                # under a new base name (but the same PQ ID), to make
                 # duplicate detection more robust
-                base_name = self.random_digit_string()
+                base_name = self.namespace.base_name()
                 dupe_dir = os.environ.get('ETD_DUPE_DIR')
                 dupe_name_pattern = "proquest*-" + base_name + "-gsd_*"
-                pre_dupe_count = len(glob.glob
-                                     (f'{dupe_dir}/{dupe_name_pattern}'))
+                pre_dupe_count = self.fs_watcher.count(dupe_dir,
+                                                       dupe_name_pattern)
 
                 try:
                     self.logger.info(">>> SFTP duplicate test object")
                     self.sftp_test_object(base_name)
+                    self.timeline.mark("duplicate upload done")
                 except Exception as err:
                     result["num_failed"] += 1
                     result["tests_failed"].append("SFTP")
@@ -104,23 +135,34 @@ class ETDDashServiceChecks():
                                       {"status_code": 500,
                                        "text": str(err)}}
                     self.logger.error(str(err))
-                client.send_task(name="etd-dash-service.tasks.send_to_dash",
-                                 args=[message], kwargs={},
-                                 queue=incoming_queue)
-                time.sleep(sleep_secs)  # wait for queue
-
-                # 8. count should still be 1, no duplicate insertion allowed
+                    self.timeline.mark("duplicate upload done", ok=False)
+                dupe_expected = self.fs_watcher.expect(
+                    dupe_dir, dupe_name_pattern, count=pre_dupe_count + 1)
+                publisher.publish("etd-dash-service.tasks.send_to_dash",
+                                  message, incoming_queue)
+                self.timeline.mark("duplicate task published")
+
+                # 8. check the dupe directory to make sure the test object
+                # is there. Its arrival shows the service has handled the
+                # duplicate, so there is nothing left to wait for before
+                # checking the count in dash.
+                dupe_wait = self.fs_watcher.wait(dupe_expected)
+                self.wait_timings["dupe directory"] = dupe_wait.as_dict()
+                self.timeline.mark("duplicate in ETD_DUPE_DIR",
+                                   at=dupe_expected.registered_at +
+                                   dupe_wait.elapsed_secs,
+                                   ok=dupe_wait.ok)
+                post_dupe_count = self.fs_watcher.count(dupe_dir,
+                                                        dupe_name_pattern)
+
+                # 9. count should still be 1, no duplicate insertion allowed
                 self.logger.info(">>> Check dash for duplicate test object")
                 self.verify_submission_count(1,
                                              "DASH_DUPE",
                                              "Dash count is not 1",
                                              result)
 
-                # 9. check the dupe directory to make sure
-                # the test object is there
-                post_dupe_count = len(glob.glob
-                                      (f'{dupe_dir}/{dupe_name_pattern}'))
-                if post_dupe_count != pre_dupe_count + 1:
+                if not dupe_wait.ok:
                     result["num_failed"] += 1
                     result["tests_failed"].append("DASH_DUPE")
                     result["info"] = {"DASH dupe directory failed":
@@ -131,10 +173,9 @@ class ETDDashServiceChecks():
                                        str(post_dupe_count)}}
 
                 # check that the there is no output directory for the dupe
-                out_dir = os.environ.get('ETD_OUT_DIR')
                 out_dir_pattern = "proquest*-" + base_name + "-gsd"
-                out_dir_count = len(glob.glob
-                                    (f'{out_dir}/{out_dir_pattern}'))
+                out_dir_count = self.fs_watcher.count(out_dir,
+                                                      out_dir_pattern)
                 if out_dir_count != 0:
                     result["num_failed"] += 1
                     result["tests_failed"].append("DUPLICATE_IN_OUTPUT_DIR")
@@ -149,6 +190,7 @@ class ETDDashServiceChecks():
                 # 10. delete the test object from dash
                 self.logger.info(">>> Delete duplicate test object from dash")
                 self.delete_dash_object(result)
+                self.timeline.mark("deleted")
 
                 # 11. cleanup the test object from the filesystem
                 self.logger.info(">>> Clean up duplicate test object")
@@ -162,6 +204,7 @@ class ETDDashServiceChecks():
                 try:
                     self.logger.info(">>> SFTP duplicate test object, again")
                     self.sftp_test_object(base_name)
+                    self.timeline.mark("redeposit upload done")
                 except Exception as err:
                     result["num_failed"] += 1
                     result["tests_failed"].append("SFTP")
@@ -169,25 +212,18 @@ class ETDDashServiceChecks():
                                       {"status_code": 500,
                                        "text": str(err)}}
                     self.logger.error(str(err))
+                    self.timeline.mark("redeposit upload done", ok=False)
 
-                client.send_task(name="etd-dash-service.tasks.send_to_dash",
-                                 args=[message], kwargs={},
-                                 queue=incoming_queue)
-                time.sleep(sleep_secs)  # wait for queue
-
-                trials = 0
-                max_trials = os.getenv("MAX_TRIALS", 10)
-                sleep_secs = int(os.getenv("SLEEP_SECS", 30))
-                check_for_dupe = self.sftp_check_for_dupe(base_name)
-                while not check_for_dupe and trials < max_trials:
-                    self.logger.debug(">>> Attempting to check for dupes \
-                                    trial number {}".format(trials))
-                    check_for_dupe = self.sftp_check_for_dupe(base_name)
-                    trials += 1
-                    time.sleep(sleep_secs)
+                publisher.publish("etd-dash-service.tasks.send_to_dash",
+                                  message, incoming_queue)
+                self.timeline.mark("redeposit task published")
 
                 # make sure the submission file is in the dupe dir
-                if not check_for_dupe:
+                dupe_wait = self.wait_for(
+                    "dupe dropbox directory",
+                    lambda: self.sftp_check_for_dupe(base_name))
+                self.timeline.mark("dupe in dupe/gsd", ok=dupe_wait.ok)
+                if not dupe_wait.ok:
                     result["num_failed"] += 1
                     result["tests_failed"].append("DASH_DUPE")
                     result["info"] = {("DASH archive to dupe dropbox "
@@ -201,43 +237,40 @@ class ETDDashServiceChecks():
                 self.logger.info((">>> Delete duplicate test object "
                                   "from dash, again"))
                 self.delete_dash_object(result)
+                self.timeline.mark("redeposit deleted")
                 # cleanup the test object from the filesystem
                 self.logger.info(">>> Clean up duplicate test object, again.")
                 self.cleanup_test_object(base_name)
 
             else:
-                client.send_task(name="etd-dash-service.tasks.send_to_dash",
-                                 args=[message], kwargs={},
-                                 queue=incoming_queue)
+                publisher.publish("etd-dash-service.tasks.send_to_dash",
+                                  message, incoming_queue)
 
-                sleep_secs = int(os.environ.get('SLEEP_SECS', 2))
+        result["info"]["Wait timings"] = self.wait_timings
+        return result
 
-                time.sleep(sleep_secs)  # wait for queue
+    def wait_for(self, description, condition):
+        """
+        Waits for a condition with wait_until and records how long it
+        took in self.wait_timings.
 
-        return result
+        Args:
+            description (str): The name the timing is recorded under.
+            condition (callable): The condition to wait for.
+
+        Returns:
+            WaitResult: The outcome of the wait.
+        """
+        outcome = wait_until(condition, description=description)
+        self.wait_timings[description] = outcome.as_dict()
+        return outcome
 
     def get_dash_object(self):
-        rest_url = os.getenv("DASH_REST_URL",
-                             "https://dspace6-qai.lib.harvard.edu/rest")
-        identifier = os.getenv("SUBMISSION_PQ_ID")
-        query_url = f"{rest_url}/items/find-by-metadata-field"
-        json_query = {"key": "dc.identifier.other", "value": identifier}
-        resp = requests.post(query_url, json=json_query, verify=False)
-        return resp.text
-        '''if resp.text == "[]":
-            return False
-        else:
-            return True'''
+        identifier = self.namespace.dash_identifier
+        return get_dash_client().find_by_identifier(identifier)
 
     def get_session_key(self):
-        rest_url = os.getenv("DASH_REST_URL",
-                             "https://dspace6-qai.lib.harvard.edu/rest")
-        login_url = f"{rest_url}/login"
-        login_email = os.getenv("DASH_LOGIN_EMAIL")
-        login_pw = os.getenv("DASH_LOGIN_PW")
-        login_info = {"email": login_email, "password": login_pw}
-        resp = requests.post(login_url, data=login_info, verify=False)
-        return resp.cookies.get('JSESSIONID')
+        return get_dash_client().session_key()
 
     def cleanup_test_object(self, base_name):
         if glob.glob('/home/etdadm/data/in/proquest*-' + base_name + '-gsd/submission_' + base_name + '.zip'):  # noqa: E501
@@ -255,16 +288,17 @@ class ETDDashServiceChecks():
         incomingDir = "incoming/gsd"
         zipFile = "submission_999999.zip"
         newZipFile = "submission_" + base_name + ".zip"
-        with pysftp.Connection(host=remoteSite,
-                               username=remoteUser,
-                               private_key=private_key) as sftp:
+        # the fixture, carrying this run's PQ ID
+        fixture = self.namespace.submission_fixture(f"./testdata/{zipFile}")
+        with get_sftp_pool().session(host=remoteSite,
+                                     username=remoteUser,
+                                     private_key=private_key) as sftp:
             # remove any existing test object
             if sftp.exists(f"{archiveDir}/{zipFile}"):
                 sftp.remove(f"{archiveDir}/{zipFile}")
             # sftp test object to incoming dir
             try:
-                sftp.put(f"./testdata/{zipFile}",
-                         f"{incomingDir}/{newZipFile}")
+                sftp.put(fixture, f"{incomingDir}/{newZipFile}")
                 if sftp.exists(f"{incomingDir}/{newZipFile}"):
                     self.logger.info("Test object sftp'd to "
                                      f"{incomingDir}/{newZipFile}")
@@ -282,9 +316,9 @@ class ETDDashServiceChecks():
         dupe_dir = "dupe/gsd"
         file_pattern = re.compile(r'^submission_' + base_name
                                   + r'_\d{14}\.zip$')
-        with pysftp.Connection(host=remoteSite,
-                               username=remoteUser,
-                               private_key=private_key) as sftp:
+        with get_sftp_pool().session(host=remoteSite,
+                                     username=remoteUser,
+                                     private_key=private_key) as sftp:
             # List files in the remote directory
             files = sftp.listdir(dupe_dir)
             # Check if any file matches the specified pattern
@@ -294,18 +328,16 @@ class ETDDashServiceChecks():
 
         return False  # No file with the pattern found
 
-    # Method to return a random string of 10 digits
-    def random_digit_string(self):
-        return ''.join(random.choices(string.digits, k=10))
-
     # Method to validate mapfile for test object.
-    def validate_mapfile(self, base_name, result):
+    def validate_mapfile(self, base_name, result, expected=None):
         """
         Validates the contents of the mapfile generated for a submission.
 
         Args:
             base_name (str): The base name of the submission.
             result (dict): The dictionary containing the test results.
+            expected (Future, optional): The expectation registered with
+                self.fs_watcher for the mapfile, if there is one.
 
         Returns:
             None
@@ -316,8 +348,22 @@ class ETDDashServiceChecks():
         # read mapfile in out/ directory
         out_dir = os.environ.get('ETD_OUT_DIR')
         mapfile_path = f'{out_dir}/proquest*-{base_name}-gsd/mapfile'
-        if glob.glob(mapfile_path):
-            for filename in glob.glob(mapfile_path):
+        if self.fs_watcher is not None:
+            if expected is None:
+                expected = self.fs_watcher.expect(
+                    out_dir, f"proquest*-{base_name}-gsd/mapfile")
+            mapfile_wait = self.fs_watcher.wait(expected)
+            self.wait_timings["mapfile"] = mapfile_wait.as_dict()
+            mapfiles = mapfile_wait.value
+            mapfile_at = expected.registered_at + mapfile_wait.elapsed_secs
+        else:
+            mapfiles = glob.glob(mapfile_path)
+            mapfile_at = None
+        if self.timeline is not None:
+            self.timeline.mark("mapfile present", at=mapfile_at,
+                               ok=bool(mapfiles))
+        if mapfiles:
+            for filename in mapfiles:
                 with open(filename) as f:
                     mapfile = f.read()
                     # make sure contents of mapfile are exactly
@@ -355,22 +401,22 @@ class ETDDashServiceChecks():
             int: The number of times a submission has been submitted to dash.
         """
         rest_url = os.getenv("DASH_REST_URL")
-        resp_text = self.get_dash_object()
-        self.logger.debug(">>> Dash object: " + resp_text)
-
-        count = 0
-        trials = 0
-        max_trials = os.getenv("MAX_TRIALS", 10)
-        sleep_secs = int(os.getenv("SLEEP_SECS", 30))
-        while count != expected_count and trials < max_trials:
-            resp_text = self.get_dash_object()
-            self.logger.debug(">>> Attempting to retrieve Dash object trial \
-                               number {}: {}"
-                              .format(trials, resp_text))
-            count = len(json.loads(resp_text))
-            trials += 1
-            time.sleep(sleep_secs)
-        if count != expected_count:
+        last = {"count": 0, "text": ""}
+
+        def count_matches():
+            last["text"] = self.get_dash_object()
+            self.logger.debug(">>> Dash object: " + last["text"])
+            last["count"] = len(json.loads(last["text"]))
+            return last["count"] == expected_count
+
+        outcome = self.wait_for(f"{error_name} count {expected_count}",
+                                count_matches)
+        count = last["count"]
+        resp_text = last["text"]
+        if isinstance(outcome.error, CircuitOpenError):
+            resp_text = str(outcome.error)
+        # a count of 0 DASH never answered with is not a pass
+        if count != expected_count or not outcome.ok:
             result["num_failed"] += 1
             result["tests_failed"].append(error_name)
             result["info"] = {error_msg:
@@ -386,14 +432,26 @@ class ETDDashServiceChecks():
     def delete_dash_object(self, result):
         self.logger.info("Deleting test object from dash")
         rest_url = os.getenv("DASH_REST_URL")
+        identifier = self.namespace.dash_identifier
+        if not is_reserved_identifier(identifier):
+            # DASH is shared; never delete what may be a real submission
+            result["num_failed"] += 1
+            result["tests_failed"].append("DASH")
+            result["info"] = {"DASH delete refused":
+                              {"status_code": 400,
+                               "identifier": identifier,
+                               "text": "Not a reserved test identifier"}}
+            self.logger.error(f"Refusing to delete {identifier} from dash: "
+                              "not a reserved test identifier")
+            return
         resp_text = self.get_dash_object()
         if resp_text != "[]":
             self.logger.info("Test object found. Proceeding to delete.")
             uuid = json.loads(resp_text)[0]["uuid"]
             url = f"{rest_url}/items/{uuid}"
+            # re-authenticates on its own if the cached session expired
+            response = get_dash_client().delete_item(uuid)
             session_key = self.get_session_key()
-            headers = {'Cookie': f'JSESSIONID={session_key}'}
-            response = requests.delete(url, headers=headers, verify=False)
 
             if response.status_code != 200:
                 result["num_failed"] += 1
@@ -1,21 +1,23 @@
 import os
 import json
-from celery import Celery
-import pysftp
 import glob
 import shutil
-import requests
-import random
-import string
 import logging
-import xml.etree.ElementTree as ET
-import zipfile
+from app.celery_client import get_publisher
+from app.sftp_pool import get_sftp_pool
+from app.http_client import get_dash_client
+from app.submission_zip import rewrite_pq_id
+from app.timeline import Timeline
+from app.run_namespace import RunNamespace
 
 
 class ETDEndToEnd():
 
-    def __init__(self):
+    def __init__(self, namespace=None):
         self.logger = logging.getLogger('etd_int_tests')
+        # names the submission and PQ ID of this run
+        self.namespace = namespace if namespace is not None \
+            else RunNamespace()
 
     def end_to_end(self, indash=True):
         """
@@ -41,10 +43,10 @@ class ETDEndToEnd():
         incoming_queue = os.environ.get('FIRST_QUEUE_NAME',
                                         'etd_submission_ready')
 
-        client = Celery('app')
-        client.config_from_object('celeryconfig')
-
-        base_name = self.random_digit_string()
+        # the submission is named after the run's PQ ID
+        base_name = self.namespace.pq_id
+        timeline = Timeline("etd_end_to_end" if indash
+                            else "etd_end_to_end_no_dash", key=base_name)
 
         # If the test object is for indash, use this one
         zipFile = "submission_999999.zip"
@@ -54,13 +56,13 @@ class ETDEndToEnd():
             zipFile = "submission_no_dash.zip"
             schoolcode = "college"
         newZipFile = "submission_" + base_name + ".zip"
-        shutil.copyfile(f"./testdata/{zipFile}", f"./testdata/{newZipFile}")
-
-        self.replace_pq_id(base_name, f"./testdata/{newZipFile}")
+        self.replace_pq_id(base_name, f"./testdata/{newZipFile}",
+                           f"./testdata/{zipFile}")
         # put the test object in the dropbox
         self.logger.info(">>> SFTP test object")
         try:
             self.sftp_test_object(newZipFile, schoolcode)
+            timeline.mark("upload done")
         except Exception as err:
             result["num_failed"] += 1
             result["tests_failed"].append("SFTP")
@@ -68,9 +70,33 @@ class ETDEndToEnd():
                               {"status_code": 500,
                                "text": str(err)}}
             self.logger.error(str(err))
+            timeline.mark("upload done", ok=False)
 
         # # send the test object to dash
         self.logger.info(">>> Submit test object to dash")
+        self.publish_to_dash(base_name, incoming_queue)
+        timeline.mark("task published")
+        # the run ends once the task is published; later stages are
+        # covered by dash_service
+        result["info"]["Timeline"] = timeline.save()
+        result["info"]["Run namespace"] = self.namespace.as_dict()
+        return result
+
+    def publish_to_dash(self, base_name, incoming_queue=None):
+        """
+        Publishes the send_to_dash task for a submission through the
+        process-wide publisher.
+
+        Args:
+            base_name (str): The submission's PQ ID.
+            incoming_queue (str, optional): Defaults to FIRST_QUEUE_NAME.
+
+        Returns:
+            dict: The publish report (see TaskPublisher.publish_many()).
+        """
+        if incoming_queue is None:
+            incoming_queue = os.environ.get('FIRST_QUEUE_NAME',
+                                            'etd_submission_ready')
         dash_message = {
             "job_ticket_id": f"integration_testing_{base_name}",
             "feature_flags":
@@ -80,28 +106,15 @@ class ETDEndToEnd():
                 "send_to_drs_feature_flag": "on"
             },
         }
-        client.send_task(name="etd-dash-service.tasks.send_to_dash",
-                         args=[dash_message], kwargs={},
-                         queue=incoming_queue)
-        return result
+        return get_publisher().publish(
+            "etd-dash-service.tasks.send_to_dash", dash_message,
+            incoming_queue)
 
     def get_dash_object(self, identifier):
-        rest_url = os.getenv("DASH_REST_URL",
-                             "https://dspace6-qai.lib.harvard.edu/rest")
-        query_url = f"{rest_url}/items/find-by-metadata-field"
-        json_query = {"key": "dc.identifier.other", "value": identifier}
-        resp = requests.post(query_url, json=json_query, verify=False)
-        return resp.text
+        return get_dash_client().find_by_identifier(identifier)
 
     def get_session_key(self):
-        rest_url = os.getenv("DASH_REST_URL",
-                             "https://dspace6-qai.lib.harvard.edu/rest")
-        login_url = f"{rest_url}/login"
-        login_email = os.getenv("DASH_LOGIN_EMAIL")
-        login_pw = os.getenv("DASH_LOGIN_PW")
-        login_info = {"email": login_email, "password": login_pw}
-        resp = requests.post(login_url, data=login_info, verify=False)
-        return resp.cookies.get('JSESSIONID')
+        return get_dash_client().session_key()
 
     def cleanup_test_object(self, base_name, schoolcode="gsd"):
         dirname = 'proquest*-' + base_name + '-' + schoolcode
@@ -120,9 +133,9 @@ class ETDEndToEnd():
         incomingDir = "incoming/" + schoolcode
         self.logger.debug(">>> Test object name: {}".
                           format(submission_zip_object))
-        with pysftp.Connection(host=remoteSite,
-                               username=remoteUser,
-                               private_key=private_key) as sftp:
+        with get_sftp_pool().session(host=remoteSite,
+                                     username=remoteUser,
+                                     private_key=private_key) as sftp:
             # remove any existing test object
             if sftp.exists(f"{archiveDir}/{submission_zip_object}"):
                 sftp.remove(f"{archiveDir}/{submission_zip_object}")
@@ -133,10 +146,6 @@ class ETDEndToEnd():
             except Exception as err:
                 self.logger.error(f"SFTP error: {err}")
 
-    # Method to return a random string of 10 digits
-    def random_digit_string(self):
-        return ''.join(random.choices(string.digits, k=10))
-
     # Check the number of times a submission has been submitted to dash
     def verify_submission_count(self, identifier):  # noqa: E501
         """
@@ -153,29 +162,10 @@ class ETDEndToEnd():
         count = len(json.loads(resp_text))
         return count
 
-    def replace_pq_id(self, new_pq_id, submission_file_path):
-        # Unzip
-        directory_to_extract_to = os.path.join(os.path.dirname(
-            submission_file_path), 'extracted')
-        with zipfile.ZipFile(submission_file_path, 'r') as zip_ref:
-            zip_ref.extractall(directory_to_extract_to)
-
-        # Replace in mets.xml
-        mets_path = os.path.join(directory_to_extract_to, 'mets.xml')
-        tree = ET.parse(mets_path)
-        metsroot = tree.getroot()
-
-        namespaces = {'dim': 'http://www.dspace.org/xmlns/dspace/dim'}
-        metsroot.find(".//dim:field[@mdschema='dc'][@element='identifier'][@qualifier='other']", namespaces).text = new_pq_id # noqa
-        tree.write(mets_path)
-
-        # Delete submission zip
-        os.remove(submission_file_path)
-
-        # Zip
-        with zipfile.ZipFile(submission_file_path, mode="w") as archive:
-            for file in os.listdir(directory_to_extract_to):
-                archive.write(os.path.join(directory_to_extract_to,
-                                           file), file)
-        # Delete extracted directory
-        shutil.rmtree(directory_to_extract_to)
+    def replace_pq_id(self, new_pq_id, submission_file_path,
+                      source_path=None):
+        # Only mets.xml is rewritten; every other member is copied as-is
+        # without extracting the submission to disk.
+        if source_path is None:
+            source_path = submission_file_path
+        rewrite_pq_id(source_path, submission_file_path, new_pq_id)
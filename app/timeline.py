@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+
+class Timeline():
+    """
+    Per-stage timestamps for one end-to-end run.
+
+    Stages are marked with time.monotonic() as they complete (or with
+    the exact time an event was observed, e.g. when a watched file
+    arrived), so a slow run shows which stage the time went to: SFTP
+    upload, Celery pickup, DASH ingest, mapfile writing, dupe routing.
+
+    Usage:
+        timeline = Timeline("dash_service", key=base_name)
+        ... upload ...
+        timeline.mark("upload done")
+        ...
+        result["info"]["Timeline"] = timeline.save()
+    """
+
+    def __init__(self, name, key=None):
+        self.logger = logging.getLogger('etd_int_tests')
+        self.name = name
+        self.key = key
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+        self._marks = []
+        self._lock = threading.Lock()
+
+    def mark(self, stage, at=None, ok=True):
+        """
+        Records that a stage completed.
+
+        Args:
+            stage (str): The stage name, e.g. "task published".
+            at (float, optional): The time.monotonic() the stage
+                completed, if it was observed earlier than now.
+            ok (bool): False if the stage was given up on (e.g. a wait
+                timed out); the mark then records when.
+        """
+        if at is None:
+            at = time.monotonic()
+        with self._lock:
+            self._marks.append((stage, at, ok))
+
+    def as_dict(self):
+        """
+        Returns the timeline in the form kept in result["info"]:
+        offsets from the start of the run and the time spent since the
+        previous stage, in the order the stages completed.
+        """
+        with self._lock:
+            marks = sorted(self._marks, key=lambda m: m[1])
+        stages = []
+        previous = self.started
+        for stage, at, ok in marks:
+            stages.append({"stage": stage,
+                           "at_secs": round(at - self.started, 3),
+                           "since_previous_secs": round(at - previous, 3),
+                           "ok": ok})
+            previous = at
+        return {"name": self.name,
+                "key": self.key,
+                "started_at": datetime.fromtimestamp(
+                    self.started_wall, timezone.utc).isoformat(),
+                "total_secs": round(previous - self.started, 3),
+                "stages": stages}
+
+    def save(self, directory=None):
+        """
+        Appends the timeline as one JSON line to <name>.jsonl in
+        TIMELINE_DIR (default $LOG_DIR/timelines). A failure to write is
+        logged, not raised; the run's result does not depend on it.
+
+        Returns:
+            dict: The timeline, as returned by as_dict().
+        """
+        timeline = self.as_dict()
+        if directory is None:
+            log_dir = os.getenv("LOG_DIR", "/home/etdadm/logs/etd_itest")
+            directory = os.getenv("TIMELINE_DIR", f"{log_dir}/timelines")
+        line = (json.dumps(timeline) + "\n").encode()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # a single O_APPEND write, so lines from concurrent runs and
+            # gunicorn workers do not interleave
+            fd = os.open(os.path.join(directory, f"{self.name}.jsonl"),
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError as err:
+            self.logger.warning(f"Could not save {self.name} timeline: "
+                                f"{err}")
+        return timeline
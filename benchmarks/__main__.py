@@ -0,0 +1,97 @@
+"""
+Times the harness's own steps against the local stand-ins and compares
+them with a stored baseline.
+
+    python -m benchmarks                 compare with the baseline
+    python -m benchmarks --update        record a new baseline
+    python -m benchmarks zip_rewrite     only some steps
+
+Each step is timed in BENCH_ROUNDS (default 3) rounds, taken in turn
+across the steps, and summarized by its fastest round.
+Exits 1 if a step's median is slower than its baseline by more than
+BENCH_THRESHOLD (default 0.25, i.e. 25%), BENCH_MIN_DELTA_SECS (default
+0.001) and the baseline's spread (p95 - median).
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+from app.standins.stack import StandIns
+from benchmarks.runner import measure, summarize, fastest, compare, \
+    load_baseline, save_baseline
+from benchmarks.steps import STEPS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "baseline.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("steps", nargs="*",
+                        help="steps to run (default: all): " +
+                        ", ".join(STEPS))
+    parser.add_argument("--baseline",
+                        default=os.getenv("BENCH_BASELINE",
+                                          DEFAULT_BASELINE))
+    parser.add_argument("--update", action="store_true",
+                        help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float,
+                        default=float(os.getenv("BENCH_THRESHOLD", 0.25)))
+    parser.add_argument("--min-delta-secs", type=float,
+                        default=float(os.getenv("BENCH_MIN_DELTA_SECS",
+                                                0.001)))
+    parser.add_argument("--rounds", type=int,
+                        default=int(os.getenv("BENCH_ROUNDS", 3)))
+    parser.add_argument("--iterations", type=int,
+                        help="override every step's iteration count")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.steps if name not in STEPS]
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(unknown)}")
+    if args.rounds < 1:
+        parser.error("--rounds must be at least 1")
+    names = args.steps or list(STEPS)
+    rounds = {name: [] for name in names}
+    with StandIns(chdir=False) as stand_ins:
+        scratch = tempfile.mkdtemp(prefix="bench-", dir=stand_ins.workdir)
+        steps = {}
+        for name in names:
+            factory, iterations = STEPS[name]
+            step_dir = os.path.join(scratch, name)
+            os.makedirs(step_dir)
+            step, nbytes = factory(stand_ins, step_dir)
+            steps[name] = (step, args.iterations or iterations, nbytes)
+        # rounds go through every step in turn, so a busy spell on the
+        # machine slows one round of a step, not all of them
+        for _ in range(args.rounds):
+            for name, (step, iterations, nbytes) in steps.items():
+                rounds[name].append(
+                    summarize(measure(step, iterations), nbytes))
+        shutil.rmtree(scratch, ignore_errors=True)
+    results = {name: fastest(summaries)
+               for name, summaries in rounds.items()}
+
+    baseline = load_baseline(args.baseline)
+    report = {"results": results}
+    if args.update:
+        save_baseline(args.baseline, results, baseline)
+        report["baseline"] = args.baseline
+        regressions = []
+    else:
+        regressions = compare(results, baseline, args.threshold,
+                              args.min_delta_secs)
+        report["threshold"] = args.threshold
+        report["regressions"] = regressions
+        report["not_in_baseline"] = [name for name in results
+                                     if name not in
+                                     baseline.get("benchmarks", {})]
+    print(json.dumps(report, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import platform
+import statistics
+
+from app.load_generator import percentile
+
+
+def measure(step, iterations, warmup=1):
+    """
+    Times a step.
+
+    Args:
+        step (callable): The step to time, called with no arguments.
+        iterations (int): How many timed calls to make.
+        warmup (int): Untimed calls made first.
+
+    Returns:
+        list: The duration of each timed call, in seconds.
+    """
+    for _ in range(warmup):
+        step()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        step()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples, nbytes=None):
+    """
+    Summarizes the samples of one step. The median is what baselines
+    are compared on; min and p95 show how noisy the step is.
+
+    Args:
+        samples (list): Durations in seconds.
+        nbytes (int, optional): Bytes moved per call, for throughput.
+
+    Returns:
+        dict: iterations, median_secs, min_secs, p95_secs and, with
+            nbytes, bytes and median_bytes_per_sec.
+    """
+    ordered = sorted(samples)
+    median = statistics.median(ordered)
+    summary = {"iterations": len(ordered),
+               "median_secs": round(median, 6),
+               "min_secs": round(ordered[0], 6),
+               "p95_secs": round(percentile(ordered, 95), 6)}
+    if nbytes is not None:
+        summary["bytes"] = nbytes
+        summary["median_bytes_per_sec"] = round(nbytes / median) \
+            if median > 0 else None
+    return summary
+
+
+def fastest(summaries):
+    """
+    Returns the summary of the round with the lowest median, with the
+    number of rounds added. A step that really got slower is slow in
+    every round; one that ran while the machine was busy is not.
+    """
+    best = dict(min(summaries, key=lambda summary: summary["median_secs"]))
+    best["rounds"] = len(summaries)
+    return best
+
+
+def compare(results, baseline, threshold, min_delta_secs):
+    """
+    Finds the steps whose median is slower than the baseline's by more
+    than threshold (a fraction, 0.25 is 25%), more than min_delta_secs
+    and more than the baseline's own spread (p95 - median), so jitter
+    on fast or noisy steps is not reported. Steps missing from the
+    baseline are not compared.
+
+    Returns:
+        list: One dictionary per regressed step.
+    """
+    regressions = []
+    for name, summary in results.items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            continue
+        spread = base.get("p95_secs", base["median_secs"]) - \
+            base["median_secs"]
+        allowed = max(base["median_secs"] * threshold, min_delta_secs,
+                      spread)
+        if summary["median_secs"] - base["median_secs"] > allowed:
+            regressions.append({
+                "benchmark": name,
+                "baseline_median_secs": base["median_secs"],
+                "median_secs": summary["median_secs"],
+                "allowed_secs": round(allowed, 6),
+                "slowdown": round(summary["median_secs"] /
+                                  base["median_secs"], 3)})
+    return regressions
+
+
+def load_baseline(path):
+    """
+    Returns the baseline stored at path, or an empty one if there is
+    none yet.
+    """
+    if not os.path.exists(path):
+        return {"benchmarks": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, baseline=None):
+    """
+    Writes results as the new baseline, keeping the entries of steps
+    that were not run this time.
+    """
+    benchmarks = dict((baseline or {}).get("benchmarks", {}))
+    benchmarks.update(results)
+    document = {"recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "host": {"python": platform.python_version(),
+                         "machine": platform.machine(),
+                         "cpus": os.cpu_count()},
+                "benchmarks": dict(sorted(benchmarks.items()))}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
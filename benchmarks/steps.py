@@ -0,0 +1,137 @@
+"""
+The steps the benchmark suite times. Each factory takes the running
+StandIns and a scratch directory, does its setup untimed and returns the
+step to time and the bytes it moves per call (or None).
+"""
+import os
+import json
+import zipfile
+import itertools
+
+from app.drs_admin_md import DrsAdminMdBuilder
+from app.http_client import get_dash_client
+from app.polling import wait_until
+from app.sftp_pool import get_sftp_pool
+from app.staging import stage_file
+from app.standins.fixtures import write_submission
+from app.submission_zip import rewrite_pq_id
+from app.suite_engine import SuiteEngine, new_result
+
+# a submission the size of a large real one: mets.xml, the thesis and a
+# few big supplements that do not compress
+LARGE_FIXTURE = "submission_bench_large.zip"
+LARGE_SUPPLEMENT_BYTES = 8 * 1024 * 1024
+LARGE_SUPPLEMENTS = 3
+# items in the DSpace stand-in besides the one being polled for
+DSPACE_ITEMS = 1000
+AGGREGATED_SUITES = 50
+
+
+def large_fixture(stand_ins):
+    path = os.path.join(stand_ins.env["TEST_DATA_DIRECTORY"], LARGE_FIXTURE)
+    if not os.path.exists(path):
+        write_submission(path, "PQ-00000001", "thesis.pdf")
+        # appended stored, so the zip is as big as the supplements
+        with zipfile.ZipFile(path, "a", zipfile.ZIP_STORED) as zf:
+            for n in range(LARGE_SUPPLEMENTS):
+                zf.writestr(f"supplement_{n}.bin",
+                            os.urandom(LARGE_SUPPLEMENT_BYTES))
+    return path
+
+
+def zip_rewrite(stand_ins, scratch):
+    source = large_fixture(stand_ins)
+    dest = os.path.join(scratch, "rewritten.zip")
+    ids = (f"{n:010d}" for n in itertools.count())
+
+    def step():
+        rewrite_pq_id(source, dest, next(ids))
+
+    return step, os.path.getsize(source)
+
+
+def payload_build(stand_ins, scratch):
+    fixture = os.path.join(stand_ins.env["TEST_DATA_DIRECTORY"],
+                           "submission_five_gifs.zip")
+    staged = os.path.join(stand_ins.env["ETD_IN_DIR"], "bench",
+                          "submission_five_gifs.zip")
+
+    def step():
+        # as the suites do it: a new builder per payload, with the
+        # manifest and the fixture layout cached across calls
+        DrsAdminMdBuilder().build(fixture, staged)
+
+    return step, None
+
+
+def staging(stand_ins, scratch):
+    source = large_fixture(stand_ins)
+    counter = itertools.count()
+
+    def step():
+        dest_dir = os.path.join(scratch, f"staged_{next(counter)}")
+        os.makedirs(dest_dir)
+        stage_file(source, dest_dir)
+
+    return step, os.path.getsize(source)
+
+
+def sftp_upload(stand_ins, scratch):
+    source = large_fixture(stand_ins)
+    remote = f"incoming/gsd/{LARGE_FIXTURE}"
+
+    def step():
+        with get_sftp_pool().session(
+                host=os.getenv("dropboxServer"),
+                username=os.getenv("dropboxUser"),
+                private_key=os.getenv("PRIVATE_KEY_PATH")) as sftp:
+            sftp.put(source, remote)
+
+    return step, os.path.getsize(source)
+
+
+def dash_polling(stand_ins, scratch):
+    for n in range(DSPACE_ITEMS):
+        stand_ins.dspace.add_item(f"PQ-bench-{n}")
+    identifier = "PQ-bench-polled"
+    stand_ins.dspace.add_item(identifier)
+
+    def step():
+        # one verify_submission_count round: the query, the parse and
+        # the wait_until bookkeeping around it
+        outcome = wait_until(
+            lambda: len(json.loads(
+                get_dash_client().find_by_identifier(identifier))) == 1,
+            description="bench DASH count")
+        if not outcome.ok:
+            raise RuntimeError(f"DASH polling failed: {outcome.error}")
+
+    return step, None
+
+
+def result_aggregation(stand_ins, scratch):
+    def failing_suite():
+        result = new_result()
+        result["num_failed"] = 1
+        result["tests_failed"].append("BENCH")
+        result["info"]["Bench"] = {"status_code": 500, "text": "x" * 200}
+        return result
+
+    suites = {f"suite_{n}": failing_suite for n in range(AGGREGATED_SUITES)}
+    engine = SuiteEngine(suites, {"all": list(suites)})
+
+    def step():
+        engine.run("all")
+
+    return step, None
+
+
+# name -> (factory, iterations)
+STEPS = {
+    "zip_rewrite": (zip_rewrite, 40),
+    "payload_build": (payload_build, 1000),
+    "staging": (staging, 10),
+    "sftp_upload": (sftp_upload, 5),
+    "dash_polling": (dash_polling, 200),
+    "result_aggregation": (result_aggregation, 200),
+}
@@ -7,3 +7,9 @@ result_serializer = 'json'
 timezone = 'Europe/Oslo'
 enable_utc = True
 worker_enable_remote_control = False
+# publishers share a pool of broker connections, and a task only counts
+# as published once the broker has confirmed it
+broker_pool_limit = int(os.getenv('CELERY_BROKER_POOL_LIMIT', 10))
+broker_transport_options = {
+    'confirm_publish': os.getenv('CELERY_CONFIRM_PUBLISH',
+                                 'true').lower() == 'true'}
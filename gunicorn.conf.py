@@ -2,8 +2,11 @@ from datetime import datetime
 import logging
 import os
 import re
+import shutil
 import socket
 import structlog
+from gunicorn.glogging import Logger
+import log_queue
 
 
 class RequestPathFilter(logging.Filter):
@@ -17,11 +20,45 @@ class RequestPathFilter(logging.Filter):
         return not self.path_filter.match(req_path)
 
 
+class QueuedLogger(Logger):
+    '''gunicorn logger that also reopens the log files behind the queue'''
+    def reopen_files(self):
+        super().reopen_files()
+        log_queue.reopen_files()
+
+    def close_on_exec(self):
+        super().close_on_exec()
+        log_queue.close_on_exec()
+
+
 # Hook run at start of gunicorn server process
 def on_starting(server):
     # omit healthcheck URL from access logging
     server.log.access_log.addFilter(RequestPathFilter(
-                                    path_re=r'^/etd_itest/version'))
+                                    path_re=r'^/etd_itest/(version|metrics)'))
+    # counters start from zero once per server start; a HUP reloads this
+    # file but not this hook, so replaced workers' counts are kept
+    for name in os.listdir(prometheus_dir):
+        path = os.path.join(prometheus_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+# Hook run in the master when a worker exits
+def child_exit(server, worker):
+    # fold the dead worker's live metrics out of /metrics
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+# Metrics are shared by the workers through files in this directory.
+# prometheus_client reads it on import, so it is set here, before
+# --preload imports the app; on_starting empties it.
+prometheus_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR",
+                                       "/tmp/etd_itest_prometheus")
+os.makedirs(prometheus_dir, exist_ok=True)
 
 
 # Reload
@@ -47,7 +84,10 @@ if not os.path.exists(f'/home/etdadm/logs/etd_itest/{container_id}'):
 # Get timestamp
 timestamp = datetime.today().strftime('%Y-%m-%d')
 
-# Log config
+# Log config: the handlers queue records for one writer thread per
+# process (see log_queue), so file writes stay off the request path;
+# QueuedLogger reopens the files on USR1 (log rotation)
+logger_class = QueuedLogger
 logconfig_dict = {
     "version": 1,
     "disable_existing_loggers": True,
@@ -60,13 +100,15 @@ logconfig_dict = {
     },
     "handlers": {
         "error_console": {
-            "class": "logging.FileHandler",
+            "()": "log_queue.queued_handler",
+            "target": "logging.FileHandler",
             "formatter": "json_formatter",
             "filename": f"/home/etdadm/logs/etd_itest/{container_id}/error_console_{container_id}_{timestamp}.log",   # noqa: E501
             "mode": "a"
         },
         "console": {
-            "class": "logging.FileHandler",
+            "()": "log_queue.queued_handler",
+            "target": "logging.FileHandler",
             "formatter": "json_formatter",
             "filename": f"/home/etdadm/logs/etd_itest/{container_id}/console_{container_id}_{timestamp}.log",  # noqa: E501
             "mode": "a"
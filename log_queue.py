@@ -0,0 +1,178 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+from logging.config import BaseConfigurator
+from logging.handlers import QueueHandler, QueueListener
+
+_queue = None
+_writer = None
+_queue_handlers = []
+_lock = threading.Lock()
+
+
+class TargetedQueueHandler(QueueHandler):
+    """
+    Formats a record in the thread that logs it and queues it for the
+    writer thread, which hands it on to this handler's targets.
+    """
+
+    def __init__(self, log_queue, targets):
+        super().__init__(log_queue)
+        self.targets = targets
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_queue_targets = self.targets
+        return record
+
+    def close(self):
+        # logging.config closes the handlers it replaces (gunicorn
+        # reloads its log config on HUP); their targets go with them
+        with _lock:
+            if self in _queue_handlers:
+                _queue_handlers.remove(self)
+        for target in self.targets:
+            target.close()
+        super().close()
+
+
+class LogWriter(QueueListener):
+    """
+    The thread that writes every queued record of a process to the
+    targets of the handler that queued it, respecting their levels.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        # held while a record is written, so files are not reopened
+        # under it
+        self.write_lock = threading.Lock()
+
+    def handle(self, record):
+        record = self.prepare(record)
+        with self.write_lock:
+            for target in record.log_queue_targets:
+                if record.levelno >= target.level:
+                    target.handle(record)
+
+
+def queue_handler(*targets):
+    """
+    Returns a handler that puts records on this process's log queue,
+    from which a single writer thread hands them on to targets.
+
+    Records are formatted by the returned handler, in the thread that
+    logs them; only the writing, e.g. to a file on a slow NFS volume, is
+    left to the writer thread, so logging never waits on I/O. The queue
+    is unbounded.
+
+    Args:
+        targets (logging.Handler): The handlers that write the records.
+            Their formatters are not used.
+
+    Returns:
+        TargetedQueueHandler: The handler to attach to a logger.
+    """
+    global _queue, _writer
+    with _lock:
+        if _queue is None:
+            _queue = queue.SimpleQueue()
+        if _writer is None:
+            _writer = _start_writer()
+        handler = TargetedQueueHandler(_queue, targets)
+        _queue_handlers.append(handler)
+        return handler
+
+
+def queued_handler(target="logging.StreamHandler", **kwargs):
+    """
+    A logging.config handler factory: the target handler class, built
+    from the remaining keys, behind queue_handler(), e.g.
+    {"()": "log_queue.queued_handler", "target": "logging.FileHandler",
+    "filename": ...}.
+    """
+    if isinstance(target, str):
+        target = BaseConfigurator({}).resolve(target)
+    return queue_handler(target(**kwargs))
+
+
+def file_targets():
+    """
+    Returns the FileHandlers that queue handlers write to.
+    """
+    targets = []
+    for handler in _queue_handlers:
+        for target in handler.targets:
+            if isinstance(target, logging.FileHandler) and \
+                    target not in targets:
+                targets.append(target)
+    return targets
+
+
+def reopen_files():
+    """
+    Reopens the files that queue handlers write to, e.g. after log
+    rotation; gunicorn's own reopen_files() does not see them behind
+    the queue. The writer thread does not write while they are reopened.
+    """
+    with _lock:
+        write_lock = _writer.write_lock if _writer is not None \
+            else threading.Lock()
+        with write_lock:
+            for target in file_targets():
+                target.acquire()
+                try:
+                    if target.stream:
+                        target.close()
+                        target.stream = target._open()
+                finally:
+                    target.release()
+
+
+def close_on_exec():
+    """
+    Keeps the files that queue handlers write to from being inherited by
+    processes this one executes.
+    """
+    for target in file_targets():
+        if target.stream:
+            os.set_inheritable(target.stream.fileno(), False)
+
+
+def stop():
+    """
+    Writes out the records still queued and stops the writer thread.
+    """
+    global _writer
+    with _lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
+
+
+def _start_writer():
+    writer = LogWriter(_queue)
+    writer.start()
+    return writer
+
+
+def _reset_after_fork():
+    # The writer thread does not survive a fork (gunicorn --preload sets
+    # logging up in the master); give the child its own queue and
+    # thread. Records the parent had still queued are the parent's to
+    # write.
+    global _queue, _writer, _lock
+    _lock = threading.Lock()
+    if _writer is None:
+        return
+    _queue = queue.SimpleQueue()
+    for handler in _queue_handlers:
+        handler.queue = _queue
+    _writer = _start_writer()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+# runs before logging's own shutdown, which closes the targets
+atexit.register(stop)
@@ -0,0 +1,35 @@
+from benchmarks.runner import compare, fastest
+
+BASELINE = {"benchmarks": {
+    "fast": {"median_secs": 0.002, "p95_secs": 0.0026},
+    "noisy": {"median_secs": 0.030, "p95_secs": 0.045},
+}}
+
+
+def result(median_secs):
+    return {"median_secs": median_secs}
+
+
+def test_slowdown_beyond_every_allowance_is_a_regression():
+    regressions = compare({"fast": result(0.0035)}, BASELINE, 0.25, 0.001)
+    assert [r["benchmark"] for r in regressions] == ["fast"]
+    assert regressions[0]["allowed_secs"] == 0.001
+
+
+def test_min_delta_covers_jitter_on_fast_steps():
+    assert compare({"fast": result(0.0029)}, BASELINE, 0.25, 0.001) == []
+
+
+def test_baseline_spread_covers_noisy_steps():
+    # 40% slower, but within the baseline's p95 - median
+    assert compare({"noisy": result(0.042)}, BASELINE, 0.25, 0.001) == []
+    assert compare({"noisy": result(0.046)}, BASELINE, 0.25, 0.001) != []
+
+
+def test_steps_missing_from_the_baseline_are_not_compared():
+    assert compare({"new": result(1.0)}, BASELINE, 0.25, 0.001) == []
+
+
+def test_fastest_round_is_kept():
+    summaries = [result(0.003), result(0.002), result(0.004)]
+    assert fastest(summaries) == {"median_secs": 0.002, "rounds": 3}
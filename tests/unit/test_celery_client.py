@@ -0,0 +1,74 @@
+import pytest
+from celery import Celery
+
+from app.celery_client import TaskPublisher, _latency_summary
+
+TASK = "etd-dash-service.tasks.send_to_dash"
+QUEUE = "etd_submission_ready"
+
+
+def celery_app(broker="memory://", confirm_publish=True):
+    app = Celery("test_celery_client", broker=broker)
+    app.conf.broker_transport_options = {"confirm_publish": confirm_publish}
+    return app
+
+
+def queued(app):
+    with app.connection_for_read() as connection:
+        with connection.SimpleQueue(QUEUE) as simple_queue:
+            return simple_queue.qsize()
+
+
+def test_publish_many_counts_the_batch():
+    app = celery_app()
+    publisher = TaskPublisher(app=app)
+    # memory:// queues are shared by the whole process
+    before = queued(app)
+    report = publisher.publish_many(TASK, [{"n": 1}, {"n": 2}, {"n": 3}],
+                                    QUEUE)
+    publisher.publish(TASK, {"n": 4}, QUEUE)
+    assert report["published"] == 3
+    assert set(report["confirm_latency_secs"]) == {"p50", "p95", "max"}
+    assert queued(app) - before == 4
+    snapshot = publisher.snapshot()
+    assert snapshot["published"] == 4
+    assert snapshot["batches"] == 2
+    assert snapshot["failed_batches"] == 0
+    assert snapshot["confirm_latency_secs"]["max"] is not None
+
+
+def test_failed_batch_counts_what_was_published(monkeypatch):
+    app = celery_app()
+    publisher = TaskPublisher(app=app)
+    send_task = app.send_task
+    calls = []
+
+    def fail_second(*args, **kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ConnectionResetError("broker went away")
+        return send_task(*args, **kwargs)
+
+    monkeypatch.setattr(app, "send_task", fail_second)
+    with pytest.raises(ConnectionResetError):
+        publisher.publish_many(TASK, [{"n": 1}, {"n": 2}, {"n": 3}], QUEUE)
+    snapshot = publisher.snapshot()
+    assert snapshot["published"] == 1
+    assert snapshot["batches"] == 1
+    assert snapshot["failed_batches"] == 1
+
+
+def test_confirms_only_on_amqp_brokers():
+    assert not TaskPublisher(app=celery_app()).confirms()
+    assert TaskPublisher(
+        app=celery_app("pyamqp://guest@localhost//")).confirms()
+    assert not TaskPublisher(
+        app=celery_app("pyamqp://guest@localhost//",
+                       confirm_publish=False)).confirms()
+
+
+def test_latency_summary():
+    latencies = [0.4, 0.1, 0.3, 0.2] + [0.05] * 16
+    assert _latency_summary(latencies) == {"p50": 0.05, "p95": 0.3,
+                                           "max": 0.4}
+    assert _latency_summary([]) == {"p50": None, "p95": None, "max": None}
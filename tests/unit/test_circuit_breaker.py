@@ -0,0 +1,135 @@
+import pytest
+
+from app import circuit_breaker
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.deadline import Deadline, DeadlineExceeded
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def succeed():
+    return "ok"
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=3, reset_secs=30)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    snapshot = breaker.snapshot()
+    assert snapshot["state"] == CircuitBreaker.OPEN
+    assert snapshot["opened"] == 1
+    assert snapshot["retry_in_secs"] == 30
+
+
+def test_success_resets_the_count(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=2, reset_secs=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.call(succeed) == "ok"
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_rejects_without_calling(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=1, reset_secs=30)
+    trip(breaker)
+    calls = []
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as err:
+        breaker.call(calls.append, 1)
+    assert calls == []
+    assert err.value.retry_in_secs == pytest.approx(20)
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_half_open_trial_success_closes(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=1, reset_secs=30)
+    trip(breaker)
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.snapshot()["state"] == CircuitBreaker.HALF_OPEN
+    # only the trial call goes through
+    with pytest.raises(CircuitOpenError):
+        breaker.call(succeed)
+    breaker.record_success()
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+    assert breaker.call(succeed) == "ok"
+
+
+def test_half_open_trial_failure_reopens(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=3, reset_secs=30)
+    trip(breaker)
+    clock.now += 31
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    snapshot = breaker.snapshot()
+    assert snapshot["state"] == CircuitBreaker.OPEN
+    assert snapshot["retry_in_secs"] == 30
+    assert snapshot["opened"] == 2
+
+
+def test_other_errors_and_answers_do_not_count(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=1, reset_secs=30)
+    with pytest.raises(FileNotFoundError):
+        breaker.call(open, "/nonexistent", failure_types=(ConnectionError,))
+    assert breaker.call(lambda: 404, is_failure=lambda s: s >= 500) == 404
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+    assert breaker.call(lambda: 503, is_failure=lambda s: s >= 500) == 503
+    assert breaker.snapshot()["state"] == CircuitBreaker.OPEN
+
+
+def run_out_of_time():
+    raise DeadlineExceeded("DASH GET", Deadline(0))
+
+
+def test_deadline_exceeded_is_no_outcome(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=2, reset_secs=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    with pytest.raises(DeadlineExceeded):
+        breaker.call(run_out_of_time)
+    # the failure count was not reset
+    assert breaker.snapshot()["consecutive_failures"] == 1
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.snapshot()["state"] == CircuitBreaker.OPEN
+
+
+def test_deadline_exceeded_trial_does_not_close(clock):
+    breaker = CircuitBreaker("DASH", failure_threshold=1, reset_secs=30)
+    trip(breaker)
+    clock.now += 30
+    with pytest.raises(DeadlineExceeded):
+        breaker.call(run_out_of_time)
+    assert breaker.snapshot()["state"] == CircuitBreaker.HALF_OPEN
+    # the next call is the trial
+    assert breaker.call(succeed) == "ok"
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
@@ -0,0 +1,62 @@
+import pytest
+
+from app.deadline import DeadlineExceeded, clamp_timeout, \
+    current_deadline, deadline_step, note_failure, run_deadline
+
+
+def test_no_deadline_leaves_timeouts_alone():
+    assert current_deadline() is None
+    assert clamp_timeout(30, "DASH GET") == 30
+    assert clamp_timeout(None, "DASH GET") is None
+
+
+def test_timeouts_are_capped_at_the_budget_left():
+    with run_deadline(10) as deadline:
+        assert current_deadline() is deadline
+        assert clamp_timeout(1, "DASH GET") == 1
+        assert 9 < clamp_timeout(30, "DASH GET") <= 10
+        assert 9 < clamp_timeout(None, "DASH GET") <= 10
+    assert current_deadline() is None
+
+
+def test_no_budget_left_raises_and_names_the_step():
+    with run_deadline(0) as deadline:
+        with pytest.raises(DeadlineExceeded) as err:
+            clamp_timeout(30, "DASH GET")
+        assert err.value.step == "DASH GET"
+        assert deadline.exhausted_by == "DASH GET"
+        assert deadline.as_dict()["exhausted_by"] == "DASH GET"
+
+
+def test_steps_name_the_call_inside_them():
+    with run_deadline(0) as deadline, deadline_step("DASH count 1"):
+        with pytest.raises(DeadlineExceeded):
+            clamp_timeout(30, "DASH POST find")
+        assert deadline.exhausted_by == "DASH count 1 (DASH POST find)"
+
+
+def test_nested_steps_of_the_same_name_are_not_repeated():
+    with run_deadline(0) as deadline, deadline_step("wait"), \
+            deadline_step("wait"):
+        note_failure("wait")
+        assert deadline.exhausted_by == "wait"
+
+
+def test_first_step_to_run_out_is_kept():
+    with run_deadline(0) as deadline:
+        note_failure("SFTP put")
+        with deadline_step("DASH count 1"):
+            note_failure("DASH GET")
+        assert deadline.exhausted_by == "SFTP put"
+
+
+def test_failure_with_budget_left_is_not_blamed():
+    with run_deadline(10) as deadline:
+        note_failure("DASH GET")
+        assert deadline.exhausted_by is None
+
+
+def test_no_budget_means_no_deadline():
+    with run_deadline(None) as deadline:
+        assert deadline is None
+        assert current_deadline() is None
@@ -0,0 +1,142 @@
+import os
+import json
+
+import pytest
+
+from app import drs_admin_md
+from app.drs_admin_md import DrsAdminMdBuilder
+from app.standins.fixtures import write_submission
+
+
+def write_manifest(path, pq_id):
+    with open(path, "w") as f:
+        json.dump({"fixture.zip": {"osn_prefix": "TEST", "pq_id": pq_id,
+                                   "thesis": "thesis.pdf"}}, f)
+
+
+def test_manifest_is_parsed_once(tmp_path, monkeypatch):
+    path = tmp_path / "manifest.json"
+    write_manifest(path, "PQ-1")
+    loads = []
+    load = json.load
+
+    def counting_load(f):
+        loads.append(f.name)
+        return load(f)
+
+    monkeypatch.setattr(drs_admin_md.json, "load", counting_load)
+    first = DrsAdminMdBuilder(str(path))
+    second = DrsAdminMdBuilder(str(path))
+    assert first.manifest is second.manifest
+    assert len(loads) == 1
+
+
+def test_changed_manifest_is_read_again(tmp_path):
+    path = tmp_path / "manifest.json"
+    write_manifest(path, "PQ-1")
+    assert DrsAdminMdBuilder(str(path)).manifest[
+        "fixture.zip"]["pq_id"] == "PQ-1"
+    write_manifest(path, "PQ-22")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert DrsAdminMdBuilder(str(path)).manifest[
+        "fixture.zip"]["pq_id"] == "PQ-22"
+
+
+MANIFEST = os.path.join(os.path.dirname(__file__), "..", "..",
+                        "drs_manifest.json")
+TIMESTAMP = "1700000000"
+
+
+def osns(role, base, suffix=""):
+    return {"object_osn": f"ETD_{role}_{base}{suffix}",
+            "file_osn": f"ETD_{role}_{base}{suffix}_1"}
+
+
+def test_audio_payload(tmp_path):
+    # the payload the hand-written builder used to produce
+    fixture = str(tmp_path / "submission_audio.zip")
+    write_submission(fixture, "PQ-30494273",
+                     "MLA Thesis_Auger_Catherine_May2023.pdf",
+                     ["Gamelan_Islam.mp3", "Harry Styles.mp3",
+                      "Jalan Raya Ubud.mp3"])
+    payload = DrsAdminMdBuilder(MANIFEST).build(fixture, "/staged/audio",
+                                                timestamp=TIMESTAMP)
+    base = f"gsd_2023-05_PQ_30494273_{TIMESTAMP}"
+    assert payload == {
+        "package_id": f"ETD_TESTING_{TIMESTAMP}",
+        "fs_source_path": "/staged/audio",
+        "s3_path": "",
+        "s3_bucket_name": "",
+        "depositing_application": "ETD",
+        "admin_metadata": {
+            "depositingSystem": "ETD",
+            "ownerCode": "HUL.TEST",
+            "billingCode": "HUL.TEST.BILL_0001",
+            "urnAuthorityPath": "HUL.TEST",
+            "original_queue": "test",
+            "task_name": "test",
+            "retry_count": 0,
+            "dash_id": "TEST1234",
+            "pq_id": "PQ-30494273",
+            "alma_id": "99156631569803941",
+            "file_info": {
+                "mets.xml": {
+                    "modified_file_name": "mets.xml",
+                    "object_role": "DOCUMENTATION",
+                    **osns("DOCUMENTATION", base)},
+                "setup_PQ-30494273.pdf": {
+                    "modified_file_name": "setup_PQ-30494273.pdf",
+                    "object_role": "LICENSE",
+                    **osns("LICENSE", base)},
+                "MLA Thesis_Auger_Catherine_May2023.pdf": {
+                    "modified_file_name":
+                        "MLA_Thesis_Auger_Catherine_May2023.pdf",
+                    "object_role": "THESIS",
+                    **osns("THESIS", base)},
+                "Gamelan_Islam.mp3": {
+                    "modified_file_name": "Gamelan_Islam.mp3",
+                    "object_role": "THESIS_SUPPLEMENT",
+                    **osns("SUPPLEMENT", base, "_1")},
+                "Harry Styles.mp3": {
+                    "modified_file_name": "Harry_Styles.mp3",
+                    "object_role": "THESIS_SUPPLEMENT",
+                    **osns("SUPPLEMENT", base, "_2")},
+                "Jalan Raya Ubud.mp3": {
+                    "modified_file_name": "Jalan_Raya_Ubud.mp3",
+                    "object_role": "THESIS_SUPPLEMENT",
+                    **osns("SUPPLEMENT", base, "_3")}}}}
+    assert "mmsid" not in payload["admin_metadata"]
+
+
+def test_supplements_are_numbered_in_zip_order(tmp_path):
+    fixture = str(tmp_path / "submission_five_gifs.zip")
+    gifs = ["GIF_05_Room_2.TwoLiv.gif", "GIF_01_SlabShift.gif",
+            "GIF 03 Facade2SW.gif"]
+    write_submission(fixture, "PQ-28542548",
+                     "20210524_Thesis Archival Submission_JB Signed.pdf",
+                     gifs)
+    payload = DrsAdminMdBuilder(MANIFEST).build(fixture, "/staged/gifs",
+                                                timestamp=TIMESTAMP)
+    metadata = payload["admin_metadata"]
+    assert metadata["mmsid"] == "12345"
+    assert metadata["pq_id"] == "PQ-28542548"
+    base = f"test_2021-05_PQ_28542548_{TIMESTAMP}"
+    file_info = metadata["file_info"]
+    for n, gif in enumerate(gifs, 1):
+        assert file_info[gif]["object_osn"] == \
+            f"ETD_SUPPLEMENT_{base}_{n}"
+        assert file_info[gif]["file_osn"] == f"ETD_SUPPLEMENT_{base}_{n}_1"
+    assert file_info["GIF 03 Facade2SW.gif"]["modified_file_name"] == \
+        "GIF_03_Facade2SW.gif"
+    thesis = file_info["20210524_Thesis Archival Submission_JB Signed.pdf"]
+    assert thesis["object_role"] == "THESIS"
+    assert thesis["modified_file_name"] == \
+        "20210524_Thesis_Archival_Submission_JB_Signed.pdf"
+
+
+def test_fixture_not_in_the_manifest(tmp_path):
+    fixture = str(tmp_path / "submission_unknown.zip")
+    write_submission(fixture, "PQ-1", "thesis.pdf")
+    with pytest.raises(KeyError):
+        DrsAdminMdBuilder(MANIFEST).build(fixture, "/staged")
@@ -0,0 +1,57 @@
+import os
+import time
+
+import pytest
+
+from app.fs_watch import FsWatcher
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    with FsWatcher([str(tmp_path)], mode=FsWatcher.INOTIFY) as watcher:
+        if watcher.mode != FsWatcher.INOTIFY:
+            pytest.skip("inotify is not available")
+        yield watcher
+
+
+def test_file_arrives_when_closed(tmp_path, watcher):
+    future = watcher.expect(str(tmp_path), "mapfile")
+    with open(tmp_path / "mapfile", "w") as f:
+        f.write("first half ")
+        f.flush()
+        time.sleep(0.2)
+        assert not future.done()
+        f.write("second half")
+    outcome = watcher.wait(future, timeout=5)
+    assert outcome.ok
+    with open(outcome.value[0]) as f:
+        assert f.read() == "first half second half"
+
+
+def test_file_moved_into_place_arrives(tmp_path, watcher):
+    future = watcher.expect(str(tmp_path), "mapfile")
+    staging = tmp_path.parent / f"{tmp_path.name}.mapfile.tmp"
+    staging.write_text("contents")
+    os.rename(staging, tmp_path / "mapfile")
+    assert watcher.wait(future, timeout=5).ok
+
+
+def test_file_in_new_subdirectory_arrives_when_closed(tmp_path, watcher):
+    future = watcher.expect(str(tmp_path), "proquest*-123-gsd/mapfile")
+    batch = tmp_path / "proquest2024-123-gsd"
+    batch.mkdir()
+    time.sleep(0.2)
+    with open(batch / "mapfile", "w") as f:
+        f.write("partial")
+        f.flush()
+        time.sleep(0.2)
+        assert not future.done()
+    outcome = watcher.wait(future, timeout=5)
+    assert outcome.ok
+    assert outcome.value == [str(batch / "mapfile")]
+
+
+def test_existing_entries_resolve_at_once(tmp_path):
+    (tmp_path / "mapfile").write_text("contents")
+    with FsWatcher([str(tmp_path)], mode=FsWatcher.SCAN) as watcher:
+        assert watcher.wait_for(str(tmp_path), "mapfile", timeout=1).ok
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from app.history_store import HISTOGRAM_GROWTH, HistoryStore, window_secs
+
+# the middle of the current hour: recent enough not to be pruned, and
+# runs a minute before it fall in the same hour
+NOW = time.time() // 3600 * 3600 + 1800
+
+
+def passed():
+    return {"num_failed": 0, "tests_failed": [], "info": {}}
+
+
+def failed():
+    return {"num_failed": 1, "tests_failed": ["DASH"], "info": {}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(path=str(tmp_path / "history.sqlite3"))
+
+
+def record(store, elapsed, started_at=NOW - 60, result=None, leaves=None):
+    store.record("etd_basic", result or passed(), leaves or {}, started_at,
+                 started_at + elapsed)
+
+
+def assert_within_a_bin(value, exact):
+    # a percentile is its bin's upper bound: at or above the true value,
+    # by less than one bin
+    assert exact <= value <= exact * HISTOGRAM_GROWTH + 0.001
+
+
+def test_percentiles_of_run_times(store):
+    for elapsed in range(1, 101):
+        record(store, elapsed)
+    stats = store.stats("etd_basic", ["1h"], now=NOW)["1h"]
+    assert stats["runs"] == 100
+    assert_within_a_bin(stats["elapsed"]["p50"], 50)
+    assert_within_a_bin(stats["elapsed"]["p95"], 95)
+    assert_within_a_bin(stats["elapsed"]["p99"], 99)
+
+
+def test_a_single_run_is_every_percentile(store):
+    record(store, 2.5)
+    elapsed = store.stats("etd_basic", ["1h"], now=NOW)["1h"]["elapsed"]
+    for name in ("p50", "p95", "p99"):
+        assert_within_a_bin(elapsed[name], 2.5)
+
+
+def test_failure_rates(store):
+    for _ in range(3):
+        record(store, 1)
+    record(store, 1, result=failed())
+    stats = store.stats("etd_basic", ["1h"], now=NOW)["1h"]
+    assert stats["failures"] == 1
+    assert stats["failure_rate"] == 0.25
+
+
+def test_untimed_steps_count_but_have_no_duration(store):
+    record(store, 5, leaves={"dash_service": {"status": "skipped",
+                                              "elapsed_secs": None}})
+    record(store, 5, leaves={"dash_service": {"status": "passed",
+                                              "elapsed_secs": 4.0}})
+    step = store.stats("etd_basic", ["1h"],
+                       now=NOW)["1h"]["steps"]["dash_service"]
+    assert step["count"] == 2
+    assert step["failures"] == 1
+    assert_within_a_bin(step["p50"], 4.0)
+    assert_within_a_bin(step["p99"], 4.0)
+
+
+def test_windows_are_rolling(store):
+    # in the hour before this one, but within the last 60 minutes
+    record(store, 1, started_at=NOW - 1860)
+    record(store, 1, started_at=NOW - 2 * 3600)
+    stats = store.stats("etd_basic", ["1h", "3h"], now=NOW)
+    assert stats["1h"]["runs"] == 1
+    assert stats["3h"]["runs"] == 2
+
+
+def test_windows_cover_whole_hours(store):
+    record(store, 1)
+    record(store, 100, started_at=NOW - 2 * 86400)
+    stats = store.stats("etd_basic", ["1h", "24h", "7d"], now=NOW)
+    assert stats["1h"]["runs"] == 1
+    assert stats["24h"]["runs"] == 1
+    assert stats["7d"]["runs"] == 2
+    assert_within_a_bin(stats["7d"]["elapsed"]["p99"], 100)
+
+
+def test_no_runs(store):
+    stats = store.stats("etd_basic", ["24h"], now=NOW)["24h"]
+    assert stats["runs"] == 0
+    assert stats["failure_rate"] is None
+    assert stats["elapsed"] == {"p50": None, "p95": None, "p99": None}
+
+
+def test_runs_are_newest_first(store):
+    record(store, 1, started_at=NOW - 120)
+    record(store, 2, started_at=NOW - 60)
+    runs = store.runs()
+    assert [run["elapsed_secs"] for run in runs] == [2, 1]
+    assert store.runs(before=NOW - 90)[0]["elapsed_secs"] == 1
+
+
+@pytest.mark.parametrize("window, secs", [("90m", 5400), ("24h", 86400),
+                                          (" 7d", 604800)])
+def test_window_secs(window, secs):
+    assert window_secs(window) == secs
+
+
+@pytest.mark.parametrize("window", ["24", "0h", "h", "1w", "-1d"])
+def test_bad_window(window):
+    with pytest.raises(ValueError):
+        window_secs(window)
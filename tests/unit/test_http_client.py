@@ -0,0 +1,101 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from app import circuit_breaker
+from app.deadline import DeadlineExceeded, run_deadline
+from app.http_client import HttpClient
+
+
+class Response():
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+def refused():
+    return requests.exceptions.ConnectionError(MaxRetryError(
+        None, "/", NewConnectionError(None, "Connection refused")))
+
+
+class Session():
+    """
+    Answers requests with the given responses and exceptions, in order.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return Response(outcome)
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+
+def client_with(monkeypatch, *outcomes, **kwargs):
+    kwargs.setdefault("retries", 3)
+    kwargs.setdefault("backoff_factor", 0.001)
+    client = HttpClient(timeout=30, **kwargs)
+    session = Session(*outcomes)
+    monkeypatch.setattr(client, "session", lambda: session)
+    return client, session
+
+
+def test_idempotent_call_is_retried(monkeypatch):
+    client, session = client_with(
+        monkeypatch, 503, requests.exceptions.ReadTimeout(), 200)
+    assert client.get("http://dash/items", "DASH").status_code == 200
+    assert len(session.timeouts) == 3
+    assert circuit_breaker.get_breaker("DASH").snapshot()["calls"] == 1
+
+
+def test_last_response_is_returned_when_retries_run_out(monkeypatch):
+    client, session = client_with(monkeypatch, 503, 503, 503, 503)
+    assert client.get("http://dash/items").status_code == 503
+    assert len(session.timeouts) == 4
+
+
+def test_post_is_not_sent_twice(monkeypatch):
+    client, session = client_with(monkeypatch, 503)
+    assert client.post("http://dims/ingest").status_code == 503
+    client, session = client_with(monkeypatch,
+                                  requests.exceptions.ReadTimeout())
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post("http://dims/ingest")
+    assert len(session.timeouts) == 1
+
+
+def test_post_that_never_connected_is_retried(monkeypatch):
+    client, session = client_with(
+        monkeypatch, refused(), requests.exceptions.ConnectTimeout(), 200)
+    assert client.post("http://dims/ingest").status_code == 200
+    assert len(session.timeouts) == 3
+
+
+def test_retries_stop_within_the_deadline(monkeypatch):
+    client, session = client_with(monkeypatch, 503, 503, 503, 503,
+                                  backoff_factor=0.2)
+    with run_deadline(0.5):
+        assert client.get("http://dash/items").status_code == 503
+    # 0.2s then 0.4s of backoff would overrun the budget
+    assert len(session.timeouts) == 2
+    assert all(timeout <= 0.5 for timeout in session.timeouts)
+    assert session.timeouts[1] < 0.31
+
+
+def test_call_without_budget_is_refused_before_the_breaker(monkeypatch):
+    client, session = client_with(monkeypatch, 200)
+    with run_deadline(0), pytest.raises(DeadlineExceeded):
+        client.get("http://dash/items", "DASH")
+    assert session.timeouts == []
+    assert circuit_breaker.breaker_states() == {}
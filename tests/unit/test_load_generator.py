@@ -0,0 +1,85 @@
+import pytest
+
+from app.load_generator import LoadGenerator, _latency_summary, \
+    percentile, summarize
+
+START = 1000.0
+
+
+def record(scheduled, finished, ok, error=None, publish_secs=None):
+    return {"index": 0, "pq_id": "9900000000", "scheduled_at": scheduled,
+            "started_at": scheduled, "finished_at": finished, "ok": ok,
+            "error": error, "publish_secs": publish_secs}
+
+
+RECORDS = [
+    record(1000, 1010, True, publish_secs=0.1),
+    record(1006, 1030, True, publish_secs=0.3),
+    record(1012, 1070, False, "dash: not visible before the timeout",
+           publish_secs=0.25),
+    record(1018, 1100, True, publish_secs=0.2),
+    record(1024, 1025, False, "upload: Failure"),
+]
+
+
+def test_overall_figures():
+    report = summarize(RECORDS, START, 60)
+    assert report["submitted"] == 5
+    assert report["succeeded"] == 3
+    assert report["failed"] == 2
+    assert report["error_rate"] == 0.4
+    assert report["duration_secs"] == 100
+    assert report["throughput_per_min"] == 1.8
+    # latency runs from when a submission was scheduled
+    assert report["latency_secs"] == {"p50": 24, "p95": 82, "p99": 82,
+                                      "max": 82}
+    assert report["publish_secs"] == {"p50": 0.2, "p95": 0.3, "p99": 0.3,
+                                      "max": 0.3}
+    assert report["errors"] == {"dash: not visible before the timeout": 1,
+                                "upload: Failure": 1}
+
+
+def test_buckets_by_finish_time():
+    buckets = summarize(RECORDS, START, 60)["buckets"]
+    assert [b["start_secs"] for b in buckets] == [0, 60]
+    first, second = buckets
+    assert (first["completed"], first["succeeded"], first["failed"]) == \
+        (3, 2, 1)
+    assert first["error_rate"] == 0.3333
+    assert first["throughput_per_min"] == 2.0
+    assert first["latency_secs"]["p50"] == 10
+    assert first["latency_secs"]["p95"] == 24
+    assert (second["completed"], second["succeeded"]) == (2, 1)
+    assert second["error_rate"] == 0.5
+    assert second["throughput_per_min"] == 1.0
+    assert second["latency_secs"]["max"] == 82
+
+
+def test_no_records():
+    report = summarize([], START, 60)
+    assert report["submitted"] == 0
+    assert report["error_rate"] == 0.0
+    assert report["buckets"] == []
+    assert report["latency_secs"] == {"p50": None, "p95": None,
+                                      "p99": None, "max": None}
+
+
+def test_nearest_rank_percentiles():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 95) == 7
+    assert _latency_summary([3, 1, 2])["max"] == 3
+
+
+@pytest.mark.parametrize("argument", ["concurrency", "rate_per_min",
+                                      "submissions", "bucket_secs"])
+def test_zero_is_refused(argument):
+    with pytest.raises(ValueError):
+        LoadGenerator(**{argument: 0})
+
+
+def test_zero_rate_from_the_environment_is_refused(monkeypatch):
+    monkeypatch.setenv("LOAD_RATE_PER_MIN", "0")
+    with pytest.raises(ValueError):
+        LoadGenerator()
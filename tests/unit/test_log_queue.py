@@ -0,0 +1,76 @@
+import logging
+import time
+
+import log_queue
+
+
+class Collect(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def logger_with(name, *targets):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = log_queue.queue_handler(*targets)
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_records_reach_only_their_handlers_targets():
+    everything, errors, other = Collect(), Collect(logging.ERROR), Collect()
+    app_logger, app_handler = logger_with("test_log_queue.app",
+                                          everything, errors)
+    other_logger, other_handler = logger_with("test_log_queue.other", other)
+    try:
+        app_logger.info("started %s", "run")
+        app_logger.error("failed")
+        other_logger.info("elsewhere")
+        log_queue.stop()
+    finally:
+        app_logger.removeHandler(app_handler)
+        other_logger.removeHandler(other_handler)
+    assert everything.messages == ["started run", "failed"]
+    assert errors.messages == ["failed"]
+    assert other.messages == ["elsewhere"]
+
+
+def wait_for_line(path, line, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if path.exists() and line in path.read_text().splitlines():
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"{line!r} not written to {path}")
+
+
+def test_reopen_files_after_rotation(tmp_path):
+    path = tmp_path / "console.log"
+    target = logging.FileHandler(path)
+    logger, handler = logger_with("test_log_queue.rotated", target)
+    try:
+        logger.info("before")
+        wait_for_line(path, "before")
+        path.rename(tmp_path / "console.log.1")
+        log_queue.reopen_files()
+        logger.info("after")
+        wait_for_line(path, "after")
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    assert (tmp_path / "console.log.1").read_text().splitlines() == ["before"]
+    assert path.read_text().splitlines() == ["after"]
+
+
+def test_closed_handlers_targets_are_closed_and_not_reopened(tmp_path):
+    target = logging.FileHandler(tmp_path / "console.log")
+    handler = log_queue.queue_handler(target)
+    assert target in log_queue.file_targets()
+    handler.close()
+    assert target.stream is None
+    assert target not in log_queue.file_targets()
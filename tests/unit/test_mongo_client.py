@@ -0,0 +1,47 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+from app import circuit_breaker
+from app.mongo_client import BreakerCollection
+
+
+class FlakyCollection():
+    """
+    A collection whose cursors lose the connection after one document.
+    """
+
+    def find(self, *args, **kwargs):
+        yield {"directory_id": "one"}
+        raise AutoReconnect("connection lost")
+
+    def find_one(self, *args, **kwargs):
+        return {"directory_id": "one"}
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setenv("BREAKER_FAILURE_THRESHOLD", "1")
+
+
+def test_find_reads_the_cursor_inside_the_breaker():
+    collection = BreakerCollection(FlakyCollection())
+    with pytest.raises(AutoReconnect):
+        collection.find({})
+    state = circuit_breaker.breaker_states()["Mongo"]
+    assert state["state"] == "open"
+    assert state["failures"] == 1
+
+
+def test_find_returns_a_list():
+    class Collection():
+        def find(self, *args, **kwargs):
+            return iter([{"n": 1}, {"n": 2}])
+
+    assert BreakerCollection(Collection()).find({}) == [{"n": 1}, {"n": 2}]
+    assert circuit_breaker.breaker_states()["Mongo"]["state"] == "closed"
+
+
+def test_other_methods_are_returned_as_they_are():
+    collection = BreakerCollection(FlakyCollection())
+    assert collection.find_one({}) == {"directory_id": "one"}
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+from flask import Flask
+
+from app import resources, suites
+from app.history_store import HistoryStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = HistoryStore(path=str(tmp_path / "history.sqlite3"))
+    now = time.time()
+    for n in range(3):
+        store.record("etd_basic", {"num_failed": 0, "tests_failed": [],
+                                   "info": {}}, {}, now - n, now - n + 1)
+    monkeypatch.setattr(suites, "history_store", store)
+    monkeypatch.setattr(resources, "history_store", store)
+    app = Flask(__name__)
+    resources.define_resources(app)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("limit, runs", [("2", 2), ("10", 3), ("0", 1),
+                                         ("-1", 1)])
+def test_history_limit_is_clamped(client, limit, runs):
+    response = client.get(f"/history?limit={limit}")
+    assert response.status_code == 200
+    assert len(response.get_json()["runs"]) == runs
+
+
+def test_history_limit_must_be_a_number(client):
+    assert client.get("/history?limit=all").status_code == 400
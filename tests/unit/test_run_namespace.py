@@ -0,0 +1,46 @@
+import pytest
+
+from app.run_namespace import RunNamespace, is_reserved_identifier, \
+    new_run_id
+
+
+def test_run_ids_are_reserved(monkeypatch):
+    monkeypatch.delenv("RUN_ID_PREFIX", raising=False)
+    for _ in range(100):
+        run_id = new_run_id()
+        assert len(run_id) == 10 and run_id.startswith("99")
+        assert is_reserved_identifier(run_id)
+
+
+def test_prefix_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RUN_ID_PREFIX", "987")
+    run_id = new_run_id()
+    assert len(run_id) == 10 and run_id.startswith("987")
+    assert not is_reserved_identifier("9912345678")
+
+
+def test_submission_names_are_reserved(monkeypatch):
+    monkeypatch.delenv("RUN_ID_PREFIX", raising=False)
+    namespace = RunNamespace()
+    assert is_reserved_identifier(namespace.base_name())
+    assert is_reserved_identifier(namespace.dash_identifier)
+
+
+@pytest.mark.parametrize("identifier", [
+    "1234567890", "991234567", "9912345678901", "99123456ab", "", None])
+def test_other_identifiers_are_not_reserved(monkeypatch, identifier):
+    monkeypatch.delenv("RUN_ID_PREFIX", raising=False)
+    assert not is_reserved_identifier(identifier)
+
+
+def test_run_id_outside_the_range_is_refused(monkeypatch):
+    monkeypatch.delenv("RUN_ID_PREFIX", raising=False)
+    with pytest.raises(ValueError):
+        RunNamespace(run_id="1234567890")
+
+
+@pytest.mark.parametrize("prefix", ["", "9x", "123456"])
+def test_bad_prefix_is_refused(monkeypatch, prefix):
+    monkeypatch.setenv("RUN_ID_PREFIX", prefix)
+    with pytest.raises(ValueError):
+        new_run_id()
@@ -0,0 +1,93 @@
+import socket
+
+import pytest
+
+from app import circuit_breaker, sftp_pool
+from app.sftp_pool import SFTPSessionPool
+
+
+class Connection():
+    """
+    A pysftp.Connection with a transport that stays up.
+    """
+
+    opened = []
+
+    def __init__(self, **kwargs):
+        self.closed = False
+        self.sftp_client = self
+        self.timeout = None
+        Connection.opened.append(self)
+
+    def get_channel(self):
+        return self
+
+    def get_transport(self):
+        return self
+
+    def is_active(self):
+        return not self.closed
+
+    def chdir(self, path):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(sftp_pool.pysftp, "Connection", Connection)
+    Connection.opened = []
+    return SFTPSessionPool(max_per_host=2)
+
+
+def session(pool):
+    return pool.session("dropbox:22", "etd", "/keys/id_rsa")
+
+
+def test_sessions_are_reused(pool):
+    with session(pool) as first:
+        pass
+    with session(pool) as second:
+        pass
+    assert first is second
+    assert pool.stats["created"] == 1
+
+
+def test_other_errors_return_the_session(pool):
+    with pytest.raises(FileNotFoundError):
+        with session(pool):
+            raise FileNotFoundError("incoming/gsd/missing.zip")
+    with session(pool):
+        pass
+    assert pool.stats["created"] == 1
+
+
+def test_transport_error_closes_the_session(pool):
+    with pytest.raises(socket.timeout):
+        with session(pool) as timed_out:
+            raise socket.timeout("timed out")
+    assert timed_out.closed
+    with session(pool) as fresh:
+        pass
+    assert fresh is not timed_out
+    assert pool.stats["created"] == 2
+    state = circuit_breaker.breaker_states()["SFTP dropbox:22"]
+    assert state["consecutive_failures"] == 0
+    assert state["failures"] == 1
+
+
+def test_closed_sessions_free_their_slot(pool):
+    for _ in range(3):
+        with pytest.raises(EOFError):
+            with session(pool):
+                raise EOFError()
+    # with max_per_host=2, a leaked slot would make this wait
+    pool.checkout_timeout = 0.1
+    with session(pool):
+        pass
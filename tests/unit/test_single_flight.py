@@ -0,0 +1,121 @@
+import time
+import threading
+
+import pytest
+
+from app.deadline import current_deadline
+from app.single_flight import SingleFlight
+
+
+def passed(label="ok"):
+    return {"num_failed": 0, "tests_failed": [], "info": {"label": label}}
+
+
+@pytest.fixture
+def single_flight(tmp_path, monkeypatch):
+    monkeypatch.delenv("RUN_DEADLINE_SECS", raising=False)
+    monkeypatch.setattr(SingleFlight, "POLL_SECS", 0.05)
+    return SingleFlight(state_dir=str(tmp_path), ttl_secs=60)
+
+
+def source(result):
+    return result["info"]["Single flight"]["source"]
+
+
+class HeldRun():
+    """
+    A run that holds the lock, in a thread, until released.
+    """
+
+    def __init__(self, single_flight, suite="etd_basic", deadline_secs=None):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.result = None
+
+        def function():
+            self.started.set()
+            self.release.wait(10)
+            return passed("held")
+
+        def run():
+            self.result = single_flight.run(suite, function, deadline_secs)
+
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        assert self.started.wait(10)
+
+    def finish(self):
+        self.release.set()
+        self.thread.join(10)
+        return self.result
+
+
+def test_ran_then_cache(single_flight):
+    calls = []
+
+    def function():
+        calls.append(1)
+        return passed()
+
+    assert source(single_flight.run("etd_basic", function)) == "ran"
+    assert source(single_flight.run("etd_basic", function)) == "cache"
+    assert len(calls) == 1
+
+
+def test_expired_result_is_not_served(tmp_path, monkeypatch):
+    monkeypatch.delenv("RUN_DEADLINE_SECS", raising=False)
+    single_flight = SingleFlight(state_dir=str(tmp_path), ttl_secs=0)
+    single_flight.run("etd_basic", passed)
+    time.sleep(0.01)
+    assert source(single_flight.run("etd_basic", passed)) == "ran"
+
+
+def test_waiter_joins_the_run_in_flight(single_flight):
+    held = HeldRun(single_flight)
+    joined = {}
+    waiter = threading.Thread(target=lambda: joined.update(
+        single_flight.run("etd_basic", lambda: passed("second"))))
+    waiter.start()
+    time.sleep(0.2)
+    assert source(held.finish()) == "ran"
+    waiter.join(10)
+    assert source(joined) == "joined"
+    assert joined["info"]["label"] == "held"
+
+
+def test_waiter_gives_up_at_its_deadline(single_flight):
+    held = HeldRun(single_flight, suite="etd_load", deadline_secs=0.3)
+    start = time.monotonic()
+    result = single_flight.run("etd_load", lambda: passed("second"), 0.3)
+    elapsed = time.monotonic() - start
+    held.finish()
+    assert 0.3 <= elapsed < 2
+    assert source(result) == "gave up"
+    assert result["num_failed"] == 1
+    assert result["info"]["etd_load not run"]["status_code"] == 504
+    assert result["info"]["Deadline"]["exhausted_by"] == \
+        "waiting for etd_load"
+
+
+def test_runs_with_other_budgets_are_not_shared(single_flight):
+    assert source(single_flight.run("etd_basic", passed, 30)) == "ran"
+    assert source(single_flight.run("etd_basic", passed, 60)) == "ran"
+    result = single_flight.run("etd_basic", passed, 30)
+    assert source(result) == "cache"
+    assert result["info"]["Single flight"]["deadline_secs"] == 30
+
+
+def test_function_runs_inside_the_deadline(single_flight):
+    budgets = []
+
+    def function():
+        budgets.append(current_deadline().budget_secs)
+        return passed()
+
+    single_flight.run("etd_basic", function, 5)
+    assert budgets == [5]
+
+
+def test_unknown_suite_is_refused(single_flight):
+    with pytest.raises(KeyError):
+        single_flight.run("../etc", passed)
@@ -0,0 +1,107 @@
+import os
+import errno
+
+import pytest
+
+from app import staging
+from app.staging import stage_file
+
+DATA = os.urandom(3 * 1024 * 1024 + 17)
+
+
+@pytest.fixture
+def fixture(tmp_path):
+    path = tmp_path / "submission.zip"
+    path.write_bytes(DATA)
+    os.chmod(path, 0o640)
+    return str(path)
+
+
+@pytest.fixture
+def dest(tmp_path):
+    path = tmp_path / "incoming"
+    path.mkdir()
+    return str(path)
+
+
+def assert_staged(result, dest):
+    assert result.path == os.path.join(dest, "submission.zip")
+    assert result.bytes == len(DATA)
+    with open(result.path, "rb") as f:
+        assert f.read() == DATA
+    assert os.stat(result.path).st_mode & 0o777 == 0o640
+    # no temporary file left behind
+    assert os.listdir(dest) == ["submission.zip"]
+
+
+@pytest.mark.parametrize("strategy", ["hardlink", "copy_file_range",
+                                      "sendfile", "copy"])
+def test_each_strategy_stages_the_bytes(fixture, dest, strategy):
+    result = stage_file(fixture, dest, strategies=[strategy])
+    assert result.strategy == strategy
+    assert_staged(result, dest)
+
+
+def test_reflink_or_fallback(fixture, dest):
+    # reflinks need btrfs or XFS; elsewhere the next strategy is used
+    result = stage_file(fixture, dest, strategies=["reflink", "copy"])
+    assert result.strategy in ("reflink", "copy")
+    assert_staged(result, dest)
+
+
+@pytest.mark.parametrize("strategy, function", [
+    ("copy_file_range", "copy_file_range"), ("sendfile", "sendfile")])
+def test_short_copy_falls_through(fixture, dest, monkeypatch, strategy,
+                                  function):
+    real = getattr(os, function)
+    calls = []
+
+    def stops_early(*args):
+        # copies one chunk, then reports nothing more to copy, the way
+        # copy_file_range does across filesystems it cannot handle
+        calls.append(1)
+        if len(calls) > 1:
+            return 0
+        args = list(args)
+        count_index = 2 if function == "copy_file_range" else 3
+        args[count_index] = min(args[count_index], 4096)
+        return real(*args)
+
+    monkeypatch.setattr(staging.os, function, stops_early)
+    result = stage_file(fixture, dest, strategies=[strategy, "copy"])
+    assert result.strategy == "copy"
+    assert_staged(result, dest)
+
+
+def test_fallback_order(fixture, dest, monkeypatch):
+    tried = []
+
+    def unsupported(name):
+        def strategy(source_path, tmp_path, size):
+            tried.append(name)
+            raise OSError(errno.EXDEV, f"{name} unsupported")
+        return strategy
+
+    for name in ("reflink", "hardlink", "copy_file_range"):
+        monkeypatch.setitem(staging._STRATEGIES, name, unsupported(name))
+    result = stage_file(fixture, dest, strategies=[
+        "reflink", "hardlink", "copy_file_range", "sendfile", "copy"])
+    assert tried == ["reflink", "hardlink", "copy_file_range"]
+    assert result.strategy == "sendfile"
+    assert_staged(result, dest)
+
+
+def test_real_failures_are_raised(tmp_path, dest):
+    with pytest.raises(FileNotFoundError):
+        stage_file(str(tmp_path / "missing.zip"), dest)
+
+
+def test_no_strategy_works(fixture, dest, monkeypatch):
+    def unavailable(source_path, tmp_path, size):
+        raise OSError(errno.ENOSYS, "copy unavailable")
+
+    monkeypatch.setitem(staging._STRATEGIES, "copy", unavailable)
+    with pytest.raises(OSError) as err:
+        stage_file(fixture, dest, strategies=["copy"])
+    assert err.value.errno == errno.EOPNOTSUPP
+    assert os.listdir(dest) == []
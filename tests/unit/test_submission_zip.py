@@ -0,0 +1,191 @@
+import io
+import os
+import errno
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from app import submission_zip
+from app.submission_zip import rewrite_pq_id, METS_NAME, PQ_ID_XPATH, \
+    DIM_NAMESPACES
+from app.standins.fixtures import METS_TEMPLATE
+
+OLD_PQ_ID = "PQ-00000001"
+NEW_PQ_ID = "PQ-99999999"
+# big enough for copy_file_range to take more than one chunk below
+SUPPLEMENT = os.urandom(64 * 1024)
+
+
+class Unseekable(io.RawIOBase):
+    """
+    A write-only stream without tell(), so zipfile writes data
+    descriptors after each member.
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def members():
+    return [(METS_NAME, METS_TEMPLATE.format(pq_id=OLD_PQ_ID).encode(),
+             zipfile.ZIP_DEFLATED),
+            ("thesis.pdf", b"%PDF-1.4\n% thesis\n%%EOF\n" * 100,
+             zipfile.ZIP_DEFLATED),
+            ("supplement.bin", SUPPLEMENT, zipfile.ZIP_STORED)]
+
+
+def write_zip(path, data_descriptors=False, prefix=b""):
+    out = Unseekable() if data_descriptors else io.BytesIO()
+    with zipfile.ZipFile(out, "w") as zf:
+        for name, data, method in members():
+            zf.writestr(name, data, compress_type=method)
+    raw = out.buffer.getvalue() if data_descriptors else out.getvalue()
+    with open(path, "wb") as f:
+        f.write(prefix + raw)
+    return path
+
+
+def pq_id(path):
+    with zipfile.ZipFile(path) as zf:
+        root = ET.fromstring(zf.read(METS_NAME))
+    return root.find(PQ_ID_XPATH, DIM_NAMESPACES).text
+
+
+def assert_rewritten(path):
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [name for name, _, _ in members()]
+        for name, data, method in members()[1:]:
+            assert zf.read(name) == data
+            assert zf.getinfo(name).compress_type == method
+    assert pq_id(path) == NEW_PQ_ID
+
+
+@pytest.fixture
+def in_memory_calls(monkeypatch):
+    calls = []
+    rewrite = submission_zip._rewrite_in_memory
+
+    def spy(*args):
+        calls.append(args)
+        return rewrite(*args)
+
+    monkeypatch.setattr(submission_zip, "_rewrite_in_memory", spy)
+    return calls
+
+
+def test_rewrites_pq_id_and_copies_other_members(tmp_path, in_memory_calls):
+    source = write_zip(tmp_path / "submission.zip")
+    dest = tmp_path / "rewritten.zip"
+    rewrite_pq_id(source, dest, NEW_PQ_ID)
+    assert_rewritten(dest)
+    assert pq_id(source) == OLD_PQ_ID
+    assert in_memory_calls == []
+
+
+def test_rewrites_in_place(tmp_path):
+    source = write_zip(tmp_path / "submission.zip")
+    rewrite_pq_id(source, source, NEW_PQ_ID)
+    assert_rewritten(source)
+    assert [p.name for p in tmp_path.iterdir()] == ["submission.zip"]
+
+
+def test_members_with_data_descriptors(tmp_path, in_memory_calls):
+    source = write_zip(tmp_path / "submission.zip", data_descriptors=True)
+    with zipfile.ZipFile(source) as zf:
+        assert all(info.flag_bits & submission_zip.FLAG_DATA_DESCRIPTOR
+                   for info in zf.infolist())
+    dest = tmp_path / "rewritten.zip"
+    rewrite_pq_id(source, dest, NEW_PQ_ID)
+    assert_rewritten(dest)
+    assert in_memory_calls == []
+
+
+def test_central_directory_points_at_new_offsets(tmp_path):
+    source = write_zip(tmp_path / "submission.zip")
+    dest = tmp_path / "rewritten.zip"
+    # a longer ID grows mets.xml and shifts every later member
+    rewrite_pq_id(source, dest, NEW_PQ_ID * 20)
+    with open(source, "rb") as f, zipfile.ZipFile(f) as zf:
+        old_offsets = [info.header_offset for info in zf.infolist()]
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.testzip() is None
+        new_offsets = [info.header_offset for info in zf.infolist()]
+    assert new_offsets[0] == old_offsets[0]
+    assert new_offsets[1:] != old_offsets[1:]
+
+
+def test_prefixed_archive_falls_back(tmp_path, in_memory_calls):
+    source = write_zip(tmp_path / "submission.zip", prefix=b"#!stub\n" * 8)
+    dest = tmp_path / "rewritten.zip"
+    rewrite_pq_id(source, dest, NEW_PQ_ID)
+    assert_rewritten(dest)
+    assert len(in_memory_calls) == 1
+
+
+def test_zip64_archive_falls_back(tmp_path, monkeypatch, in_memory_calls):
+    # members over the (lowered) limit get zip64 sizes and offsets
+    with monkeypatch.context() as patch:
+        patch.setattr(zipfile, "ZIP64_LIMIT", 1024)
+        source = write_zip(tmp_path / "submission.zip")
+    dest = tmp_path / "rewritten.zip"
+    rewrite_pq_id(source, dest, NEW_PQ_ID)
+    assert_rewritten(dest)
+    assert len(in_memory_calls) == 1
+
+
+def test_missing_member(tmp_path):
+    source = write_zip(tmp_path / "submission.zip")
+    with pytest.raises(KeyError):
+        submission_zip.rewrite_member(source, tmp_path / "out.zip",
+                                      "missing.xml", lambda data: data)
+    assert not (tmp_path / "out.zip").exists()
+
+
+def flaky_copy_file_range(calls, chunk=4096):
+    """
+    A copy_file_range that copies at most one chunk per call, moving the
+    destination on as the real one does, and fails on the call after a
+    partial copy.
+    """
+    def copy_file_range(src_fd, dst_fd, count, offset_src=None,
+                        offset_dst=None):
+        if calls and calls[-1] == "partial":
+            calls.append("failed")
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        calls.append("partial" if count > chunk else "whole")
+        return os.write(dst_fd, os.pread(src_fd, min(count, chunk),
+                                         offset_src))
+    return copy_file_range
+
+
+def test_copy_range_resumes_after_partial_copy(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "copy_file_range", flaky_copy_file_range(calls),
+                        raising=False)
+    data = os.urandom(20000)
+    (tmp_path / "src").write_bytes(b"header" + data)
+    with open(tmp_path / "src", "rb", buffering=0) as src, \
+            open(tmp_path / "dst", "wb", buffering=0) as dst:
+        dst.write(b"xx")
+        submission_zip._copy_range(src, dst, 6, len(data))
+    assert calls == ["partial", "failed"]
+    assert (tmp_path / "dst").read_bytes() == b"xx" + data
+
+
+def test_rewrite_survives_copy_failing_mid_member(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "copy_file_range", flaky_copy_file_range(calls),
+                        raising=False)
+    source = write_zip(tmp_path / "submission.zip")
+    dest = tmp_path / "rewritten.zip"
+    rewrite_pq_id(source, dest, NEW_PQ_ID)
+    assert "failed" in calls
+    assert_rewritten(dest)